@@ -7,10 +7,44 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+if settings.DEBUG:
+    # Serve the static files of the browsable API like `runserver` does
+    django_application = ASGIStaticFilesHandler(django_application)
+
+# Imported once the apps are loaded
+from mower_queue.machine_channel import websocket_application  # noqa: E402
+from mower_queue.telemetry_store import telemetry_buffer  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Hand the WebSocket connections over to the machine channels and the
+    rest to Django, flushing the telemetry buffer on shutdown
+    """
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    return await django_application(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    """Write the buffered telemetry before the server shuts down"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(telemetry_buffer.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "mower_queue.middleware.MetricsMiddleware",
+    "mower_queue.middleware.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -89,6 +91,90 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Cache holding the last telemetry state handled for each machine, identical
+# heartbeats are answered without touching the database
+TELEMETRY_CACHE_ALIAS = "default"
+TELEMETRY_CACHE_TIMEOUT = 30
+
+# Telemetry history, written in bulk by a background thread once
+# TELEMETRY_FLUSH_SIZE updates are waiting or every TELEMETRY_FLUSH_INTERVAL
+# seconds. Updates received while TELEMETRY_BUFFER_MAX_RECORDS are waiting are
+# dropped. Daily partitions older than TELEMETRY_RETENTION_DAYS are dropped by
+# the `manage_partitions` management command.
+TELEMETRY_FLUSH_SIZE = 1000
+TELEMETRY_FLUSH_INTERVAL = 0.5
+TELEMETRY_BUFFER_MAX_RECORDS = 100000
+TELEMETRY_RETENTION_DAYS = 30
+
+# Months of queue items kept besides the current one. Monthly partitions of the
+# items past this retention are dropped by `manage_partitions` unless they hold
+# items of unfinished queues, then the finished queues left empty are deleted.
+QUEUE_RETENTION_MONTHS = 12
+
+# Queue event streams, subscribers falling further behind are disconnected and
+# a comment is sent on idle streams to keep the connection open
+EVENTS_MAX_QUEUED = 100
+EVENTS_KEEPALIVE_INTERVAL = 15
+
+# Requests running more queries, or spending more seconds in SQL, are logged
+# with their slowest query by the mower_queue.middleware logger
+SLOW_REQUEST_QUERIES = 50
+SLOW_REQUEST_SQL_TIME = 0.5
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "mower_queue": {
+            "handlers": ["console"],
+            "level": os.environ.get("MOWER_QUEUE_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
+
+# Machine commands
+# Commands are written to an outbox and delivered by the `dispatch_commands`
+# management command
+
+# Default endpoint for machines without their own `command_url`
+MACHINE_COMMAND_URL = os.environ.get(
+    "MACHINE_COMMAND_URL", "http://machine-simulator:5001/command"
+)
+MACHINE_COMMAND_CONNECT_TIMEOUT = 2
+MACHINE_COMMAND_READ_TIMEOUT = 5
+# Idle keep-alive connections kept open per machine endpoint
+MACHINE_COMMAND_POOL_SIZE = 4
+# Seconds before the first retry, doubled on every further attempt
+MACHINE_COMMAND_RETRY_DELAY = 1
+MACHINE_COMMAND_MAX_RETRY_DELAY = 60
+# Seconds after which a machine channel that was not refreshed is considered
+# gone and its commands are delivered over HTTP again
+MACHINE_CHANNEL_TIMEOUT = 30
+# Delivery attempts before a command is marked as failed
+MACHINE_COMMAND_MAX_ATTEMPTS = 10
+# The commands of the bulk queue control are delivered within the request, to
+# this many machines at once. Deliveries still running after the timeout, in
+# seconds, are left to `dispatch_commands`.
+BULK_CONTROL_CONCURRENCY = 100
+BULK_CONTROL_DELIVERY_TIMEOUT = 10
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -131,3 +217,12 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# JSON is encoded with orjson, to the same bytes as the default JSON renderer
+# of DRF. Put "rest_framework.renderers.JSONRenderer" first to switch back.
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "mower_queue.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
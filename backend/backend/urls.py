@@ -18,7 +18,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from mower_queue.views import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("mower_queue.urls")),
+    path("api/v1/async/", include("mower_queue.async_urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class MowerQueueConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mower_queue"
+
+    def ready(self):
+        from .query_stats import install
+
+        connection_created.connect(install)
@@ -0,0 +1,40 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/start",
+        async_views.queue_start,
+        name="async-queue-start",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/pause",
+        async_views.queue_pause,
+        name="async-queue-pause",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/resume",
+        async_views.queue_resume,
+        name="async-queue-resume",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/terminate",
+        async_views.queue_terminate,
+        name="async-queue-terminate",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/skip",
+        async_views.queue_skip,
+        name="async-queue-skip",
+    ),
+    path(
+        "machines/<uuid:machine_id>/incoming_machine_telem",
+        async_views.incoming_machine_telem,
+        name="async-incoming-machine-state",
+    ),
+    path(
+        "queues/control",
+        async_views.queues_control,
+        name="async-queues-control",
+    ),
+]
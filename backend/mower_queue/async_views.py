@@ -0,0 +1,236 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from .dispatcher import deliver_now
+from .events import hub
+from .metrics import telemetry_received
+from .models import FieldQueue
+from .renderers import render_json
+from .telemetry_cache import aremember_telem, aseen_telem
+from .telemetry_store import store_telemetry
+from .views import (
+    active_queue_conflict,
+    applied_preferences,
+    bulk_control_result,
+    control_queues,
+    parse_bulk_control,
+    pause_queue,
+    progress_machine_queue,
+    requested_fields,
+    resume_queue,
+    skip_queue_field,
+    start_queue,
+    telem_requires_progression,
+    terminate_queue,
+    validate_progression,
+)
+
+# Async counterparts of the machine facing and queue control views. Lookups use
+# the async ORM, while the transactional queue changes, which Django can only
+# run synchronously, are handed over to a worker thread.
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    """Render data the same way as the DRF views do"""
+    return HttpResponse(
+        render_json(data),
+        status=status,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+async def get_queue(machine_id, queue_id):
+    try:
+        return await FieldQueue.objects.aget(id=queue_id, machine_id=machine_id)
+    except FieldQueue.DoesNotExist:
+        return None
+
+
+def queue_not_found(machine_id, queue_id):
+    return json_response(
+        {
+            "message": f"Queue {queue_id} does not exist on machine {machine_id}.",
+        },
+        status=status.HTTP_404_NOT_FOUND,
+    )
+
+
+@csrf_exempt
+@require_POST
+async def incoming_machine_telem(request, machine_id):
+    """Handle state update from machine"""
+    try:
+        telem = json.loads(request.body or b"{}")
+    except ValueError:
+        return json_response(
+            {"message": "Malformed JSON"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if isinstance(telem, dict):
+        store_telemetry(machine_id, telem)
+    if not isinstance(telem, dict) or not telem_requires_progression(telem):
+        # No action required
+        telemetry_received.labels("http", "ignored").inc()
+        return json_response({"message": "No action required"})
+
+    try:
+        validate_progression(telem)
+    except ValidationError as e:
+        telemetry_received.labels("http", "invalid").inc()
+        return json_response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if await aseen_telem({machine_id: telem}):
+        # Nothing changed since the previous heartbeat was handled
+        telemetry_received.labels("http", "duplicate").inc()
+        return json_response({"message": "No action required"})
+
+    current_queue_id = telem.get("current_queue")
+    if not (queue := await get_queue(machine_id, current_queue_id)):
+        telemetry_received.labels("http", "not_found").inc()
+        return queue_not_found(machine_id, current_queue_id)
+
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return json_response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    telemetry_received.labels("http", "progressed").inc()
+    data = await sync_to_async(progress_machine_queue)(machine_id, queue, telem, fields)
+    await aremember_telem({machine_id: telem})
+    return json_response(data, headers=applied_preferences(request))
+
+
+async def control_queue(action, request, machine_id, queue_id):
+    if not (queue := await get_queue(machine_id, queue_id)):
+        return queue_not_found(machine_id, queue_id)
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return json_response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    data, status_code = await sync_to_async(action)(queue, fields)
+    return json_response(data, status=status_code, headers=applied_preferences(request))
+
+
+@csrf_exempt
+@require_POST
+async def queue_start(request, machine_id, queue_id):
+    """Start queue"""
+    return await control_queue(start_queue, request, machine_id, queue_id)
+
+
+@csrf_exempt
+@require_POST
+async def queue_pause(request, machine_id, queue_id):
+    """Pause queue"""
+    return await control_queue(pause_queue, request, machine_id, queue_id)
+
+
+@csrf_exempt
+@require_POST
+async def queue_resume(request, machine_id, queue_id):
+    """Resume queue"""
+    return await control_queue(resume_queue, request, machine_id, queue_id)
+
+
+@csrf_exempt
+@require_POST
+async def queue_terminate(request, machine_id, queue_id):
+    """Terminate queue"""
+    return await control_queue(terminate_queue, request, machine_id, queue_id)
+
+
+@csrf_exempt
+@require_POST
+async def queue_skip(request, machine_id, queue_id):
+    """Skip current field"""
+    return await control_queue(skip_queue_field, request, machine_id, queue_id)
+
+
+@csrf_exempt
+@require_POST
+async def queues_control(request):
+    """Pause, resume or terminate many queues at once"""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return json_response(
+            {"message": "Malformed JSON"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        action, queues = parse_bulk_control(data)
+    except ValidationError as e:
+        return json_response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        changed, commands, direct = await sync_to_async(control_queues)(action, queues)
+    except IntegrityError:
+        data, status_code = active_queue_conflict()
+        return json_response(data, status=status_code)
+    await deliver_now(direct)
+    return json_response(bulk_control_result(action, changed, commands))
+
+
+@require_GET
+async def queue_events(request, machine_id, queue_id):
+    """Stream the changes of a queue as Server-Sent Events"""
+    # Subscribe before reading the queue so no change falls in between
+    subscription = hub.subscribe(str(queue_id))
+    if not (queue := await get_queue(machine_id, queue_id)):
+        hub.unsubscribe(subscription)
+        return queue_not_found(machine_id, queue_id)
+
+    snapshot = json.dumps(await sync_to_async(queue.serialize)(), cls=JSONEncoder)
+    response = StreamingHttpResponse(
+        stream_events(subscription, snapshot),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Keep reverse proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def stream_events(subscription, snapshot):
+    """Current state of the queue followed by its changes as they happen"""
+    try:
+        yield f"event: snapshot\ndata: {snapshot}\n\n"
+        while True:
+            try:
+                message = await subscription.get(settings.EVENTS_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if message is None:
+                # Too far behind, the client reconnects and gets a new snapshot
+                break
+            event, data = message
+            yield f"event: {event}\ndata: {data}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+import httpx
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .metrics import command_deliveries, command_delivery_duration
+from .models import MachineCommand
+from .transport import CommandTransport
+
+logger = logging.getLogger(__name__)
+
+
+class CommandFailed(Exception):
+    """The machine could not handle the command, it can be retried"""
+
+
+class CommandRejected(CommandFailed):
+    """The machine refused the command, retrying it will not help"""
+
+
+def create_transport():
+    """Command transport configured from the settings"""
+    return CommandTransport(
+        connect_timeout=settings.MACHINE_COMMAND_CONNECT_TIMEOUT,
+        read_timeout=settings.MACHINE_COMMAND_READ_TIMEOUT,
+        pool_size=settings.MACHINE_COMMAND_POOL_SIZE,
+    )
+
+
+async def due_commands(limit=500):
+    """Pending commands of every machine whose oldest pending command is due
+
+    Commands are returned in delivery order. A machine whose oldest pending
+    command is still backing off is left out entirely, so commands are never
+    delivered out of order. Machines connected over their channel receive
+    their commands from it and are left out as well.
+    """
+    oldest = (
+        MachineCommand.objects.filter(machine=OuterRef("machine"), status="pending")
+        .order_by("id")
+        .values("next_attempt_at")[:1]
+    )
+    return [
+        command
+        async for command in MachineCommand.objects.filter(status="pending")
+        .annotate(oldest_attempt_at=Subquery(oldest))
+        .filter(oldest_attempt_at__lte=timezone.now())
+        .exclude(
+            machine__channel_seen_at__gte=timezone.now()
+            - timedelta(seconds=settings.MACHINE_CHANNEL_TIMEOUT)
+        )
+        .select_related("machine")
+        .order_by("machine_id", "id")[:limit]
+    ]
+
+
+async def deliver(transport, command):
+    """Send command to machine"""
+    status, _ = await transport.post_json(
+        command.machine.get_command_url(),
+        command.payload(),
+    )
+    if 400 <= status < 500:
+        raise CommandRejected(f"HTTP Error {status}")
+    if status >= 500:
+        raise CommandFailed(f"HTTP Error {status}")
+
+
+def backoff(attempts):
+    """Delay before the next delivery attempt"""
+    return timedelta(
+        seconds=min(
+            settings.MACHINE_COMMAND_RETRY_DELAY * 2 ** (attempts - 1),
+            settings.MACHINE_COMMAND_MAX_RETRY_DELAY,
+        )
+    )
+
+
+async def dispatch_machine_commands(transport, commands, max_attempts):
+    """Deliver the pending commands of a single machine in order
+
+    Delivery stops at the first failure so later commands wait for the failed
+    one to be retried.
+    """
+    delivered = failed = 0
+    for command in commands:
+        command.attempts += 1
+        try:
+            with command_delivery_duration.labels("http").time():
+                await deliver(transport, command)
+        except (CommandFailed, httpx.HTTPError, httpx.InvalidURL) as e:
+            command.last_error = str(e) or type(e).__name__
+            if isinstance(e, CommandRejected) or command.attempts >= max_attempts:
+                command.status = "failed"
+                failed += 1
+                command_deliveries.labels("http", "failed").inc()
+                print(
+                    f"[Unable to send machine command] Giving up on command"
+                    f" {command.id} for machine {command.machine_id}:"
+                    f" {command.last_error}"
+                )
+            else:
+                command.next_attempt_at = timezone.now() + backoff(command.attempts)
+                command_deliveries.labels("http", "retried").inc()
+            await command.asave(
+                update_fields=["attempts", "status", "last_error", "next_attempt_at"]
+            )
+            break
+
+        command.status = "delivered"
+        command.delivered_at = timezone.now()
+        await command.asave(update_fields=["attempts", "status", "delivered_at"])
+        delivered += 1
+        command_deliveries.labels("http", "delivered").inc()
+    return delivered, failed
+
+
+async def dispatch_commands(
+    transport, commands, max_attempts, concurrency, timeout=None
+):
+    """Deliver commands ordered by machine, machines are handled concurrently
+
+    Machines still being delivered to after timeout seconds are given up on,
+    their remaining commands are left in the outbox. An unexpected error while
+    delivering to a machine is logged and leaves its commands in the outbox,
+    the other machines are still delivered to.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def dispatch(commands):
+        async with semaphore:
+            return await dispatch_machine_commands(transport, commands, max_attempts)
+
+    tasks = [
+        asyncio.ensure_future(dispatch(list(commands)))
+        for _, commands in groupby(commands, key=lambda x: x.machine_id)
+    ]
+    if not tasks:
+        return 0, 0
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    delivered = failed = 0
+    for task in done:
+        try:
+            machine_delivered, machine_failed = task.result()
+        except Exception:
+            logger.exception("Delivering the commands of a machine failed")
+            continue
+        delivered += machine_delivered
+        failed += machine_failed
+    return delivered, failed
+
+
+async def dispatch_due_commands(transport, max_attempts, concurrency, limit=500):
+    """Deliver due commands concurrently, machines are handled independently"""
+    return await dispatch_commands(
+        transport, await due_commands(limit), max_attempts, concurrency
+    )
+
+
+async def deliver_now(commands):
+    """Deliver freshly queued commands within the request that queued them
+
+    Commands must be ordered by machine and held back from the dispatcher
+    until the deliveries are over, see `BULK_CONTROL_DELIVERY_TIMEOUT`.
+    """
+    transport = create_transport()
+    try:
+        return await dispatch_commands(
+            transport,
+            commands,
+            max_attempts=settings.MACHINE_COMMAND_MAX_ATTEMPTS,
+            concurrency=settings.BULK_CONTROL_CONCURRENCY,
+            timeout=settings.BULK_CONTROL_DELIVERY_TIMEOUT,
+        )
+    finally:
+        await transport.close()
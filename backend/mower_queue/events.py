@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Subscription:
+    """Events of a topic waiting to be read by a single subscriber
+
+    A subscriber that falls more than `max_queued` events behind is closed
+    rather than slowing down the publishers, it is expected to reconnect and
+    fetch the current state again.
+    """
+
+    def __init__(self, hub, topic, max_queued):
+        self.hub = hub
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queued)
+        self.closed = False
+
+    def put(self, message):
+        """Queue message, must be called from the loop of the subscriber"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """Next message, None once the subscription is closed
+
+        Raises TimeoutError when no message was published within timeout.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventHub:
+    """In-process publish/subscribe hub
+
+    Events are published from any thread, usually by the synchronous model
+    methods, and handed to the event loop of every subscriber of the topic.
+    Each event is encoded once whatever the number of subscribers.
+    """
+
+    def __init__(self, max_queued=100):
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic, self.max_queued)
+        with self._lock:
+            self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.topic, None)
+
+    def has_subscribers(self, topic):
+        return bool(self._subscriptions.get(topic))
+
+    def publish(self, topic, event, data):
+        """Send event to the subscribers of topic, data may be a callable
+
+        A callable is only evaluated when the topic has subscribers.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        if not subscriptions:
+            return
+
+        message = (
+            event,
+            json.dumps(data() if callable(data) else data, cls=JSONEncoder),
+        )
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # The loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+
+hub = EventHub(settings.EVENTS_MAX_QUEUED)
+
+
+def machine_topic(machine_id):
+    """Topic of the commands sent to a machine"""
+    return f"machine:{machine_id}"
+
+
+def publish_on_commit(topic, event, data):
+    """Publish event once the current transaction is committed"""
+    topic = str(topic)
+    if hub.has_subscribers(topic):
+        transaction.on_commit(lambda: hub.publish(topic, event, data))
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .async_views import get_queue
+from .events import hub, machine_topic
+from .metrics import command_deliveries, command_delivery_duration, telemetry_received
+from .models import Machine, MachineCommand
+from .telemetry_cache import aremember_telem, aseen_telem
+from .telemetry_store import store_telemetry
+from .views import (
+    progress_machine_queue,
+    telem_requires_progression,
+    validate_progression,
+)
+
+# Machines send their telemetry up and receive their commands down a single
+# WebSocket connection. Messages are JSON objects with a `type`:
+#   machine -> backend: {"type": "telemetry", "state": ..., "current_queue": ...}
+#   backend -> machine: {"type": "command", "command": ..., "field_id": ...}
+#                       {"type": "error", "message": ...}
+
+CHANNEL_PATH = re.compile(
+    r"^/api/v1/machines/(?P<machine_id>[0-9a-fA-F-]{32,36})/channel/?$"
+)
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI application handling the WebSocket connections"""
+    if match := CHANNEL_PATH.match(scope["path"]):
+        try:
+            machine = await Machine.objects.aget(id=match["machine_id"])
+        except (Machine.DoesNotExist, ValidationError):
+            machine = None
+        if machine:
+            return await MachineChannel(machine.id, send).run(receive)
+
+    if (await receive())["type"] == "websocket.connect":
+        await send({"type": "websocket.close", "code": 4404})
+
+
+class MachineChannel:
+    """WebSocket connection of a single machine
+
+    Commands are claimed from the outbox and sent as soon as they are queued.
+    While the channel is refreshed, the dispatcher leaves the machine to it.
+    """
+
+    def __init__(self, machine_id, send):
+        self.machine_id = machine_id
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.seen_at = None
+        self.subscription = None
+
+    async def run(self, receive):
+        if (await receive())["type"] != "websocket.connect":
+            return
+
+        self.subscription = hub.subscribe(machine_topic(self.machine_id))
+        await self._send({"type": "websocket.accept"})
+        print(f"Machine {self.machine_id} connected")
+
+        writer = asyncio.create_task(self.deliver_commands())
+        try:
+            await self.read_telemetry(receive)
+        finally:
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            hub.unsubscribe(self.subscription)
+            # Leave the flag alone if a newer connection of the machine took over
+            await Machine.objects.filter(
+                id=self.machine_id, channel_seen_at=self.seen_at
+            ).aupdate(channel_seen_at=None)
+            print(f"Machine {self.machine_id} disconnected")
+
+    async def send_json(self, data):
+        async with self._send_lock:
+            await self._send(
+                {"type": "websocket.send", "text": json.dumps(data, cls=JSONEncoder)}
+            )
+
+    async def read_telemetry(self, receive):
+        while (message := await receive())["type"] != "websocket.disconnect":
+            try:
+                data = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError:
+                data = None
+
+            if not isinstance(data, dict) or data.get("type") != "telemetry":
+                await self.send_json({"type": "error", "message": "Malformed message"})
+                continue
+            await self.handle_telemetry(data)
+
+    async def handle_telemetry(self, telem):
+        """Handle state update from machine, same as incoming_machine_telem"""
+        store_telemetry(self.machine_id, telem)
+        if not telem_requires_progression(telem):
+            telemetry_received.labels("channel", "ignored").inc()
+            return
+        try:
+            validate_progression(telem)
+        except ValidationError as e:
+            telemetry_received.labels("channel", "invalid").inc()
+            await self.send_json({"type": "error", "message": e.message})
+            return
+        if await aseen_telem({self.machine_id: telem}):
+            telemetry_received.labels("channel", "duplicate").inc()
+            return
+
+        current_queue_id = telem.get("current_queue")
+        if not (queue := await get_queue(self.machine_id, current_queue_id)):
+            telemetry_received.labels("channel", "not_found").inc()
+            await self.send_json(
+                {
+                    "type": "error",
+                    "message": (
+                        f"Queue {current_queue_id} does not exist on machine"
+                        f" {self.machine_id}."
+                    ),
+                }
+            )
+            return
+
+        # The resulting command reaches deliver_commands through the hub
+        telemetry_received.labels("channel", "progressed").inc()
+        await sync_to_async(progress_machine_queue)(self.machine_id, queue, telem)
+        await aremember_telem({self.machine_id: telem})
+
+    async def deliver_commands(self):
+        """Send the pending commands, then every command as soon as it is queued
+
+        The outbox is also swept regularly for commands queued by another
+        process, which the hub does not see.
+        """
+        refresh = settings.MACHINE_CHANNEL_TIMEOUT / 3
+        while True:
+            if (
+                self.seen_at is None
+                or (timezone.now() - self.seen_at).total_seconds() >= refresh
+            ):
+                await self.refresh()
+            await self.send_pending_commands()
+            try:
+                message = await self.subscription.get(refresh)
+            except asyncio.TimeoutError:
+                continue
+
+            if message is None:
+                # Too many notifications piled up, the outbox is swept anyway
+                hub.unsubscribe(self.subscription)
+                self.subscription = hub.subscribe(machine_topic(self.machine_id))
+
+    async def refresh(self):
+        self.seen_at = timezone.now()
+        await Machine.objects.filter(id=self.machine_id).aupdate(
+            channel_seen_at=self.seen_at
+        )
+
+    async def send_pending_commands(self):
+        commands = [
+            command
+            async for command in MachineCommand.objects.filter(
+                machine_id=self.machine_id, status="pending"
+            ).order_by("id")
+        ]
+        for command in commands:
+            # A closing channel must not interrupt a claimed command before it
+            # is either sent or given back to the outbox
+            await asyncio.shield(self.send_command(command))
+
+    async def send_command(self, command):
+        # Claim the command so it is never sent twice
+        if not await MachineCommand.objects.filter(
+            id=command.id, status="pending"
+        ).aupdate(
+            status="delivered",
+            attempts=F("attempts") + 1,
+            delivered_at=timezone.now(),
+        ):
+            return
+
+        try:
+            with command_delivery_duration.labels("channel").time():
+                await self.send_json({"type": "command", **command.payload()})
+        except Exception:
+            command_deliveries.labels("channel", "retried").inc()
+            await MachineCommand.objects.filter(id=command.id).aupdate(
+                status="pending", delivered_at=None
+            )
+            raise
+        command_deliveries.labels("channel", "delivered").inc()
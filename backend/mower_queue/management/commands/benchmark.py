@@ -0,0 +1,476 @@
+import itertools
+import json
+import math
+import os
+import platform
+import queue
+import random
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import redirect_stdout
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from ...models import Machine, FieldQueue, FieldQueueItem
+from ...query_stats import record_queries
+
+# Items of each queue created for the stateful scenarios, a queue may only have
+# 10 queued items
+QUEUE_SIZE = 10
+
+SCENARIOS = [
+    "incoming_machine_telem",
+    "queue_view",
+    "add_item",
+    "remove_items",
+    "next_item",
+    "skip",
+]
+
+
+class Command(BaseCommand):
+    """Command benchmarking the hot paths of the API"""
+
+    help = (
+        "Drives the telemetry, queue listing and queue item endpoints against the"
+        " configured database and reports their throughput, latency percentiles"
+        " and database queries and time per request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Scenarios to run among {', '.join(SCENARIOS)}, all by default",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Number of requests sent per scenario",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Number of requests in flight at once",
+        )
+        parser.add_argument(
+            "--machines",
+            type=int,
+            default=100,
+            help="Number of machines the telemetry and queue listings come from",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            help="File receiving the results as JSON",
+        )
+        parser.add_argument(
+            "--compare",
+            help="Results of a previous run (JSON) to compare this run with",
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help=(
+                "Fail when the p95 latency of a scenario grew, or its throughput"
+                " dropped, by more than this percentage compared to --compare"
+            ),
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the benchmark machines instead of deleting them",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        if unknown := set(options["scenarios"]) - set(SCENARIOS):
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["max_regression"] is not None and not options["compare"]:
+            raise CommandError("--max-regression requires --compare.")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        random.seed(options["seed"])
+        benchmark = Benchmark(options["concurrency"])
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "started_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "machines": options["machines"],
+                "seed": options["seed"],
+            },
+            "scenarios": {},
+        }
+
+        try:
+            for name in options["scenarios"] or SCENARIOS:
+                requests = getattr(benchmark, f"prepare_{name}")(
+                    options["requests"], options["machines"]
+                )
+                result = benchmark.run(requests)
+                results["scenarios"][name] = result
+                self.report(name, result, baseline)
+        finally:
+            if not options["keep"]:
+                benchmark.cleanup()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            print(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+        if baseline and options["max_regression"] is not None:
+            if regressions := [
+                name
+                for name, result in results["scenarios"].items()
+                if max(
+                    regression(result, baseline["scenarios"].get(name)).values(),
+                    default=0,
+                )
+                > options["max_regression"]
+            ]:
+                raise CommandError(f"Performance regressions: {', '.join(regressions)}")
+
+    def report(self, name, result, baseline):
+        latency = result["latency_ms"]
+        line = (
+            f"{name}: {result['throughput']} req/s ({result['errors']} failed),"
+            f" latency p50 {latency['p50']}ms p95 {latency['p95']}ms"
+            f" p99 {latency['p99']}ms, {result['queries']['mean']} queries/request"
+            f" (max {result['queries']['max']}, {result['queries']['sql_ms']}ms of SQL)"
+        )
+        previous = baseline["scenarios"].get(name) if baseline else None
+        if previous and previous.get("requests"):
+            changes = regression(result, previous)
+            compared = []
+            if "p95" in changes:
+                compared.append(f"p95 {changes['p95']:+.1f}%")
+            if "throughput" in changes:
+                compared.append(f"throughput {-changes['throughput']:+.1f}%")
+            compared.append(
+                f"queries {result['queries']['mean'] - previous['queries']['mean']:+}"
+            )
+            line += f" | vs baseline: {', '.join(compared)}"
+        print(line)
+        if result["first_error"]:
+            print(self.style.WARNING(f"  first error: {result['first_error']}"))
+
+
+class Benchmark:
+    """Requests run by a pool of threads, each with its own client and connection
+
+    Each scenario is a list of request sequences. A sequence is sent in order
+    by a single thread, so that requests progressing the same queue never
+    race, while the sequences themselves run concurrently.
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.machine_ids = []
+
+    def create_machines(self, count, name):
+        machines = Machine.objects.bulk_create(
+            [Machine(name=f"Benchmark {name} {i}") for i in range(count)]
+        )
+        self.machine_ids += [x.id for x in machines]
+        return machines
+
+    def create_queues(self, name, count, items, started=False):
+        """Queues on machines of their own, optionally mowing their first item"""
+        with transaction.atomic():
+            queues = FieldQueue.objects.bulk_create(
+                [FieldQueue(machine=x) for x in self.create_machines(count, name)]
+            )
+            Machine.update_active_queues([x.machine_id for x in queues])
+            FieldQueueItem.insert(
+                [
+                    FieldQueueItem(
+                        queue=queue,
+                        field_id=random.randint(1, 20),
+                        rank=(i + 1) * FieldQueueItem.RANK_GAP,
+                        **(
+                            {"status": "in_progress", "started_at": timezone.now()}
+                            if started and i == 0
+                            else {}
+                        ),
+                    )
+                    for queue in queues
+                    for i in range(items)
+                ],
+                batch_size=5000,
+            )
+        return queues
+
+    def cleanup(self):
+        for i in range(0, len(self.machine_ids), 1000):
+            Machine.objects.filter(id__in=self.machine_ids[i : i + 1000]).delete()
+        self.machine_ids = []
+
+    def prepare_incoming_machine_telem(self, count, machines):
+        """Machines mowing their queue field after field
+
+        Each machine reports a few heartbeats while mowing a field, pauses and
+        resumes, then reports the field completed once idle, which moves its
+        queue on, and repeats the idle report until its next field starts. The
+        requests of a machine are sent in order by a single sequence.
+        """
+        queues = self.create_queues("telemetry", machines, QUEUE_SIZE, started=True)
+        queue_items = {x.id: [] for x in queues}
+        for item in FieldQueueItem.objects.filter(queue__in=queues).order_by("rank"):
+            queue_items[item.queue_id].append(item)
+
+        def reports(queue):
+            items = queue_items[queue.id]
+            for n in itertools.count():
+                # Once the queue is done the machine keeps reporting it idle
+                field = str(items[min(n, len(items) - 1)].id)
+                for state in ["Mowing", "Mowing", "Paused", "Mowing", "Idle", "Idle"]:
+                    mowing = state != "Idle"
+                    yield {
+                        "state": state,
+                        "current_queue": str(queue.id),
+                        "current_field": field if mowing else "",
+                        "previous_field": "" if mowing else field,
+                        "timestamp": time.time(),
+                    }
+
+        return [
+            [
+                (
+                    "post",
+                    f"/api/v1/machines/{queue.machine_id}/incoming_machine_telem",
+                    telem,
+                )
+                for telem in itertools.islice(
+                    reports(queue), count // machines + (n < count % machines)
+                )
+            ]
+            for n, queue in enumerate(queues)
+        ]
+
+    def prepare_queue_view(self, count, machines):
+        """First page of the queues of a machine"""
+        queues = self.create_queues("queue view", machines, QUEUE_SIZE)
+        return [
+            [
+                (
+                    "get",
+                    f"/api/v1/machines/{queues[i % machines].machine_id}/queues",
+                    None,
+                )
+            ]
+            for i in range(count)
+        ]
+
+    def queue_sequences(self, name, count, items, started, request):
+        """Sequences of at most QUEUE_SIZE requests, each on a queue of its own
+
+        request(queue, items, i) builds the i-th request sent to queue, whose
+        items are passed in order.
+        """
+        queues = self.create_queues(
+            name, math.ceil(count / QUEUE_SIZE), items, started=started
+        )
+        queue_items = {x.id: [] for x in queues}
+        for item in FieldQueueItem.objects.filter(queue__in=queues).order_by("rank"):
+            queue_items[item.queue_id].append(item)
+
+        return [
+            [
+                request(queue, queue_items[queue.id], i)
+                for i in range(min(QUEUE_SIZE, count - n * QUEUE_SIZE))
+            ]
+            for n, queue in enumerate(queues)
+        ]
+
+    def prepare_add_item(self, count, machines):
+        """Fields added to the top of empty queues"""
+        return self.queue_sequences(
+            "add item",
+            count,
+            0,
+            False,
+            lambda queue, items, i: (
+                "post",
+                f"{queue_path(queue)}/items",
+                {"field_id": random.randint(1, 20), "position": 0},
+            ),
+        )
+
+    def prepare_remove_items(self, count, machines):
+        """Fields removed one at a time from full queues"""
+        return self.queue_sequences(
+            "remove items",
+            count,
+            QUEUE_SIZE,
+            False,
+            lambda queue, items, i: (
+                "delete",
+                f"{queue_path(queue)}/items",
+                {"field_ids": [str(items[i].id)]},
+            ),
+        )
+
+    def prepare_next_item(self, count, machines):
+        """Idle machines reporting the field they completed"""
+        return self.queue_sequences(
+            "next item",
+            count,
+            QUEUE_SIZE,
+            True,
+            lambda queue, items, i: (
+                "post",
+                f"/api/v1/machines/{queue.machine_id}/incoming_machine_telem",
+                {
+                    "state": "idle",
+                    "current_queue": str(queue.id),
+                    "previous_field": str(items[i].id),
+                },
+            ),
+        )
+
+    def prepare_skip(self, count, machines):
+        """Fields skipped while being mowed"""
+        return self.queue_sequences(
+            "skip",
+            count,
+            QUEUE_SIZE,
+            True,
+            lambda queue, items, i: ("post", f"{queue_path(queue)}/skip", None),
+        )
+
+    def run(self, sequences):
+        """Send the request sequences and summarize the responses"""
+        pending = queue.SimpleQueue()
+        for sequence in sequences:
+            pending.put(sequence)
+        samples = []
+        lock = threading.Lock()
+
+        def work():
+            client = Client(raise_request_exception=False)
+            measured = []
+            try:
+                while True:
+                    try:
+                        sequence = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    for request in sequence:
+                        measured.append(self.send(client, *request))
+            finally:
+                connections.close_all()
+                with lock:
+                    samples.extend(measured)
+
+        threads = [threading.Thread(target=work) for _ in range(self.concurrency)]
+        # The views print every request, which would drown the report
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                started_at = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started_at
+
+        latencies = [x[0] for x in samples]
+        queries = [x[1].count for x in samples]
+        errors = [x[2] for x in samples if x[2]]
+        return {
+            "requests": len(samples),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "duration": round(elapsed, 3),
+            "throughput": round(len(samples) / elapsed, 1),
+            "latency_ms": {
+                "mean": round(statistics.fmean(latencies) * 1000, 2),
+                **dict(zip(["p50", "p95", "p99"], percentiles(latencies))),
+                "max": round(max(latencies) * 1000, 2),
+            },
+            "queries": {
+                "mean": round(statistics.fmean(queries), 2),
+                "max": max(queries),
+                "sql_ms": round(
+                    statistics.fmean(x[1].duration for x in samples) * 1000, 2
+                ),
+            },
+        }
+
+    def send(self, client, method, path, data):
+        """Send request, returns its latency, query stats and error if any"""
+        with record_queries() as queries:
+            started_at = time.perf_counter()
+            response = getattr(client, method)(
+                path,
+                **({"data": data, "content_type": "application/json"} if data else {}),
+            )
+            latency = time.perf_counter() - started_at
+
+        error = None
+        if response.status_code >= 400:
+            error = f"{method.upper()} {path}: {response.status_code} {response.content[:200]!r}"
+        return latency, queries, error
+
+
+def queue_path(queue):
+    return f"/api/v1/machines/{queue.machine_id}/queues/{queue.id}"
+
+
+def percentiles(values):
+    """p50, p95 and p99 of values in milliseconds"""
+    if len(values) < 2:
+        return [round(sum(values) * 1000, 2)] * 3
+    quantiles = statistics.quantiles(values, n=100)
+    return [round(quantiles[x - 1] * 1000, 2) for x in (50, 95, 99)]
+
+
+def regression(result, previous):
+    """Percentages by which the p95 latency grew and the throughput dropped
+
+    A metric the previous run has no positive value for, e.g. as it sent no
+    request, is left out, there is nothing to compare it with.
+    """
+    changes = {}
+    if not previous or not previous.get("requests"):
+        return changes
+    if (p95 := previous["latency_ms"]["p95"]) > 0:
+        changes["p95"] = (result["latency_ms"]["p95"] / p95 - 1) * 100
+    if (throughput := previous["throughput"]) > 0:
+        changes["throughput"] = (1 - result["throughput"] / throughput) * 100
+    return changes
+
+
+def git_commit():
+    """Commit of the benchmarked tree, if it is a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from prometheus_client import start_http_server
+
+from ...dispatcher import create_transport, dispatch_due_commands
+from ...metrics import process_registry
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between polls while the outbox cannot be read, the wait doubles
+# from the poll interval on every failed poll
+MAX_ERROR_DELAY = 30
+
+
+class Command(BaseCommand):
+    """Command delivering the machine command outbox"""
+
+    help = "Delivers queued machine commands with retries and backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1000,
+            help="Number of machines delivered to concurrently",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait between polls when the outbox is empty",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=settings.MACHINE_COMMAND_MAX_ATTEMPTS,
+            help="Delivery attempts before a command is marked as failed",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Maximum number of commands fetched per poll",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Deliver the commands currently due and exit",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve the delivery metrics of the dispatcher on this port",
+        )
+
+    def handle(self, *args, **options):
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"], registry=process_registry())
+        print(self.style.SUCCESS("Command dispatcher started."))
+        asyncio.run(self.dispatch(options))
+
+    async def dispatch(self, options):
+        transport = create_transport()
+        errors = 0
+        try:
+            while True:
+                try:
+                    delivered, failed = await dispatch_due_commands(
+                        transport,
+                        max_attempts=options["max_attempts"],
+                        concurrency=options["concurrency"],
+                        limit=options["batch_size"],
+                    )
+                except Exception:
+                    # e.g. the database is not migrated yet or is restarting,
+                    # the dispatcher keeps polling until it is back
+                    if options["once"]:
+                        raise
+                    errors += 1
+                    delay = min(options["interval"] * 2**errors, MAX_ERROR_DELAY)
+                    logger.exception(
+                        "Polling the command outbox failed, retrying in %.1fs", delay
+                    )
+                    await sync_to_async(close_old_connections)()
+                    await asyncio.sleep(delay)
+                    continue
+                errors = 0
+                if delivered or failed:
+                    print(f"Delivered {delivered} commands, {failed} failed")
+
+                if options["once"]:
+                    break
+                if not delivered:
+                    await asyncio.sleep(options["interval"])
+        finally:
+            await transport.close()
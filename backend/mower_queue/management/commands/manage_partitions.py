@@ -0,0 +1,179 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from ...models import FieldQueue, FieldQueueItem, MachineTelemetry
+from ...partitions import (
+    create_partitions,
+    drop_partitions,
+    is_partitioned,
+    months_before,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a run of `--every` that failed is tried again, when shorter
+# than the interval
+RETRY_DELAY = 60
+
+
+class Command(BaseCommand):
+    """Command maintaining the partitions of the partitioned tables"""
+
+    help = (
+        "Creates the partitions of the coming days and drops the partitions past"
+        " their retention, PostgreSQL only"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days-ahead",
+            type=int,
+            default=7,
+            help="Number of days ahead to create partitions for",
+        )
+        parser.add_argument(
+            "--telemetry-retention-days",
+            type=int,
+            default=settings.TELEMETRY_RETENTION_DAYS,
+            help="Days of telemetry history to keep, 0 keeps everything",
+        )
+        parser.add_argument(
+            "--queue-retention-months",
+            type=int,
+            default=settings.QUEUE_RETENTION_MONTHS,
+            help=(
+                "Months of queue items to keep besides the current one, 0 keeps"
+                " everything. Finished queues left without items are deleted"
+            ),
+        )
+        parser.add_argument(
+            "--detach",
+            action="store_true",
+            help="Detach the expired partitions instead of dropping them",
+        )
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=0,
+            help="Run again every given number of seconds instead of exiting",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Tables are only partitioned on PostgreSQL.")
+
+        while True:
+            succeeded = self.run(options)
+            connection.close()
+            if not options["every"]:
+                if not succeeded:
+                    raise CommandError("Partition maintenance failed.")
+                break
+            time.sleep(
+                options["every"] if succeeded else min(options["every"], RETRY_DELAY)
+            )
+
+    def run(self, options):
+        """Maintain every partitioned table, returns whether all steps succeeded
+
+        A failing step, e.g. on a database not migrated yet or restarting, is
+        logged and does not prevent the next ones.
+        """
+        today = timezone.localdate()
+        last = today + timedelta(days=options["days_ahead"])
+        if days := options["telemetry_retention_days"]:
+            telemetry_expired = today - timedelta(days=days)
+        else:
+            telemetry_expired = None
+        if months := options["queue_retention_months"]:
+            items_expired = months_before(today, months)
+        else:
+            items_expired = None
+
+        steps = [
+            (
+                "telemetry partitions",
+                lambda: self.maintain(
+                    MachineTelemetry, last, telemetry_expired, options["detach"]
+                ),
+            ),
+            (
+                "queue item partitions",
+                lambda: self.maintain(
+                    FieldQueueItem,
+                    last,
+                    items_expired,
+                    options["detach"],
+                    keep=holds_open_queues,
+                ),
+            ),
+        ]
+        if items_expired:
+            steps.append(
+                ("finished queues", lambda: self.delete_empty_queues(items_expired))
+            )
+
+        succeeded = True
+        for name, step in steps:
+            try:
+                step()
+            except Exception:
+                logger.exception("Maintaining the %s failed", name)
+                succeeded = False
+                # The connection may be broken, the next step reconnects
+                connection.close()
+        return succeeded
+
+    def maintain(self, model, last, expired, detach, keep=None):
+        """Create the partitions of model up to day last and remove the ones
+        holding rows older than day expired"""
+        table = model._meta.db_table
+        interval = model.PARTITION_INTERVAL
+        if not is_partitioned(table):
+            print(self.style.WARNING(f"{table} is not partitioned, skipped."))
+            return
+
+        for name in create_partitions(table, interval, timezone.localdate(), last):
+            print(f"Created partition {name}")
+        if expired:
+            for name in drop_partitions(table, interval, expired, detach, keep):
+                print(f"{'Detached' if detach else 'Dropped'} partition {name}")
+
+    def delete_empty_queues(self, expired, batch_size=1000):
+        """Delete the finished queues created before day expired left without
+        items once their partitions are gone"""
+        deleted = 0
+        while ids := list(
+            FieldQueue.objects.filter(
+                created_at__date__lt=expired,
+                status__in=["completed", "terminated"],
+            )
+            .exclude(Exists(FieldQueueItem.objects.filter(queue=OuterRef("pk"))))
+            .values_list("id", flat=True)[:batch_size]
+        ):
+            FieldQueue.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+        if deleted:
+            print(f"Deleted {deleted} finished queues")
+
+
+def holds_open_queues(partition):
+    """Whether the partition of the items holds items of unfinished queues"""
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {quote(partition)} item"
+            f" JOIN {quote(FieldQueue._meta.db_table)} queue"
+            " ON queue.id = item.queue_id"
+            " WHERE queue.status IN ('active', 'paused'))"
+        )
+        if held := cursor.fetchone()[0]:
+            print(f"Kept partition {partition}, it holds items of unfinished queues")
+        return held
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.dateparse import parse_date
+
+from ...models import FieldQueueItem, MachineDailyStats
+
+
+class Command(BaseCommand):
+    """Command rebuilding the machine daily stats from the queue history"""
+
+    help = "Rebuilds the machine daily stats rollup from the queue item history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="since",
+            help="First day to rebuild (YYYY-MM-DD), defaults to the whole history",
+        )
+        parser.add_argument(
+            "--to",
+            dest="until",
+            help="Last day to rebuild (YYYY-MM-DD), defaults to the whole history",
+        )
+
+    def handle(self, *args, **options):
+        since, until = (
+            self.parse_day(options["since"]),
+            self.parse_day(options["until"]),
+        )
+
+        def in_range(items, column):
+            if since:
+                items = items.filter(**{f"{column}__gte": since})
+            if until:
+                items = items.filter(**{f"{column}__lte": until})
+            return items
+
+        rows = defaultdict(dict)
+        items = FieldQueueItem.objects.annotate(machine_id=F("queue__machine_id"))
+
+        completed = (
+            in_range(
+                items.filter(status="completed", completed_at__isnull=False).annotate(
+                    day=TruncDate("completed_at")
+                ),
+                "day",
+            )
+            .values("machine_id", "day")
+            .annotate(
+                fields_completed=Count("id"),
+                mowing_time=Sum(
+                    ExpressionWrapper(
+                        F("completed_at") - F("started_at"),
+                        output_field=DurationField(),
+                    ),
+                    # Same as the incremental rollup, completions reported
+                    # before the recorded start add no mowing time
+                    filter=Q(completed_at__gte=F("started_at")),
+                ),
+            )
+        )
+        for row in completed:
+            rows[(row["machine_id"], row["day"])].update(
+                fields_completed=row["fields_completed"],
+                mowing_time=row["mowing_time"] or timedelta(),
+            )
+
+        skipped = (
+            in_range(
+                items.filter(status="skipped").annotate(
+                    day=TruncDate(Coalesce("started_at", "created_at"))
+                ),
+                "day",
+            )
+            .values("machine_id", "day")
+            .annotate(fields_skipped=Count("id"))
+        )
+        for row in skipped:
+            rows[(row["machine_id"], row["day"])]["fields_skipped"] = row[
+                "fields_skipped"
+            ]
+
+        touched = (
+            in_range(
+                items.filter(started_at__isnull=False).annotate(
+                    day=TruncDate("started_at")
+                ),
+                "day",
+            )
+            .values("machine_id", "day")
+            .annotate(queues_touched=Count("queue_id", distinct=True))
+        )
+        for row in touched:
+            rows[(row["machine_id"], row["day"])]["queues_touched"] = row[
+                "queues_touched"
+            ]
+
+        with transaction.atomic():
+            in_range(MachineDailyStats.objects.all(), "day").delete()
+            MachineDailyStats.objects.bulk_create(
+                [
+                    MachineDailyStats(machine_id=machine_id, day=day, **values)
+                    for (machine_id, day), values in rows.items()
+                ],
+                batch_size=1000,
+            )
+        print(self.style.SUCCESS(f"Daily stats rebuilt, {len(rows)} rows."))
+
+    def parse_day(self, value):
+        if value is None:
+            return None
+        if (day := parse_date(value)) is None:
+            raise CommandError(f"Invalid day {value}. Expected YYYY-MM-DD.")
+        return day
@@ -38,6 +38,7 @@ class Command(BaseCommand):
             10,
             {
                 "name": lambda x: f"Machine {seeder.faker.unique.last_name()}",
+                "active_queue": None,
             },
         )
         seeder.execute()
@@ -53,6 +54,7 @@ class Command(BaseCommand):
                 )
             )
         FieldQueue.objects.bulk_create(field_queues)
+        Machine.update_active_queues(Machine.objects.values("id"))
         print(self.style.SUCCESS("Field queues seeded."))
 
         queue_items = []
@@ -82,10 +84,10 @@ class Command(BaseCommand):
                     FieldQueueItem(
                         queue=queue,
                         field_id=seeder.faker.random_int(min=1, max=20),
-                        position=idx,
+                        rank=(idx + 1) * FieldQueueItem.RANK_GAP,
                         status=status,
                     )
                 )
 
-        FieldQueueItem.objects.bulk_create(queue_items)
+        FieldQueueItem.insert(queue_items)
         print(self.style.SUCCESS("Queue items seeded."))
@@ -0,0 +1,80 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Machine, FieldQueue, FieldQueueItem
+
+
+class Command(BaseCommand):
+    """Command creating the machines driven by the fleet simulator"""
+
+    help = (
+        "Creates machines with an active queue each and writes their ids for"
+        " scripts/fleet_sim.py"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--machines",
+            type=int,
+            default=1000,
+            help="Number of machines to create",
+        )
+        parser.add_argument(
+            "--fields",
+            type=int,
+            default=10,
+            help="Number of fields queued on each machine (at most 10)",
+        )
+        parser.add_argument(
+            "--command-url",
+            default="",
+            help=(
+                "Command endpoint of the machines, defaults to the"
+                " MACHINE_COMMAND_URL setting"
+            ),
+        )
+        parser.add_argument(
+            "--output",
+            help="File receiving one `<machine_id> <queue_id>` line per machine",
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["fields"] <= 10:
+            raise CommandError("A queue may only have 1 to 10 queued items.")
+
+        with transaction.atomic():
+            machines = Machine.objects.bulk_create(
+                [
+                    Machine(
+                        name=f"Fleet machine {i}",
+                        command_url=options["command_url"],
+                    )
+                    for i in range(options["machines"])
+                ]
+            )
+            queues = FieldQueue.objects.bulk_create(
+                [FieldQueue(machine=machine) for machine in machines]
+            )
+            Machine.update_active_queues([x.id for x in machines])
+            FieldQueueItem.insert(
+                [
+                    FieldQueueItem(
+                        queue=queue,
+                        field_id=random.randint(1, 20),
+                        rank=(i + 1) * FieldQueueItem.RANK_GAP,
+                    )
+                    for queue in queues
+                    for i in range(options["fields"])
+                ],
+                batch_size=5000,
+            )
+
+        lines = "".join(f"{queue.machine_id} {queue.id}\n" for queue in queues)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(lines)
+            print(self.style.SUCCESS(f"{len(queues)} fleet machines seeded."))
+        else:
+            self.stdout.write(lines, ending="")
@@ -0,0 +1,132 @@
+import os
+
+from django.db.models import Count
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Metrics are kept in memory by the process recording them. When the backend
+# runs several worker processes, PROMETHEUS_MULTIPROC_DIR must point every
+# process to the same empty directory, the samples are then written to files
+# there and aggregated when the metrics are exported.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+telemetry_received = Counter(
+    "mower_telemetry_received_total",
+    "Machine telemetry updates received, by source and outcome",
+    ["source", "outcome"],
+)
+telemetry_stored = Counter(
+    "mower_telemetry_stored_total",
+    "Telemetry updates written to the history",
+)
+telemetry_dropped = Counter(
+    "mower_telemetry_dropped_total",
+    "Telemetry updates left out of the history, buffer full or write failed",
+)
+telemetry_flush_duration = Histogram(
+    "mower_telemetry_flush_seconds",
+    "Time taken to write a batch of telemetry to the history",
+    buckets=LATENCY_BUCKETS,
+)
+next_item_duration = Histogram(
+    "mower_next_item_seconds",
+    "Time taken to move a queue on to its next item",
+    buckets=LATENCY_BUCKETS,
+)
+next_item_lock_wait = Histogram(
+    "mower_next_item_lock_wait_seconds",
+    "Time waited for the row lock of the queue when moving it on",
+    buckets=LATENCY_BUCKETS,
+)
+commands_queued = Counter(
+    "mower_commands_queued_total",
+    "Machine commands written to the outbox",
+    ["command"],
+)
+command_queue_duration = Histogram(
+    "mower_command_queue_seconds",
+    "Time taken to write a machine command to the outbox",
+    buckets=LATENCY_BUCKETS,
+)
+command_deliveries = Counter(
+    "mower_command_deliveries_total",
+    "Machine command delivery attempts, by transport and outcome",
+    ["transport", "outcome"],
+)
+command_connections = Counter(
+    "mower_command_connections_total",
+    "Connections to machine endpoints by the command transport, by outcome",
+    ["outcome"],
+)
+command_delivery_duration = Histogram(
+    "mower_command_delivery_seconds",
+    "Time taken to deliver a machine command",
+    ["transport"],
+    buckets=LATENCY_BUCKETS,
+)
+http_requests = Counter(
+    "mower_http_requests_total",
+    "HTTP requests handled, by view, method and status",
+    ["view", "method", "status"],
+)
+http_request_duration = Histogram(
+    "mower_http_request_seconds",
+    "Time taken to handle an HTTP request",
+    ["view", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+http_request_queries = Histogram(
+    "mower_http_request_queries",
+    "Database queries run by an HTTP request",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+
+
+class DatabaseCollector:
+    """Gauges read from the database when the metrics are exported"""
+
+    def collect(self):
+        from .models import FieldQueue, MachineCommand
+
+        queues = GaugeMetricFamily(
+            "mower_queues", "Field queues by status", labels=["status"]
+        )
+        counts = dict(
+            FieldQueue.objects.values_list("status").annotate(count=Count("id"))
+        )
+        for status, _ in FieldQueue.STATUS_CHOICES:
+            queues.add_metric([status], counts.get(status, 0))
+        yield queues
+
+        yield GaugeMetricFamily(
+            "mower_commands_pending",
+            "Machine commands waiting in the outbox",
+            value=MachineCommand.objects.filter(status="pending").count(),
+        )
+
+
+database_registry = CollectorRegistry(auto_describe=False)
+database_registry.register(DatabaseCollector())
+
+
+def process_registry():
+    """Registry of the metrics recorded by the processes of the backend"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def export_metrics():
+    """Metrics in the Prometheus text format"""
+    return generate_latest(process_registry()) + generate_latest(database_registry)
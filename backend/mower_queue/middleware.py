@@ -0,0 +1,103 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import http_request_duration, http_request_queries, http_requests
+from .query_stats import record_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware:
+    """Record the number and time of the SQL queries of every request
+
+    The stats are attached to the response as `query_stats`, sent as headers
+    in debug mode and logged as a warning when a request exceeds SLOW_REQUEST_QUERIES
+    queries or SLOW_REQUEST_SQL_TIME seconds of SQL. Queries run while a
+    streaming response is consumed are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_queries() as stats:
+            response = self.get_response(request)
+        return self.process_response(request, response, stats)
+
+    async def __acall__(self, request):
+        with record_queries() as stats:
+            response = await self.get_response(request)
+        return self.process_response(request, response, stats)
+
+    def process_response(self, request, response, stats):
+        response.query_stats = stats
+        if settings.DEBUG:
+            response["X-Query-Count"] = stats.count
+            response["X-Query-Time"] = f"{stats.duration * 1000:.1f}ms"
+            if stats.slowest:
+                response["X-Slowest-Query"] = (
+                    f"{stats.slowest_duration * 1000:.1f}ms"
+                    f" {' '.join(stats.slowest.split())[:200]}"
+                )
+
+        if (
+            stats.count > settings.SLOW_REQUEST_QUERIES
+            or stats.duration > settings.SLOW_REQUEST_SQL_TIME
+        ):
+            logger.warning(
+                "Slow request %s %s: %s queries in %.1fms, slowest (%.1fms): %s",
+                request.method,
+                request.path,
+                stats.count,
+                stats.duration * 1000,
+                stats.slowest_duration * 1000,
+                stats.slowest,
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """Count the requests and observe their duration per view
+
+    Views are identified by their route, and the query counts are taken from
+    QueryStatsMiddleware when it comes after this middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started_at)
+        return response
+
+    async def __acall__(self, request):
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started_at)
+        return response
+
+    def observe(self, request, response, duration):
+        view = request.resolver_match.route if request.resolver_match else ""
+        http_requests.labels(view, request.method, response.status_code).inc()
+        http_request_duration.labels(view, request.method).observe(duration)
+        if stats := getattr(response, "query_stats", None):
+            http_request_queries.labels(view).observe(stats.count)
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MachineCommand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("command", models.CharField(max_length=50)),
+                ("field_id", models.CharField(blank=True, max_length=36)),
+                ("queue_id", models.CharField(blank=True, max_length=36)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("delivered", "Delivered"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("delivered_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "machine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="commands",
+                        to="mower_queue.machine",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="mower_queue_status_86d50d_idx",
+                    ),
+                    models.Index(
+                        fields=["machine", "status", "id"],
+                        name="mower_queue_machine_2b4816_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
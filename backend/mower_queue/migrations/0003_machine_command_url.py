@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0002_machinecommand"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="machine",
+            name="command_url",
+            field=models.URLField(blank=True),
+        ),
+    ]
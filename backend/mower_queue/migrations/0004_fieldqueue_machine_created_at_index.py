@@ -0,0 +1,20 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0003_machine_command_url"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="fieldqueue",
+            index=models.Index(
+                fields=["machine", "created_at", "id"],
+                name="mower_queue_machine_8b94bc_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0004_fieldqueue_machine_created_at_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["started_at", "status"], name="mower_queue_started_50e2fb_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["completed_at", "status"], name="mower_queue_complet_4c8d8d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["queue", "status", "position"],
+                name="mower_queue_queue_i_29952d_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["created_at", "id"], name="mower_queue_created_e37697_idx"
+            ),
+        ),
+    ]
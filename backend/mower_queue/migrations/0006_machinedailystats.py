@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:29
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0005_fieldqueueitem_history_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MachineDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("fields_completed", models.IntegerField(default=0)),
+                ("fields_skipped", models.IntegerField(default=0)),
+                ("mowing_time", models.DurationField(default=datetime.timedelta)),
+                ("queues_touched", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "machine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="mower_queue.machine",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("machine", "day"), name="unique_machine_daily_stats"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+RANK_GAP = 1024
+
+
+def positions_to_ranks(apps, schema_editor):
+    FieldQueueItem = apps.get_model("mower_queue", "FieldQueueItem")
+    FieldQueueItem.objects.update(rank=(models.F("position") + 1) * RANK_GAP)
+
+
+def ranks_to_positions(apps, schema_editor):
+    FieldQueueItem = apps.get_model("mower_queue", "FieldQueueItem")
+    FieldQueueItem.objects.update(
+        position=models.Subquery(
+            FieldQueueItem.objects.filter(
+                queue=models.OuterRef("queue"),
+                rank__lt=models.OuterRef("rank"),
+            )
+            .values("queue")
+            .annotate(count=models.Count("id"))
+            .values("count")
+        )
+    )
+    FieldQueueItem.objects.filter(position__isnull=True).update(position=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0006_machinedailystats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldqueueitem",
+            name="rank",
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="fieldqueueitem",
+            name="position",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(positions_to_ranks, ranks_to_positions),
+        migrations.RemoveIndex(
+            model_name="fieldqueueitem",
+            name="mower_queue_queue_i_29952d_idx",
+        ),
+        migrations.RemoveField(
+            model_name="fieldqueueitem",
+            name="position",
+        ),
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["queue", "status", "rank"],
+                name="mower_queue_queue_i_3d505a_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fieldqueueitem",
+            index=models.Index(
+                fields=["queue", "rank"], name="mower_queue_queue_i_6050c2_idx"
+            ),
+        ),
+    ]
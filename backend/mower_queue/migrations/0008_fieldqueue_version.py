@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0007_fieldqueueitem_rank"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldqueue",
+            name="version",
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+    ]
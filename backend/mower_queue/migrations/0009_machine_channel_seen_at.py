@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0008_fieldqueue_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="machine",
+            name="channel_seen_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
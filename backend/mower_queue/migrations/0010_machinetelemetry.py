@@ -0,0 +1,76 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:56
+
+import django.db.models.deletion
+import uuid
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+from mower_queue.partitions import create_partitions, rebuild_table
+
+
+def partition_by_day(apps, schema_editor):
+    """Partition the telemetry by day, other databases keep a plain table"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    MachineTelemetry = apps.get_model("mower_queue", "MachineTelemetry")
+    rebuild_table(schema_editor, MachineTelemetry, "recorded_at", "day")
+    today = timezone.localdate()
+    create_partitions(
+        MachineTelemetry._meta.db_table,
+        "day",
+        today - timedelta(days=1),
+        today + timedelta(days=7),
+        schema_editor.connection,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0009_machine_channel_seen_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MachineTelemetry",
+            fields=[
+                (
+                    "pk",
+                    models.CompositePrimaryKey(
+                        "id",
+                        "recorded_at",
+                        blank=True,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False)),
+                ("recorded_at", models.DateTimeField()),
+                ("state", models.CharField(max_length=20)),
+                ("queue_id", models.UUIDField(null=True)),
+                ("field_id", models.UUIDField(null=True)),
+                ("timestamp", models.DateTimeField(null=True)),
+                (
+                    "machine",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="telemetry",
+                        to="mower_queue.machine",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["machine", "recorded_at"],
+                        name="mower_queue_machine_aef4f4_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(partition_by_day, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:59
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+from django.utils import timezone
+
+from mower_queue.partitions import create_partitions, next_range_start, rebuild_table
+
+
+def partition_by_month(apps, schema_editor):
+    """Partition the items by month of creation on PostgreSQL
+
+    Other databases keep a plain table whose primary key is the item id.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    FieldQueueItem = apps.get_model("mower_queue", "FieldQueueItem")
+    rebuild_table(schema_editor, FieldQueueItem, "created_at", "month")
+    # Partitions of the existing items are created by rebuild_table, new items
+    # need the current and next month
+    today = timezone.localdate()
+    create_partitions(
+        FieldQueueItem._meta.db_table,
+        "month",
+        today,
+        next_range_start(today.replace(day=1), "month"),
+        schema_editor.connection,
+    )
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    FieldQueueItem = apps.get_model("mower_queue", "FieldQueueItem")
+    rebuild_table(schema_editor, FieldQueueItem)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0010_machinetelemetry"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="fieldqueueitem",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        # Django cannot migrate a primary key to a composite one, the table is
+        # rebuilt instead
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name="fieldqueueitem",
+                    name="pk",
+                    field=models.CompositePrimaryKey(
+                        "id",
+                        "created_at",
+                        blank=True,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="fieldqueueitem",
+                    name="id",
+                    field=models.UUIDField(default=uuid.uuid4, editable=False),
+                ),
+            ],
+        ),
+        migrations.RunPython(partition_by_month, unpartition),
+    ]
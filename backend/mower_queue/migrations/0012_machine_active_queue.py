@@ -0,0 +1,58 @@
+# Generated by Django 5.2.10 on 2026-10-18 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def point_machines_at_active_queues(apps, schema_editor):
+    # Only the newest active queue of each machine is left active
+    Machine = apps.get_model("mower_queue", "Machine")
+    FieldQueue = apps.get_model("mower_queue", "FieldQueue")
+    FieldQueue.objects.filter(status="active").exclude(
+        id=models.Subquery(
+            FieldQueue.objects.filter(
+                machine=models.OuterRef("machine"), status="active"
+            )
+            .order_by("-created_at", "-id")
+            .values("id")[:1]
+        )
+    ).update(status="paused", version=models.F("version") + 1)
+    Machine.objects.update(
+        active_queue=models.Subquery(
+            FieldQueue.objects.filter(
+                machine=models.OuterRef("pk"), status="active"
+            ).values("id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mower_queue", "0011_fieldqueueitem_partitions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="machine",
+            name="active_queue",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="mower_queue.fieldqueue",
+            ),
+        ),
+        migrations.RunPython(
+            point_machines_at_active_queues, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="fieldqueue",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "active")),
+                fields=("machine",),
+                name="unique_active_queue_per_machine",
+            ),
+        ),
+    ]
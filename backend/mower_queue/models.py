@@ -1,28 +1,94 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from django.db import models, transaction
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.core.validators import MaxValueValidator
 from django.core.exceptions import ValidationError
 
+from .events import publish_on_commit
+from .metrics import next_item_duration, next_item_lock_wait
+from .partitions import insert_partitioned
+from .telemetry_cache import forget_telem
+
+
+class VersionConflict(Exception):
+    """The queue changed since the version an edit was based on"""
+
+    def __init__(self, queue_id, version):
+        self.queue_id = queue_id
+        self.version = version
+        super().__init__(
+            f"Queue {queue_id} was changed concurrently, its version is now"
+            f" {version}."
+        )
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
 
 class Machine(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=50)
+    # Endpoint receiving the commands of the machine, the MACHINE_COMMAND_URL
+    # setting is used when left blank
+    command_url = models.URLField(blank=True)
+    # Refreshed while the machine is connected over its WebSocket channel, the
+    # commands of connected machines are sent over the channel
+    channel_seen_at = models.DateTimeField(null=True, blank=True)
+    # Queue the machine is working on, kept in step with the status of its
+    # queues. A machine has at most one active queue.
+    active_queue = models.ForeignKey(
+        "FieldQueue",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+
+    def get_command_url(self):
+        return self.command_url or settings.MACHINE_COMMAND_URL
+
+    @classmethod
+    def update_active_queues(cls, machine_ids):
+        """Point the machines at their active queue, in a single UPDATE"""
+        cls.objects.filter(id__in=machine_ids).update(
+            active_queue=models.Subquery(
+                FieldQueue.objects.filter(
+                    machine=models.OuterRef("pk"), status="active"
+                ).values("id")[:1]
+            )
+        )
 
     def add_queue(self, field_ids):
+        """Add a queue of fields to the machine
+
+        The queue is active unless the machine is working on another queue, it
+        is then paused until started.
+        """
         with transaction.atomic():
             queue = FieldQueue(machine=self)
-            queue.save()
+            try:
+                with transaction.atomic():
+                    queue.save()
+            except IntegrityError:
+                queue.status = "paused"
+                queue.save()
+            queue.update_machine()
 
             now = timezone.now()
-            FieldQueueItem.objects.bulk_create(
+            FieldQueueItem.insert(
                 [
                     FieldQueueItem(
                         queue=queue,
                         field_id=field_id,
-                        position=i,
+                        rank=(i + 1) * FieldQueueItem.RANK_GAP,
                         created_at=now,
                     )
                     for i, field_id in enumerate(field_ids)
@@ -38,6 +104,21 @@ class FieldQueue(models.Model):
         ("terminated", "Terminated"),
         ("completed", "Completed"),
     ]
+    # Fields of the serialized queue in order, the minimal representation is
+    # sent back to the mutations requested with `Prefer: return=minimal`
+    SERIALIZED_FIELDS = (
+        "id",
+        "machine_id",
+        "status",
+        "version",
+        "created_at",
+        "updated_at",
+        "items",
+    )
+    MINIMAL_FIELDS = ("id", "status", "version")
+    # Attempts of an edit of the items running into concurrent changes, when
+    # the client did not send the version it expects
+    EDIT_ATTEMPTS = 5
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     machine = models.ForeignKey(
@@ -46,36 +127,146 @@ class FieldQueue(models.Model):
         related_name="queues",
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="active")
+    # Bumped by every change of the queue or of its items
+    version = models.PositiveBigIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def serialize(self):
-        """Serialize field queue instance"""
+    class Meta:
+        indexes = [
+            models.Index(fields=["machine", "created_at", "id"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["machine"],
+                condition=models.Q(status="active"),
+                name="unique_active_queue_per_machine",
+            ),
+        ]
+
+    def serialize(self, fields=SERIALIZED_FIELDS):
+        """Serialize field queue instance, the items are only read when requested"""
         return {
-            "id": self.id,
-            "machine_id": self.machine.id,
-            "status": self.status,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "items": [x.serialize() for x in self.items.all()],
+            x: self.serialize_items() if x == "items" else getattr(self, x)
+            for x in self.SERIALIZED_FIELDS
+            if x in fields
         }
 
+    def serialize_items(self):
+        """Serialize the queue items in order, numbering their positions"""
+        items = sorted(self.items.all(), key=lambda x: x.rank)
+        for position, item in enumerate(items):
+            item.position = position
+        return [x.serialize() for x in items]
+
+    @property
+    def items_since_creation(self):
+        """Items of the queue, bounded by the creation of the queue
+
+        Items are never older than their queue. The bound lets PostgreSQL skip
+        the partitions of the items created before the queue.
+        """
+        return self.items.filter(created_at__gte=self.created_at)
+
+    @property
+    def etag(self):
+        return f"{self.id}-{self.version}"
+
     def update_status(self, status):
+        """Change the status of the queue
+
+        Activating the queue pauses the other active queue of the machine. Two
+        queues of a machine activated concurrently raise an IntegrityError.
+        """
         if self.status != status:
-            self.status = status
-            self.save()
+            with transaction.atomic():
+                if status == "active":
+                    for queue in (
+                        FieldQueue.objects.select_for_update()
+                        .filter(machine_id=self.machine_id, status="active")
+                        .exclude(id=self.id)
+                    ):
+                        queue.update_status("paused")
+                self.status = status
+                self.version = models.F("version") + 1
+                self.save()
+                self.refresh_from_db(fields=["version"])
+                self.update_machine()
+            self.publish_status()
+            forget_telem(self.machine_id)
+
+    def update_machine(self):
+        """Keep the active queue of the machine in step with the queue"""
+        if self.status == "active":
+            Machine.objects.filter(id=self.machine_id).update(active_queue=self)
+        else:
+            Machine.objects.filter(id=self.machine_id, active_queue=self).update(
+                active_queue=None
+            )
+
+    def publish_status(self):
+        publish_on_commit(
+            self.id,
+            "queue",
+            {"id": self.id, "status": self.status, "version": self.version},
+        )
+
+    def publish_items(self):
+        publish_on_commit(self.id, "items", self.serialize_items)
+
+    def bump_version(self):
+        """Record a change of the queue items"""
+        self.version = models.F("version") + 1
+        self.save(update_fields=["version", "updated_at"])
+        self.refresh_from_db(fields=["version"])
+
+    def edit_items(self, edit, expected_version=None):
+        """Run edit(queue) and commit it only if the queue did not change meanwhile
 
-    def add_item(self, field_id, position=None):
+        The queue row is not locked during the edit. Instead the version read
+        first is checked when it is bumped at the end, so edits never wait for
+        the queue to be moved on. Conflicting edits are retried, or raise
+        VersionConflict when the client sent the version it expects.
+        """
+        for attempt in range(1, self.EDIT_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    queue = FieldQueue.objects.get(id=self.id)
+                    version = expected_version or queue.version
+                    if queue.version != version:
+                        raise VersionConflict(queue.id, queue.version)
+
+                    result = edit(queue)
+                    if not FieldQueue.objects.filter(
+                        id=queue.id, version=version
+                    ).update(
+                        version=models.F("version") + 1, updated_at=timezone.now()
+                    ):
+                        raise VersionConflict(
+                            queue.id,
+                            FieldQueue.objects.values_list("version", flat=True).get(
+                                id=queue.id
+                            ),
+                        )
+                    self.version = queue.version = version + 1
+                    queue.publish_items()
+                    forget_telem(queue.machine_id)
+                    return result
+            except VersionConflict:
+                if expected_version or attempt == self.EDIT_ATTEMPTS:
+                    raise
+
+    def add_item(self, field_id, position=None, expected_version=None):
         """Add new item to the queue"""
-        with transaction.atomic():
-            queue = FieldQueue.objects.select_for_update().get(id=self.id)
-            item_count = queue.items.count()
-            position = item_count if position is None else position
 
-            if position < 0 or position >= 10:
+        def add(queue):
+            item_count = queue.items_since_creation.count()
+            item_position = item_count if position is None else position
+
+            if item_position < 0 or item_position >= 10:
                 raise ValidationError(
-                    f"Failed to add field to queue {queue.id}. Position {position} is"
-                    " out of range."
+                    f"Failed to add field to queue {queue.id}. Position"
+                    f" {item_position} is out of range."
                 )
 
             if item_count >= 10:
@@ -84,80 +275,255 @@ class FieldQueue(models.Model):
                     " the maximum amount of 10 queued items."
                 )
 
-            if position > item_count or (item_count == 0 and position != 0):
+            if item_position > item_count or (item_count == 0 and item_position != 0):
                 raise ValidationError(
-                    f"Failed to add field  to queue {queue.id} at position {position}."
-                    f" The next position should be {item_count}."
+                    f"Failed to add field  to queue {queue.id} at position"
+                    f" {item_position}. The next position should be {item_count}."
                 )
 
-            queue.items.filter(position__gte=position).update(
-                position=models.F("position") + 1
-            )
-
             new_item = FieldQueueItem(
                 queue=queue,
                 field_id=field_id,
-                position=position,
+                rank=queue.rank_at(item_position),
+                position=item_position,
             )
-            new_item.save()
-
+            FieldQueueItem.insert([new_item])
             return new_item
 
+        return self.edit_items(add, expected_version)
+
     def next_item(self, timestamp=None, previous_item_id=None):
-        timestamp = datetime.fromtimestamp(timestamp) if timestamp else timezone.now()
-        with transaction.atomic():
-            queue = FieldQueue.objects.select_for_update().get(id=self.id)
-
-            if previous_item_id:
-                try:
-                    previous = queue.items.select_for_update().get(id=previous_item_id)
-                except FieldQueueItem.DoesNotExist:
-                    previous = None
-
-                if previous and previous.status not in ["completed", "skipped"]:
-                    previous.status = "completed"
-                    previous.completed_at = timestamp
-                    previous.save()
-
-            next_item = (
-                queue.items.select_for_update()
-                .filter(status__in=["pending", "in_progress"])
-                .order_by("position")
-                .first()
+        """Complete the previous item and start the next one
+
+        Items are stamped with `timestamp`, the seconds since the epoch reported
+        by the machine, so that machines on a simulated clock record simulated
+        start and completion times. The time of the server is used without it.
+        """
+        with next_item_duration.time(), transaction.atomic():
+            with next_item_lock_wait.time():
+                queue = FieldQueue.objects.select_for_update().get(id=self.id)
+
+            # The items of the queue are read once, in order, which numbers
+            # the positions of the items published below
+            items = list(
+                queue.items_since_creation.select_for_update().order_by("rank")
             )
+            next_item = queue.move_on(items, timestamp, previous_item_id)
+        self.version = queue.version
+        return next_item
+
+    def move_on(self, items, timestamp=None, previous_item_id=None):
+        """Move the locked queue on, like `next_item()`
+
+        The queue and `items`, every item of the queue in rank order, must have
+        been read under lock within the current transaction, so that queues can
+        be locked and read in bulk.
+        """
+        timestamp = (
+            datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+            if timestamp
+            else timezone.now()
+        )
+        day = timezone.localdate(timestamp)
+        changed = False
+        stats = {}
+        for position, item in enumerate(items):
+            item.position = position
+
+        if previous_item_id and is_uuid(previous_item_id):
+            previous_item_id = uuid.UUID(str(previous_item_id))
+            previous = next((x for x in items if x.id == previous_item_id), None)
+
+            if previous and previous.status not in ["completed", "skipped"]:
+                changed = True
+                previous.status = "completed"
+                previous.completed_at = timestamp
+                previous.save(update_fields=["status", "completed_at"])
+                publish_on_commit(self.id, "item", previous.serialize)
+                stats["fields_completed"] = 1
+                # Machines on a simulated clock may report a completion before
+                # a start recorded with the server time
+                stats["mowing_time"] = (
+                    max(timestamp - previous.started_at, timedelta())
+                    if previous.started_at
+                    else timedelta()
+                )
+
+        next_item = next(
+            (x for x in items if x.status in ["pending", "in_progress"]), None
+        )
+
+        if next_item and next_item.status != "in_progress":
+            if not any(
+                x.started_at and timezone.localdate(x.started_at) == day for x in items
+            ):
+                stats["queues_touched"] = 1
+            next_item.status = "in_progress"
+            next_item.started_at = timestamp
+            next_item.save(update_fields=["status", "started_at"])
+            publish_on_commit(self.id, "item", next_item.serialize)
+            changed = True
 
-            if next_item:
-                if next_item.status != "in_progress":
-                    next_item.status = "in_progress"
-                    next_item.started_at = timestamp
-                    next_item.save()
-                return next_item
-
-            # No more items in the queue
-            queue.status = "completed"
-            queue.save()
-
-    def remove_items(self, field_ids):
-        possible_fields = [str(x.id) for x in self.items.all()]
-        if err_fields := [x for x in field_ids if x not in possible_fields]:
-            # Make sure that the fields are part of the queue
-            raise ValidationError(
-                f"The following fields are not part of the {self.id} queue:"
-                f" {err_fields}"
+        if stats:
+            MachineDailyStats.record(self.machine_id, day, **stats)
+
+        if next_item:
+            if changed:
+                self.version += 1
+                self.save(update_fields=["version", "updated_at"])
+            return next_item
+
+        # No more items in the queue
+        self.status = "completed"
+        self.version += 1
+        self.save()
+        self.update_machine()
+        self.publish_status()
+
+    def remove_items(self, field_ids, expected_version=None):
+        """Remove items from the queue and close the gaps they leave"""
+
+        def remove(queue):
+            removed = set(
+                queue.items_since_creation.filter(
+                    id__in=[x for x in field_ids if is_uuid(x)]
+                ).values_list("id", flat=True)
+            )
+
+            if err_fields := [
+                x
+                for x in field_ids
+                if not is_uuid(x) or uuid.UUID(str(x)) not in removed
+            ]:
+                # Make sure that the fields are part of the queue
+                raise ValidationError(
+                    f"The following fields are not part of the {queue.id} queue:"
+                    f" {err_fields}"
+                )
+
+            # Positions are derived from the ranks, the remaining items keep theirs
+            queue.items_since_creation.filter(id__in=removed).delete()
+
+        self.edit_items(remove, expected_version)
+
+    def reorder_items(self, item_ids, expected_version=None):
+        """Apply a complete new ordering of the queue items"""
+
+        def reorder(queue):
+            current = {
+                str(x) for x in queue.items_since_creation.values_list("id", flat=True)
+            }
+
+            if len(item_ids) != len(set(item_ids)) or set(item_ids) != current:
+                raise ValidationError(
+                    f"Failed to reorder queue {queue.id}. The new order should list"
+                    " every item of the queue exactly once."
+                )
+
+            queue.set_ranks(item_ids)
+
+        self.edit_items(reorder, expected_version)
+
+    def move_item(self, item_id, position, expected_version=None):
+        """Move an item to another position, only the moved item is updated"""
+
+        def move(queue):
+            try:
+                item = queue.items_since_creation.get(id=item_id)
+            except FieldQueueItem.DoesNotExist:
+                raise ValidationError(
+                    f"Failed to move field {item_id}. The field is not part of the"
+                    f" {queue.id} queue."
+                )
+
+            item_count = queue.items_since_creation.count()
+            if position < 0 or position >= item_count:
+                raise ValidationError(
+                    f"Failed to move field {item_id} to position {position}. The"
+                    f" position should be between 0 and {item_count - 1}."
+                )
+
+            item.rank = queue.rank_at(position, exclude_id=item.id)
+            item.position = position
+            item.save(update_fields=["rank"])
+            return item
+
+        return self.edit_items(move, expected_version)
+
+    def rank_at(self, position, exclude_id=None):
+        """Rank placing an item at the given position of the queue
+
+        The rank is picked halfway between the ranks of the neighbouring items.
+        Ranks are spread out again once two neighbours leave no room in between.
+        """
+        items = (
+            self.items_since_creation.exclude(id=exclude_id)
+            if exclude_id
+            else self.items_since_creation
+        )
+        while True:
+            neighbours = list(
+                items.order_by("rank").values_list("rank", flat=True)[
+                    max(position - 1, 0) : position + 1
+                ]
+            )
+            if position == 0:
+                before, after = 0, neighbours[0] if neighbours else None
+            else:
+                before = neighbours[0]
+                after = neighbours[1] if len(neighbours) > 1 else None
+
+            if after is None:
+                return before + FieldQueueItem.RANK_GAP
+            if after - before > 1:
+                return (before + after) // 2
+            self.set_ranks(
+                self.items_since_creation.order_by("rank").values_list("id", flat=True)
+            )
+
+    def set_ranks(self, item_ids):
+        """Evenly spread the ranks of the queue items in the given order"""
+        if item_ids := list(item_ids):
+            self.items_since_creation.update(
+                rank=models.Case(
+                    *[
+                        models.When(id=item_id, then=(i + 1) * FieldQueueItem.RANK_GAP)
+                        for i, item_id in enumerate(item_ids)
+                    ],
+                    default=models.F("rank"),
+                    output_field=models.BigIntegerField(),
+                )
             )
 
-        with transaction.atomic():
-            FieldQueueItem.objects.filter(id__in=field_ids).delete()
-            queue = FieldQueue.objects.select_for_update().get(id=self.id)
 
-            # Update positions in the queue
-            for i, field in enumerate(queue.items.order_by("position")):
-                if field.position != i:
-                    field.position = i
-                    field.save()
+class FieldQueueItemQuerySet(models.QuerySet):
+    def with_position(self):
+        """Annotate the dense 0-based position of each item within its queue"""
+        return self.annotate(
+            position=Coalesce(
+                models.Subquery(
+                    FieldQueueItem.objects.filter(
+                        queue=models.OuterRef("queue"),
+                        rank__lt=models.OuterRef("rank"),
+                    )
+                    .values("queue")
+                    .annotate(count=models.Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+        )
 
 
 class FieldQueueItem(models.Model):
+    # Items are ordered by a sparse rank so that adding or moving an item only
+    # updates that item, the public position is derived from the ranks
+    RANK_GAP = 1024
+
+    # Partitioned by month of creation on PostgreSQL, see manage_partitions
+    PARTITION_FIELD = "created_at"
+    PARTITION_INTERVAL = "month"
+
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("in_progress", "In Progress"),
@@ -165,16 +531,62 @@ class FieldQueueItem(models.Model):
         ("skipped", "Skipped"),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # The partition key has to be part of the primary key
+    pk = models.CompositePrimaryKey("id", "created_at")
+    id = models.UUIDField(default=uuid.uuid4, editable=False)
     queue = models.ForeignKey(
         FieldQueue, on_delete=models.CASCADE, related_name="items"
     )
     field_id = models.IntegerField()
-    position = models.IntegerField(validators=[MaxValueValidator(10)])
+    rank = models.BigIntegerField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set on instantiation rather than on save, bulk_create needs the whole
+    # primary key
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # History lookups by time window
+            models.Index(fields=["started_at", "status"]),
+            models.Index(fields=["completed_at", "status"]),
+            # Queue progression and per queue progress aggregates
+            models.Index(fields=["queue", "status", "rank"]),
+            models.Index(fields=["queue", "rank"]),
+            models.Index(fields=["created_at", "id"]),
+        ]
+
+    objects = FieldQueueItemQuerySet.as_manager()
+
+    _position = None
+
+    @classmethod
+    def insert(cls, items, **kwargs):
+        """Bulk create new items, creating the partitions they need when missing"""
+        return insert_partitioned(
+            cls,
+            lambda: cls.objects.bulk_create(items, **kwargs),
+            {timezone.localdate(x.created_at) for x in items},
+        )
+
+    @property
+    def position(self):
+        """Dense 0-based position of the item within its queue
+
+        Numbered when the items of a queue are enumerated in rank order or
+        annotated by with_position(), it is never queried item by item.
+        """
+        if self._position is None:
+            raise ValueError(
+                f"Position of item {self.id} unknown, annotate it with"
+                " with_position()."
+            )
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
 
     def serialize(self):
         """Serialize field queue item instance"""
@@ -187,3 +599,168 @@ class FieldQueueItem(models.Model):
             "completed_at": self.completed_at,
             "created_at": self.created_at,
         }
+
+
+class MachineCommand(models.Model):
+    """Outbox of commands waiting to be delivered to a machine
+
+    Commands are written in the same transaction as the queue change they
+    belong to and delivered by the `dispatch_commands` management command.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("delivered", "Delivered"),
+        ("failed", "Failed"),
+    ]
+
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name="commands",
+    )
+    command = models.CharField(max_length=50)
+    field_id = models.CharField(max_length=36, blank=True)
+    queue_id = models.CharField(max_length=36, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["machine", "status", "id"]),
+        ]
+
+    def payload(self):
+        """Build the payload expected by the machine"""
+        return {
+            "machine_id": str(self.machine_id),
+            "command": self.command,
+            "field_id": self.field_id,
+            "queue_id": self.queue_id,
+        }
+
+
+class MachineDailyStats(models.Model):
+    """Daily rollup of the work done by a machine
+
+    Maintained incrementally as queue items change status and rebuilt from
+    history by the `rebuild_daily_stats` management command. Completed fields
+    and mowing time are counted on the day the field was completed, skipped
+    fields and touched queues on the day the field was started.
+    """
+
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name="daily_stats",
+    )
+    day = models.DateField()
+    fields_completed = models.IntegerField(default=0)
+    fields_skipped = models.IntegerField(default=0)
+    mowing_time = models.DurationField(default=timedelta)
+    queues_touched = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["machine", "day"],
+                name="unique_machine_daily_stats",
+            ),
+        ]
+
+    @classmethod
+    def record(
+        cls,
+        machine_id,
+        day,
+        fields_completed=0,
+        fields_skipped=0,
+        mowing_time=timedelta(),
+        queues_touched=0,
+    ):
+        """Add to the stats of a machine for the given day"""
+        increments = {
+            "fields_completed": models.F("fields_completed") + fields_completed,
+            "fields_skipped": models.F("fields_skipped") + fields_skipped,
+            "mowing_time": models.F("mowing_time") + mowing_time,
+            "queues_touched": models.F("queues_touched") + queues_touched,
+            "updated_at": timezone.now(),
+        }
+        if cls.objects.filter(machine_id=machine_id, day=day).update(**increments):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    machine_id=machine_id,
+                    day=day,
+                    fields_completed=fields_completed,
+                    fields_skipped=fields_skipped,
+                    mowing_time=mowing_time,
+                    queues_touched=queues_touched,
+                )
+        except IntegrityError:
+            # Created concurrently for the same day
+            cls.objects.filter(machine_id=machine_id, day=day).update(**increments)
+
+    def serialize(self):
+        """Serialize machine daily stats instance"""
+        return {
+            "machine_id": self.machine_id,
+            "day": self.day,
+            "fields_completed": self.fields_completed,
+            "fields_skipped": self.fields_skipped,
+            "mowing_time": self.mowing_time.total_seconds(),
+            "queues_touched": self.queues_touched,
+        }
+
+
+class MachineTelemetry(models.Model):
+    """Append-only history of the telemetry received from the machines
+
+    Rows are written in bulk by the telemetry buffer. On PostgreSQL the table
+    is partitioned by day of `recorded_at`, see the manage_partitions command.
+    """
+
+    PARTITION_FIELD = "recorded_at"
+    PARTITION_INTERVAL = "day"
+
+    # The partition key has to be part of the primary key
+    pk = models.CompositePrimaryKey("id", "recorded_at")
+    id = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Time the telemetry was received, `timestamp` is the time of the machine
+    recorded_at = models.DateTimeField()
+    # No constraint, the history outlives the machines and is never joined on
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="telemetry",
+    )
+    state = models.CharField(max_length=20)
+    queue_id = models.UUIDField(null=True)
+    field_id = models.UUIDField(null=True)
+    timestamp = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["machine", "recorded_at"]),
+        ]
+
+    def serialize(self):
+        """Serialize machine telemetry instance"""
+        return {
+            "machine_id": self.machine_id,
+            "recorded_at": self.recorded_at,
+            "state": self.state,
+            "queue_id": self.queue_id,
+            "field_id": self.field_id,
+            "timestamp": self.timestamp,
+        }
@@ -0,0 +1,91 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(*values):
+    """Encode the keyset of the last row of a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError(f"Invalid cursor {cursor}.")
+    return values
+
+
+def parse_limit(value):
+    """Validate the requested page size"""
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValidationError(
+            f"Invalid limit {value}. The limit should be between 1 and"
+            f" {MAX_PAGE_SIZE}."
+        )
+    return limit
+
+
+def parse_timestamp(value, name):
+    """Parse an ISO 8601 date or datetime query parameter into an aware datetime"""
+    if value in (None, ""):
+        return None
+
+    try:
+        timestamp = parse_datetime(value)
+        if timestamp is None and (date := parse_date(value)):
+            timestamp = datetime.combine(date, datetime.min.time())
+    except ValueError:
+        timestamp = None
+
+    if timestamp is None:
+        raise ValidationError(f"Invalid {name} {value}. Expected an ISO 8601 date.")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def parse_day(value, name):
+    """Parse an ISO 8601 date query parameter"""
+    if value in (None, ""):
+        return None
+
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+
+    if day is None:
+        raise ValidationError(f"Invalid {name} {value}. Expected an ISO 8601 date.")
+    return day
+
+
+def parse_fields(value, allowed, name):
+    """Parse a comma separated list of field names, None when not given"""
+    if value is None:
+        return None
+
+    fields = [x.strip() for x in value.split(",") if x.strip()]
+    if invalid := [x for x in fields if x not in allowed]:
+        raise ValidationError(
+            f"Invalid {name} {invalid}. Expected any of {', '.join(allowed)}."
+        )
+    return fields
@@ -0,0 +1,210 @@
+from datetime import datetime, time, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+# Tables partitioned by range of a timestamp on PostgreSQL. Partitions cover a
+# day or a month of the default time zone and are named after the table and
+# the start of their range, e.g. mower_queue_machinetelemetry_20260601.
+
+NAME_FORMATS = {"day": "%Y%m%d", "month": "%Y%m"}
+
+
+def range_start(day, interval):
+    """First day of the partition holding day"""
+    return day if interval == "day" else day.replace(day=1)
+
+
+def next_range_start(start, interval):
+    if interval == "day":
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table, start, interval):
+    return f"{table}_{start.strftime(NAME_FORMATS[interval])}"
+
+
+def bound(day):
+    """Start of day in the default time zone"""
+    return datetime.combine(day, time(), tzinfo=timezone.get_default_timezone())
+
+
+def rebuild_table(schema_editor, model, column=None, interval=None):
+    """Recreate the table of model and copy its rows over
+
+    The new table is partitioned by range of column when given, with the
+    partitions holding the existing rows. Its primary key and unique
+    constraints must then include column. No foreign key may point to the
+    table.
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    table = model._meta.db_table
+    old_table = f"{table}_old"
+    schema_editor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}")
+
+    # Free the names of the constraints and indexes for the new table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass"
+            " AND contype IN ('p', 'u', 'f', 'x')",
+            [old_table],
+        )
+        constraints = [x for x, in cursor.fetchall()]
+    for name in constraints:
+        schema_editor.execute(
+            f"ALTER TABLE {quote(old_table)} DROP CONSTRAINT {quote(name)}"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s", [old_table]
+        )
+        indexes = [x for x, in cursor.fetchall()]
+    for name in indexes:
+        schema_editor.execute(f"DROP INDEX {quote(name)}")
+
+    sql, params = schema_editor.table_sql(model)
+    if column:
+        sql += f" PARTITION BY RANGE ({quote(column)})"
+    schema_editor.execute(sql, params or None)
+
+    if column:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT MIN({quote(column)}), MAX({quote(column)})"
+                f" FROM {quote(old_table)}"
+            )
+            first, last = cursor.fetchone()
+        if first:
+            create_partitions(
+                table,
+                interval,
+                timezone.localdate(first),
+                timezone.localdate(last),
+                connection,
+            )
+
+    columns = ", ".join(quote(x.column) for x in model._meta.local_concrete_fields)
+    schema_editor.execute(
+        f"INSERT INTO {quote(table)} ({columns})"
+        f" SELECT {columns} FROM {quote(old_table)}"
+    )
+    schema_editor.execute(f"DROP TABLE {quote(old_table)}")
+    # Created once the rows are copied, like the foreign keys. Statements
+    # already deferred by an earlier operation of the migration are run once.
+    deferred = {}
+    for statement in [
+        *schema_editor.deferred_sql,
+        *schema_editor._model_indexes_sql(model),
+    ]:
+        deferred.setdefault(str(statement), statement)
+    schema_editor.deferred_sql = list(deferred.values())
+
+
+def is_partitioned(table, using=connection):
+    if using.vendor != "postgresql":
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table JOIN pg_class"
+            " ON pg_class.oid = partrelid WHERE relname = %s",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(table, interval, using=connection):
+    """Start of the range of each partition of table, by partition name"""
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = inhrelid"
+            " JOIN pg_class parent ON parent.oid = inhparent"
+            " WHERE parent.relname = %s",
+            [table],
+        )
+        names = [x for x, in cursor.fetchall()]
+
+    starts = {}
+    for name in names:
+        try:
+            starts[name] = datetime.strptime(
+                name.removeprefix(f"{table}_"), NAME_FORMATS[interval]
+            ).date()
+        except ValueError:
+            # Not created by create_partitions, left alone
+            continue
+    return starts
+
+
+def create_partitions(table, interval, first, last, using=connection):
+    """Create the missing partitions of table covering first to last day"""
+    quote = using.ops.quote_name
+    created = []
+    start = range_start(first, interval)
+    existing = partitions(table, interval, using)
+    with using.cursor() as cursor:
+        while start <= last:
+            end = next_range_start(start, interval)
+            if (name := partition_name(table, start, interval)) not in existing:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF"
+                    f" {quote(table)} FOR VALUES FROM (%s) TO (%s)",
+                    [bound(start), bound(end)],
+                )
+                created.append(name)
+            start = end
+    return created
+
+
+def drop_partitions(table, interval, before, detach=False, keep=None, using=connection):
+    """Drop the partitions of table only holding rows older than day before
+
+    Detached partitions are left as tables of their own instead, for archival.
+    Partitions for which keep(name) is true are left alone.
+    """
+    quote = using.ops.quote_name
+    dropped = []
+    for name, start in sorted(partitions(table, interval, using).items()):
+        if next_range_start(start, interval) > before or (keep and keep(name)):
+            continue
+        with using.cursor() as cursor:
+            if detach:
+                cursor.execute(
+                    f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}"
+                )
+            else:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+        dropped.append(name)
+    return dropped
+
+
+def months_before(day, months):
+    """First day of the month `months` months before the month of day"""
+    month = day.year * 12 + day.month - 1 - months
+    return day.replace(year=month // 12, month=month % 12 + 1, day=1)
+
+
+def ensure_partitions(table, interval, days, using=connection):
+    """Create the partitions needed to hold rows of the given days"""
+    if days and is_partitioned(table, using):
+        return create_partitions(table, interval, min(days), max(days), using)
+    return []
+
+
+def insert_partitioned(model, insert, days, using=connection):
+    """Run insert, creating the partitions of days and retrying when it fails
+
+    The first attempt runs in a savepoint so that a missing partition leaves
+    the surrounding transaction usable.
+    """
+    try:
+        with transaction.atomic(using=using.alias):
+            return insert()
+    except DatabaseError:
+        if not ensure_partitions(
+            model._meta.db_table, model.PARTITION_INTERVAL, days, using
+        ):
+            raise
+    return insert()
@@ -0,0 +1,79 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+
+# Stats of the recordings in progress, the context follows the requests into
+# the threads running their synchronous code
+recordings = ContextVar("query_stats_recordings", default=())
+
+
+class QueryStats:
+    """Count and time of the queries run while recording"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = None
+        self.slowest_duration = 0.0
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if self.slowest is None or duration > self.slowest_duration:
+            self.slowest, self.slowest_duration = sql, duration
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper timing the queries for the recordings in progress"""
+    if not (stats := recordings.get()):
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started_at
+        for x in stats:
+            x.add(sql, duration)
+
+
+def install(connection, **kwargs):
+    """Time the queries of connection, connected to connection_created"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@contextmanager
+def record_queries():
+    """Record the queries run in the current context
+
+    Unlike connection.queries this works without DEBUG, follows async code
+    into sync_to_async and only keeps the slowest statement.
+    """
+    install(connection)
+    stats = QueryStats()
+    token = recordings.set((*recordings.get(), stats))
+    try:
+        yield stats
+    finally:
+        recordings.reset(token)
+
+
+@contextmanager
+def max_queries(budget):
+    """Fail with an AssertionError when more than `budget` queries are run
+
+    Meant for tests guarding the query budget of an endpoint:
+
+        with max_queries(4):
+            client.get(f"/api/v1/machines/{machine_id}/queues")
+    """
+    with record_queries() as stats:
+        yield stats
+    if stats.count > budget:
+        raise AssertionError(
+            f"{stats.count} queries were run, the budget is {budget}. Slowest"
+            f" ({stats.slowest_duration * 1000:.1f}ms): {stats.slowest}"
+        )
@@ -0,0 +1,63 @@
+import re
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Types orjson does not encode natively, like timedeltas and decimals, are
+# handed to the encoder of DRF
+drf_encoder = JSONEncoder()
+drf_renderer = JSONRenderer()
+
+# orjson writes the floats the standard library writes with an exponent
+# differently, e.g. 1e16 and 0.00001 instead of 1e+16 and 1e-05. Outputs that
+# may hold such a float, possibly within a string, are encoded by DRF instead.
+EXPONENT = re.compile(rb"e-?\d+(?:[,\]}]|\Z)")
+
+
+def render_json(data):
+    """Encode data to the same bytes as the JSON renderer of DRF
+
+    orjson writes UUIDs and datetimes itself, in the format of DRF with UTC
+    datetimes ending with Z. Like DRF, the line and paragraph separators are
+    escaped. Without orjson, the encoder of DRF is used.
+    """
+    if orjson is not None:
+        try:
+            content = orjson.dumps(
+                data,
+                default=drf_encoder.default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits, left to the standard library
+            pass
+        else:
+            if b"0.0000" not in content and not EXPONENT.search(content):
+                if b"\xe2\x80" in content:
+                    content = content.replace(b"\xe2\x80\xa8", b"\\u2028")
+                    content = content.replace(b"\xe2\x80\xa9", b"\\u2029")
+                return content
+    return drf_renderer.render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer encoding with orjson
+
+    Falls back to the renderer of DRF when an indented output is requested or
+    the JSON settings of DRF are not the compact, UTF-8 defaults.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return render_json(data)
@@ -0,0 +1,75 @@
+from .models import FieldQueue
+
+# Serialization of the listings straight from value tuples, without building
+# model instances. The output matches the serialize() methods of the models,
+# key for key and in the same order.
+
+QUEUE_FIELDS = tuple(x for x in FieldQueue.SERIALIZED_FIELDS if x != "items")
+ITEM_FIELDS = ("id", "field_id", "status", "started_at", "completed_at", "created_at")
+HISTORY_FIELDS = ("queue_id", "queue__machine_id", "position", *ITEM_FIELDS)
+
+
+def item_rows(rows):
+    """Serialize item rows of ITEM_FIELDS in rank order, numbering their positions"""
+    return [
+        {
+            "id": row[0],
+            "field_id": row[1],
+            "position": position,
+            "status": row[2],
+            "started_at": row[3],
+            "completed_at": row[4],
+            "created_at": row[5],
+        }
+        for position, row in enumerate(rows)
+    ]
+
+
+def serialize_items(items):
+    """Serialize the items of a queue in order, like FieldQueue.serialize_items"""
+    return item_rows(items.order_by("rank").values_list(*ITEM_FIELDS))
+
+
+def serialize_queues(queues, items, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Serialize the queues with their items, like FieldQueue.serialize
+
+    Only the requested fields are selected and the items are only read when
+    requested, in a single query from items, which may narrow them down, e.g.
+    to the partitions of the queues.
+    """
+    # The id goes first, it keys the items
+    columns = ["id", *(x for x in QUEUE_FIELDS if x in fields and x != "id")]
+    rows = list(queues.values_list(*columns))
+    if "items" not in fields:
+        return [dict(zip(columns, row)) for row in rows]
+
+    queue_items = {row[0]: [] for row in rows}
+    # The queue is the last column so the rows fit item_rows as they are
+    for row in (
+        items.filter(queue_id__in=queue_items)
+        .order_by("rank")
+        .values_list(*ITEM_FIELDS, "queue_id")
+    ):
+        queue_items[row[-1]].append(row)
+
+    return [
+        dict(zip(columns, row), items=item_rows(queue_items[row[0]])) for row in rows
+    ]
+
+
+def history_rows(rows):
+    """Serialize item rows of HISTORY_FIELDS along with their queue"""
+    return [
+        {
+            "queue_id": row[0],
+            "machine_id": row[1],
+            "id": row[3],
+            "field_id": row[4],
+            "position": row[2],
+            "status": row[5],
+            "started_at": row[6],
+            "completed_at": row[7],
+            "created_at": row[8],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_cache():
+    return caches[settings.TELEMETRY_CACHE_ALIAS]
+
+
+def cache_key(machine_id):
+    return f"telem:{machine_id}"
+
+
+def telem_state(telem):
+    """Reduce a telemetry payload to the values that drive queue progression"""
+    return (
+        str(telem.get("state", "")).lower(),
+        str(telem.get("current_queue") or ""),
+        str(telem.get("current_field") or ""),
+        str(telem.get("previous_field") or ""),
+    )
+
+
+def seen_telem(telems):
+    """Return the machine ids whose telemetry is identical to the last one handled
+
+    `telems` maps machine ids to telemetry payloads.
+    """
+    cached = get_cache().get_many([cache_key(x) for x in telems])
+    return {
+        machine_id
+        for machine_id, telem in telems.items()
+        if cached.get(cache_key(machine_id)) == telem_state(telem)
+    }
+
+
+def remember_telem(telems):
+    """Store the last handled telemetry state of each machine"""
+    get_cache().set_many(
+        {
+            cache_key(machine_id): telem_state(telem)
+            for machine_id, telem in telems.items()
+        },
+        timeout=settings.TELEMETRY_CACHE_TIMEOUT,
+    )
+
+
+async def aseen_telem(telems):
+    """Async version of `seen_telem`"""
+    cached = await get_cache().aget_many([cache_key(x) for x in telems])
+    return {
+        machine_id
+        for machine_id, telem in telems.items()
+        if cached.get(cache_key(machine_id)) == telem_state(telem)
+    }
+
+
+async def aremember_telem(telems):
+    """Async version of `remember_telem`"""
+    await get_cache().aset_many(
+        {
+            cache_key(machine_id): telem_state(telem)
+            for machine_id, telem in telems.items()
+        },
+        timeout=settings.TELEMETRY_CACHE_TIMEOUT,
+    )
+
+
+def forget_telem(machine_id):
+    """Drop the cached telemetry state of a machine once the transaction commits"""
+    transaction.on_commit(lambda: get_cache().delete(cache_key(machine_id)))
+
+
+def forget_telems(machine_ids):
+    """Bulk version of `forget_telem`"""
+    keys = [cache_key(x) for x in machine_ids]
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
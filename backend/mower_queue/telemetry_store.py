@@ -0,0 +1,188 @@
+import atexit
+import csv
+import io
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.utils import timezone
+
+from .metrics import telemetry_dropped, telemetry_flush_duration, telemetry_stored
+from .models import MachineTelemetry, is_uuid
+from .partitions import ensure_partitions
+
+COLUMNS = [
+    "id",
+    "recorded_at",
+    "machine_id",
+    "state",
+    "queue_id",
+    "field_id",
+    "timestamp",
+]
+
+
+def telemetry_record(machine_id, telem):
+    """Row of the telemetry history for a telemetry payload"""
+    try:
+        timestamp = datetime.fromtimestamp(
+            float(telem["timestamp"]), tz=dt_timezone.utc
+        )
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        timestamp = None
+    return (
+        uuid.uuid4(),
+        timezone.now(),
+        machine_id,
+        str(telem.get("state") or "")[:20],
+        telem.get("current_queue") if is_uuid(telem.get("current_queue")) else None,
+        telem.get("current_field") if is_uuid(telem.get("current_field")) else None,
+        timestamp,
+    )
+
+
+def write_telemetry(records):
+    """Insert records with COPY on PostgreSQL, multi-row INSERTs elsewhere
+
+    COPY reads unquoted empty CSV fields as NULL, FORCE_NOT_NULL keeps an empty
+    state an empty string.
+    """
+    if connection.vendor == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow(
+                "" if x is None else x.isoformat() if isinstance(x, datetime) else x
+                for x in record
+            )
+        buffer.seek(0)
+        # copy_expert is not wrapped by Django, its errors are raised as the
+        # DatabaseError of Django like those of the other queries
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(MachineTelemetry._meta.db_table)}"
+                f" ({', '.join(COLUMNS)}) FROM STDIN"
+                " WITH (FORMAT csv, FORCE_NOT_NULL (state))",
+                buffer,
+            )
+    else:
+        MachineTelemetry.objects.bulk_create(
+            [MachineTelemetry(**dict(zip(COLUMNS, x))) for x in records],
+            batch_size=1000,
+        )
+
+
+class TelemetryBuffer:
+    """Telemetry waiting to be written to the history in bulk
+
+    Records are flushed by a background thread once `flush_size` records are
+    waiting or every `flush_interval` seconds. At most `max_records` are held,
+    newer records are dropped while the database falls behind.
+    """
+
+    def __init__(self, flush_size, flush_interval, max_records):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self._records = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def add(self, machine_id, telem):
+        record = telemetry_record(machine_id, telem)
+        with self._lock:
+            if self._closed or len(self._records) >= self.max_records:
+                telemetry_dropped.inc()
+                return
+            self._records.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="telemetry-buffer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+            if len(self._records) >= self.flush_size:
+                self._wake_up.set()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                self._wake_up.wait(self.flush_interval)
+                self._wake_up.clear()
+                self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """Write the waiting records"""
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+            for i in range(0, len(records), self.flush_size):
+                self._write(records[i : i + self.flush_size])
+
+    def _write(self, records):
+        connection.close_if_unusable_or_obsolete()
+        started_at = time.perf_counter()
+        try:
+            self._write_partitioned(records)
+        except DatabaseError as e:
+            # A single bad record fails the whole batch, the records are then
+            # written one by one so that only the bad ones are dropped
+            print(
+                f"[Telemetry history] Writing {len(records)} records one by one:"
+                f" {e}"
+            )
+            stored = 0
+            for record in records:
+                try:
+                    self._write_partitioned([record])
+                    stored += 1
+                except DatabaseError as e:
+                    telemetry_dropped.inc()
+                    print(f"[Telemetry history] Dropped record {record[0]}: {e}")
+            telemetry_stored.inc(stored)
+            return
+        telemetry_flush_duration.observe(time.perf_counter() - started_at)
+        telemetry_stored.inc(len(records))
+
+    def _write_partitioned(self, records):
+        try:
+            write_telemetry(records)
+        except DatabaseError:
+            # The partition of the day may be missing, create it and retry
+            if not ensure_partitions(
+                MachineTelemetry._meta.db_table,
+                MachineTelemetry.PARTITION_INTERVAL,
+                {timezone.localdate(x[1]) for x in records},
+            ):
+                raise
+            write_telemetry(records)
+
+    def close(self):
+        """Stop the background thread and write the remaining records"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake_up.set()
+        if thread and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+
+telemetry_buffer = TelemetryBuffer(
+    settings.TELEMETRY_FLUSH_SIZE,
+    settings.TELEMETRY_FLUSH_INTERVAL,
+    settings.TELEMETRY_BUFFER_MAX_RECORDS,
+)
+
+
+def store_telemetry(machine_id, telem):
+    """Queue telemetry for the history, never blocks on the database"""
+    telemetry_buffer.add(machine_id, telem)
@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+
+from ..models import FieldQueue, Machine
+
+
+class ActiveQueueTests(TestCase):
+    """A machine has at most one active queue"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+
+    def path(self, queue):
+        return f"/api/v1/machines/{self.machine.id}/queues/{queue.id}"
+
+    def statuses(self, *queues):
+        return [FieldQueue.objects.get(id=x.id).status for x in queues]
+
+    def active_queue_id(self):
+        self.machine.refresh_from_db()
+        return self.machine.active_queue_id
+
+    def test_unique_active_queue(self):
+        FieldQueue.objects.create(machine=self.machine)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FieldQueue.objects.create(machine=self.machine)
+
+        # Only the active queues are constrained
+        FieldQueue.objects.create(machine=self.machine, status="paused")
+        FieldQueue.objects.create(machine=self.machine, status="paused")
+        other = Machine.objects.create(name="Other")
+        FieldQueue.objects.create(machine=other)
+
+    def test_add_queue(self):
+        first = self.machine.add_queue([1, 2])
+        self.assertEqual(first.status, "active")
+        self.assertEqual(self.active_queue_id(), first.id)
+
+        # Created paused, along with its items, as the first queue is active
+        second = self.machine.add_queue([3])
+        self.assertEqual(self.statuses(first, second), ["active", "paused"])
+        self.assertEqual(list(second.items.values_list("field_id", flat=True)), [3])
+        self.assertEqual(self.active_queue_id(), first.id)
+
+    def test_start_pauses_the_active_queue(self):
+        first = self.machine.add_queue([1])
+        second = self.machine.add_queue([2])
+
+        response = self.client.post(f"{self.path(second)}/start")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(first, second), ["paused", "active"])
+        self.assertEqual(self.active_queue_id(), second.id)
+
+        response = self.client.post(f"{self.path(first)}/resume")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(first, second), ["active", "paused"])
+        self.assertEqual(self.active_queue_id(), first.id)
+
+    def test_inactive_queues_clear_the_machine(self):
+        queue = self.machine.add_queue([1])
+        self.client.post(f"{self.path(queue)}/pause")
+        self.assertIsNone(self.active_queue_id())
+
+        self.client.post(f"{self.path(queue)}/resume")
+        self.assertEqual(self.active_queue_id(), queue.id)
+        self.client.post(f"{self.path(queue)}/terminate")
+        self.assertIsNone(self.active_queue_id())
+
+        self.client.post(f"{self.path(queue)}/resume")
+        self.assertEqual(self.active_queue_id(), queue.id)
+        item = queue.next_item()
+        queue.next_item(previous_item_id=str(item.id))
+        self.assertEqual(self.statuses(queue), ["completed"])
+        self.assertIsNone(self.active_queue_id())
+
+    @mock.patch("mower_queue.views.deliver_now", new_callable=mock.AsyncMock)
+    def test_bulk_resume(self, deliver_now):
+        first = self.machine.add_queue([1])
+        second = self.machine.add_queue([2])
+        self.client.post(f"{self.path(first)}/pause")
+
+        # Only the newest paused queue of the machine is resumed
+        response = self.client.post(
+            "/api/v1/queues/control",
+            {"action": "resume", "machine_ids": [str(self.machine.id)]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [x["id"] for x in response.json()["data"]["queues"]], [str(second.id)]
+        )
+        self.assertEqual(self.statuses(first, second), ["paused", "active"])
+        self.assertEqual(self.active_queue_id(), second.id)
+
+        # Not while another queue of the machine is active
+        response = self.client.post(
+            "/api/v1/queues/control",
+            {"action": "resume", "queue_ids": [str(first.id)]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["data"]["queues"], [])
+        self.assertEqual(self.statuses(first, second), ["paused", "active"])
+
+    def test_concurrent_activation(self):
+        queue = self.machine.add_queue([1])
+        self.client.post(f"{self.path(queue)}/pause")
+
+        # Raised by the index when another queue was activated meanwhile
+        with mock.patch.object(
+            FieldQueue, "update_machine", side_effect=IntegrityError
+        ):
+            response = self.client.post(f"{self.path(queue)}/resume")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.statuses(queue), ["paused"])
+        self.assertIsNone(self.active_queue_id())
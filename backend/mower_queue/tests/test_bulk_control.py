@@ -0,0 +1,116 @@
+from unittest import mock
+
+import httpx
+from django.test import TestCase
+
+from ..dispatcher import CommandRejected
+from ..models import FieldQueue, Machine, MachineCommand
+
+
+class BulkControlTests(TestCase):
+    """Many queues are paused, resumed or terminated in one request"""
+
+    def setUp(self):
+        self.machines = [Machine.objects.create(name=f"Machine {i}") for i in range(3)]
+        self.queues = [x.add_queue([1, 2]) for x in self.machines]
+
+    def control(self, data):
+        return self.client.post(
+            "/api/v1/queues/control", data, content_type="application/json"
+        )
+
+    def statuses(self):
+        return [FieldQueue.objects.get(id=x.id).status for x in self.queues]
+
+    def deliveries(self, response):
+        machines = {str(x.id): i for i, x in enumerate(self.machines)}
+        return {
+            machines[x["machine_id"]]: x["delivery"]
+            for x in response.json()["data"]["machines"]
+        }
+
+    @mock.patch("mower_queue.views.deliver_now", new_callable=mock.AsyncMock)
+    def test_selectors(self, deliver_now):
+        response = self.control(
+            {
+                "action": "pause",
+                "machine_ids": [str(x.id) for x in self.machines[:2]],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "Paused 2 queues")
+        self.assertEqual(self.statuses(), ["paused", "paused", "active"])
+
+        response = self.control(
+            {"action": "terminate", "queue_ids": [str(self.queues[0].id)]}
+        )
+        self.assertEqual(
+            [x["id"] for x in response.json()["data"]["queues"]],
+            [str(self.queues[0].id)],
+        )
+        self.assertEqual(self.statuses(), ["terminated", "paused", "active"])
+
+        # Only the queues the action applies to are changed
+        response = self.control({"action": "resume", "all": True})
+        self.assertEqual(response.json()["message"], "Active 1 queues")
+        self.assertEqual(self.statuses(), ["terminated", "active", "active"])
+
+        self.assertEqual(
+            list(
+                MachineCommand.objects.order_by("id").values_list("command", flat=True)
+            ),
+            ["pause", "pause", "stop", "resume"],
+        )
+
+    def test_deliveries(self):
+        first, second, third = [str(x.id) for x in self.machines]
+
+        async def deliver(transport, command):
+            if str(command.machine_id) == second:
+                raise CommandRejected("HTTP Error 409")
+            if str(command.machine_id) == third:
+                raise httpx.ConnectError("Connection refused")
+
+        with mock.patch("mower_queue.dispatcher.deliver", deliver):
+            response = self.control({"action": "pause", "all": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.deliveries(response), {0: "delivered", 1: "failed", 2: "retrying"}
+        )
+        errors = {
+            x["machine_id"]: x["error"] for x in response.json()["data"]["machines"]
+        }
+        self.assertEqual(errors[first], None)
+        self.assertEqual(errors[second], "HTTP Error 409")
+        self.assertEqual(errors[third], "Connection refused")
+
+    def test_busy_machines_are_left_to_the_dispatcher(self):
+        # Commands reach a machine in order, after the ones still pending
+        MachineCommand.objects.create(machine=self.machines[0], command="pause")
+
+        with mock.patch(
+            "mower_queue.dispatcher.deliver", new_callable=mock.AsyncMock
+        ) as deliver:
+            response = self.control({"action": "terminate", "all": True})
+        self.assertEqual(
+            self.deliveries(response), {0: "queued", 1: "delivered", 2: "delivered"}
+        )
+        self.assertEqual(
+            {str(x.args[1].machine_id) for x in deliver.call_args_list},
+            {str(x.id) for x in self.machines[1:]},
+        )
+
+    def test_invalid_requests(self):
+        queue_ids = [str(self.queues[0].id)]
+        for data in [
+            {"action": "stop", "all": True},
+            {"action": "pause"},
+            {"action": "pause", "all": True, "queue_ids": queue_ids},
+            {"action": "pause", "all": "yes"},
+            {"action": "pause", "queue_ids": str(self.queues[0].id)},
+            {"action": "pause", "machine_ids": ["not-a-uuid"]},
+            ["pause"],
+        ]:
+            response = self.control(data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(self.statuses(), ["active"] * 3)
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Machine, MachineDailyStats
+
+STARTED_AT = datetime(2026, 6, 1, 8, 0, tzinfo=dt_timezone.utc)
+COMPLETED_AT = STARTED_AT + timedelta(minutes=30)
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class DailyStatsTests(TestCase):
+    """The daily stats follow the items completed and skipped"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3])
+        self.path = f"/api/v1/machines/{self.machine.id}/queues/{self.queue.id}"
+
+    def telem(self, timestamp, previous_field=""):
+        response = self.client.post(
+            f"/api/v1/machines/{self.machine.id}/incoming_machine_telem",
+            {
+                "state": "Idle",
+                "current_queue": str(self.queue.id),
+                "current_field": "",
+                "previous_field": previous_field,
+                "timestamp": timestamp.timestamp(),
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def skip(self):
+        return self.client.post(f"{self.path}/skip")
+
+    def stats(self, day=STARTED_AT.date()):
+        response = self.client.get(
+            "/api/v1/stats/daily",
+            {"machine_id": str(self.machine.id), "from": day.isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]
+
+    def test_complete_and_skip(self, store_telemetry):
+        first = self.queue.items.order_by("rank").first()
+        self.telem(STARTED_AT)
+        self.telem(COMPLETED_AT, str(first.id))
+        self.assertEqual(self.skip().status_code, 200)
+
+        self.assertEqual(
+            self.stats(),
+            [
+                {
+                    "machine_id": str(self.machine.id),
+                    "day": "2026-06-01",
+                    "fields_completed": 1,
+                    "fields_skipped": 1,
+                    "mowing_time": 1800.0,
+                    "queues_touched": 1,
+                }
+            ],
+        )
+
+    def test_repeated_skips(self, store_telemetry):
+        # The next fields are started at the time of the server
+        self.queue.next_item()
+        for _ in range(3):
+            self.assertEqual(self.skip().status_code, 200)
+        # Nothing left in progress
+        self.assertEqual(self.skip().status_code, 422)
+
+        (stats,) = self.stats(timezone.localdate())
+        self.assertEqual(stats["fields_skipped"], 3)
+        self.assertEqual(stats["fields_completed"], 0)
+
+    def test_rebuild(self, store_telemetry):
+        first = self.queue.items.order_by("rank").first()
+        self.telem(STARTED_AT)
+        self.telem(COMPLETED_AT, str(first.id))
+        self.skip()
+        incremental = self.stats()
+
+        MachineDailyStats.objects.all().delete()
+        with mock.patch("builtins.print"):
+            call_command("rebuild_daily_stats")
+        self.assertEqual(self.stats(), incremental)
@@ -0,0 +1,156 @@
+from unittest import mock
+
+from django.db import models
+from django.test import TestCase
+
+from ..models import FieldQueue, Machine, VersionConflict
+
+
+def bump(queue_id):
+    """Change the queue behind the back of an edit in progress
+
+    Run on the connection of the edit, the change is rolled back along with the
+    attempt it fails, unlike the change of a concurrent transaction.
+    """
+    FieldQueue.objects.filter(id=queue_id).update(version=models.F("version") + 1)
+
+
+class EditConflictTests(TestCase):
+    """Edits based on an outdated queue are refused or retried"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3])
+        self.path = f"/api/v1/machines/{self.machine.id}/queues/{self.queue.id}/items"
+
+    def version(self):
+        return FieldQueue.objects.values_list("version", flat=True).get(
+            id=self.queue.id
+        )
+
+    def field_ids(self):
+        return list(
+            self.queue.items.order_by("rank").values_list("field_id", flat=True)
+        )
+
+    def item_ids(self):
+        return [
+            str(x)
+            for x in self.queue.items.order_by("rank").values_list("id", flat=True)
+        ]
+
+    def test_if_match(self):
+        etag = self.client.get(self.path)["ETag"]
+        response = self.client.post(
+            self.path,
+            {"field_id": 4},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["ETag"], f'"{self.queue.id}-{self.version()}"')
+
+        # Based on the queue before the item was added
+        response = self.client.post(
+            self.path,
+            {"field_id": 5},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["version"], self.version())
+        self.assertEqual(response["ETag"], f'"{self.queue.id}-{self.version()}"')
+        self.assertEqual(self.field_ids(), [1, 2, 3, 4])
+
+        # Weak ETags are accepted too
+        response = self.client.patch(
+            f"{self.path}/{self.item_ids()[3]}",
+            {"position": 0},
+            content_type="application/json",
+            HTTP_IF_MATCH=f'W/"{self.queue.id}-{self.version()}"',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.field_ids(), [4, 1, 2, 3])
+
+    def test_payload_version(self):
+        version = self.version()
+        response = self.client.patch(
+            f"{self.path}/order",
+            {"field_ids": self.item_ids()[::-1], "version": version},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.delete(
+            self.path,
+            {"field_ids": self.item_ids()[:1], "version": version},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.field_ids(), [3, 2, 1])
+
+    def test_invalid_versions(self):
+        for headers, data in [
+            ({"HTTP_IF_MATCH": '"other-1"'}, {"field_id": 4}),
+            ({}, {"field_id": 4, "version": "1"}),
+            ({}, {"field_id": 4, "version": 0}),
+        ]:
+            response = self.client.post(
+                self.path, data, content_type="application/json", **headers
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.field_ids(), [1, 2, 3])
+
+    def test_concurrent_edit_is_retried(self):
+        set_ranks = FieldQueue.set_ranks
+        calls = []
+
+        def racing(queue, item_ids):
+            calls.append(queue.version)
+            if len(calls) == 1:
+                bump(queue.id)
+            return set_ranks(queue, item_ids)
+
+        version = self.version()
+        with mock.patch.object(FieldQueue, "set_ranks", racing):
+            self.queue.reorder_items(self.item_ids()[::-1])
+
+        self.assertEqual(calls, [version, version])
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(self.queue.version, version + 1)
+        self.assertEqual(self.field_ids(), [3, 2, 1])
+
+    def test_retries_are_bounded(self):
+        set_ranks = FieldQueue.set_ranks
+        calls = []
+
+        def racing(queue, item_ids):
+            calls.append(queue.version)
+            bump(queue.id)
+            return set_ranks(queue, item_ids)
+
+        with mock.patch.object(FieldQueue, "set_ranks", racing):
+            with self.assertRaises(VersionConflict) as cm:
+                self.queue.reorder_items(self.item_ids()[::-1])
+
+        self.assertEqual(len(calls), FieldQueue.EDIT_ATTEMPTS)
+        self.assertEqual(cm.exception.version, self.version() + 1)
+        self.assertEqual(self.field_ids(), [1, 2, 3])
+
+    def test_expected_version_is_not_retried(self):
+        set_ranks = FieldQueue.set_ranks
+        calls = []
+
+        def racing(queue, item_ids):
+            calls.append(queue.version)
+            bump(queue.id)
+            return set_ranks(queue, item_ids)
+
+        version = self.version()
+        with mock.patch.object(FieldQueue, "set_ranks", racing):
+            with self.assertRaises(VersionConflict):
+                self.queue.reorder_items(self.item_ids()[::-1], version)
+
+        self.assertEqual(calls, [version])
+        self.assertEqual(self.version(), version)
+        self.assertEqual(self.field_ids(), [1, 2, 3])
@@ -0,0 +1,100 @@
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+
+from ..async_views import stream_events
+from ..events import EventHub, hub
+from ..models import Machine
+
+
+def parse_event(chunk):
+    """Name and data of a Server-Sent Event"""
+    fields = dict(line.split(": ", 1) for line in chunk.decode().strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+class QueueEventTests(TestCase):
+    """The changes of a queue are streamed as Server-Sent Events"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2])
+        self.path = f"/api/v1/machines/{self.machine.id}/queues/{self.queue.id}/events"
+
+    def committed(self, change):
+        """Run change and publish its events as if its transaction committed"""
+
+        def run():
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+
+        return sync_to_async(run)()
+
+    async def test_stream(self):
+        response = await self.async_client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+
+        try:
+            event, data = parse_event(await anext(stream))
+            self.assertEqual(event, "snapshot")
+            self.assertEqual(data["id"], str(self.queue.id))
+            self.assertEqual([x["field_id"] for x in data["items"]], [1, 2])
+
+            await self.committed(self.queue.next_item)
+            event, data = parse_event(await anext(stream))
+            self.assertEqual(event, "item")
+            self.assertEqual((data["field_id"], data["status"]), (1, "in_progress"))
+
+            await self.committed(lambda: self.queue.update_status("paused"))
+            event, data = parse_event(await anext(stream))
+            self.assertEqual(event, "queue")
+            self.assertEqual(data["status"], "paused")
+        finally:
+            await stream.aclose()
+
+    @override_settings(EVENTS_KEEPALIVE_INTERVAL=0.01)
+    async def test_keepalive(self):
+        response = await self.async_client.get(self.path)
+        stream = response.streaming_content
+        try:
+            await anext(stream)
+            self.assertEqual(await anext(stream), b": keepalive\n\n")
+        finally:
+            await stream.aclose()
+
+    async def test_closed_stream_unsubscribes(self):
+        stream = stream_events(hub.subscribe(str(self.queue.id)), "{}")
+        self.assertEqual(await anext(stream), "event: snapshot\ndata: {}\n\n")
+        await stream.aclose()
+        self.assertFalse(hub.has_subscribers(str(self.queue.id)))
+
+    async def test_unknown_queue(self):
+        queue_id = uuid.uuid4()
+        response = await self.async_client.get(
+            f"/api/v1/machines/{self.machine.id}/queues/{queue_id}/events"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(hub.has_subscribers(str(queue_id)))
+
+
+class EventHubTests(TestCase):
+    async def test_slow_subscriber_is_closed(self):
+        events = EventHub(max_queued=2)
+        subscription = events.subscribe("topic")
+        for i in range(3):
+            events.publish("topic", "event", i)
+        # Handed over to the loop of the subscriber
+        self.assertEqual(await subscription.get(1), None)
+        self.assertTrue(subscription.closed)
+
+    async def test_data_is_only_built_for_subscribers(self):
+        events = EventHub()
+        events.publish("topic", "event", lambda: self.fail("built"))
+
+        subscription = events.subscribe("topic")
+        events.publish("topic", "event", lambda: {"id": 1})
+        self.assertEqual(await subscription.get(1), ("event", '{"id": 1}'))
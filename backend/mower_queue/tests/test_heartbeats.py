@@ -0,0 +1,88 @@
+import time
+from unittest import mock
+
+from django.test import TestCase
+
+from ..models import FieldQueue, Machine, MachineCommand
+from ..query_stats import max_queries
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class HeartbeatTests(TestCase):
+    """Heartbeats identical to the previous one are answered from the cache"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3])
+        self.path = f"/api/v1/machines/{self.machine.id}/incoming_machine_telem"
+
+    def telem(self, previous_field=""):
+        return {
+            "state": "Idle",
+            "current_queue": str(self.queue.id),
+            "current_field": "",
+            "previous_field": previous_field,
+            "timestamp": time.time(),
+        }
+
+    def post(self, telem):
+        response = self.client.post(self.path, telem, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["message"]
+
+    def version(self):
+        return FieldQueue.objects.values_list("version", flat=True).get(
+            id=self.queue.id
+        )
+
+    def commands(self):
+        return MachineCommand.objects.filter(machine=self.machine).count()
+
+    def test_repeated_heartbeat(self, store_telemetry):
+        self.assertIn("can start mowing", self.post(self.telem()))
+        version, commands = self.version(), self.commands()
+
+        # Only the timestamp changed
+        with max_queries(0):
+            self.assertEqual(self.post(self.telem()), "No action required")
+        self.assertEqual(self.version(), version)
+        self.assertEqual(self.commands(), commands)
+        # Still written to the telemetry history
+        self.assertEqual(store_telemetry.call_count, 2)
+
+    def test_changed_heartbeat(self, store_telemetry):
+        self.post(self.telem())
+        first = self.queue.items.order_by("rank").first()
+
+        self.assertIn("can start mowing", self.post(self.telem(str(first.id))))
+        first.refresh_from_db()
+        self.assertEqual(first.status, "completed")
+
+    def test_api_changes_forget_the_heartbeat(self, store_telemetry):
+        self.post(self.telem())
+        commands = self.commands()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/v1/machines/{self.machine.id}/queues/{self.queue.id}/skip"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # The machine is sent the field that replaced the skipped one again
+        self.assertIn("can start mowing", self.post(self.telem()))
+        self.assertEqual(self.commands(), commands + 2)
+
+    def test_fleet_heartbeats(self, store_telemetry):
+        telemetry = [{"machine_id": str(self.machine.id), **self.telem()}]
+        for message in ["can start mowing", "No action required"]:
+            response = self.client.post(
+                "/api/v1/telemetry/batch",
+                {"telemetry": telemetry},
+                content_type="application/json",
+            )
+            (result,) = response.json()["data"]
+            self.assertEqual(result["status"], 200)
+            self.assertIn(message, result["message"])
+
+        # Shared with the heartbeats sent on their own
+        self.assertEqual(self.post(self.telem()), "No action required")
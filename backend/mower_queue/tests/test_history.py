@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import TestCase
+
+from ..models import Machine
+
+MONDAY = datetime(2026, 6, 1, 8, 0, tzinfo=dt_timezone.utc)
+TUESDAY = MONDAY + timedelta(days=1)
+
+
+class HistoryTests(TestCase):
+    """The history lists the items mowed in a time window, page by page"""
+
+    def setUp(self):
+        self.first = Machine.objects.create(name="First")
+        self.second = Machine.objects.create(name="Second")
+        self.first_queue = self.first.add_queue([1, 2, 3, 4, 5])
+        self.second_queue = self.second.add_queue([6, 7, 8])
+
+        # The first machine mowed two fields on Monday and started a third on
+        # Tuesday, the second one skipped its first field on Tuesday
+        item = self.first_queue.next_item(timestamp=MONDAY.timestamp())
+        item = self.first_queue.next_item(
+            timestamp=(MONDAY + timedelta(hours=1)).timestamp(),
+            previous_item_id=str(item.id),
+        )
+        self.first_queue.next_item(
+            timestamp=TUESDAY.timestamp(), previous_item_id=str(item.id)
+        )
+        self.second_queue.next_item(timestamp=TUESDAY.timestamp())
+        self.client.post(
+            f"/api/v1/machines/{self.second.id}/queues/{self.second_queue.id}/skip"
+        )
+
+    def get(self, **params):
+        response = self.client.get("/api/v1/history", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def field_ids(self, **params):
+        return sorted(x["field_id"] for x in self.get(**params)["data"])
+
+    def test_cursor_round_trip(self):
+        expected = [x["id"] for x in self.get(limit=500)["data"]]
+        self.assertEqual(len(expected), 8)
+
+        ids = []
+        params = {"limit": 3}
+        while True:
+            page = self.get(**params)
+            self.assertLessEqual(len(page["data"]), 3)
+            ids += [x["id"] for x in page["data"]]
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+        self.assertEqual(ids, expected)
+
+        # The filters apply to every page
+        params = {"limit": 2, "machine_id": str(self.first.id)}
+        page = self.get(**params)
+        page = self.get(**params, cursor=page["next_cursor"])
+        self.assertEqual({x["machine_id"] for x in page["data"]}, {str(self.first.id)})
+
+    def test_filters(self):
+        self.assertEqual(self.field_ids(machine_id=str(self.second.id)), [6, 7, 8])
+        self.assertEqual(self.field_ids(status="completed"), [1, 2])
+        self.assertEqual(self.field_ids(status="completed,skipped"), [1, 2, 6])
+        self.assertEqual(
+            self.field_ids(
+                started_after=MONDAY.isoformat(), started_before="2026-06-02"
+            ),
+            [1, 2],
+        )
+        self.assertEqual(self.field_ids(started_after="2026-06-02"), [3, 6, 7])
+        self.assertEqual(
+            self.field_ids(completed_before=(MONDAY + timedelta(hours=2)).isoformat()),
+            [1],
+        )
+
+    def test_summary(self):
+        summary = {
+            x["machine_id"]: x for x in self.get(started_after="2026-06-02")["summary"]
+        }
+        self.assertEqual(
+            summary[str(self.first.id)],
+            {
+                "machine_id": str(self.first.id),
+                "queue_id": str(self.first_queue.id),
+                "queue_status": "active",
+                "completed": 2,
+                "skipped": 0,
+                "in_progress": 1,
+                "pending": 2,
+                "last_position": 2,
+            },
+        )
+        second = summary[str(self.second.id)]
+        self.assertEqual(
+            [second[x] for x in ["skipped", "in_progress", "pending"]], [1, 1, 1]
+        )
+        self.assertEqual(second["last_position"], 1)
+
+    def test_invalid_parameters(self):
+        for params in [
+            {"limit": 0},
+            {"limit": "many"},
+            {"cursor": "not-a-cursor"},
+            {"machine_id": "not-a-uuid"},
+            {"started_after": "monday"},
+        ]:
+            response = self.client.get("/api/v1/history", params)
+            self.assertEqual(response.status_code, 400, params)
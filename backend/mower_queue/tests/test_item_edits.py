@@ -0,0 +1,111 @@
+from django.test import TestCase
+
+from ..models import Machine
+from ..query_stats import record_queries
+
+
+class ItemEditTests(TestCase):
+    """Items are removed and reordered with set-based statements"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3, 4, 5])
+
+    def path(self, queue=None):
+        queue = queue or self.queue
+        return f"/api/v1/machines/{self.machine.id}/queues/{queue.id}/items"
+
+    def item_ids(self, queue=None):
+        queue = queue or self.queue
+        return [
+            str(x) for x in queue.items.order_by("rank").values_list("id", flat=True)
+        ]
+
+    def field_ids(self):
+        return list(
+            self.queue.items.order_by("rank").values_list("field_id", flat=True)
+        )
+
+    def remove(self, item_ids, queue=None):
+        return self.client.delete(
+            self.path(queue),
+            {"field_ids": item_ids},
+            content_type="application/json",
+        )
+
+    def reorder(self, item_ids, queue=None):
+        return self.client.patch(
+            f"{self.path(queue)}/order",
+            {"field_ids": item_ids},
+            content_type="application/json",
+        )
+
+    def test_remove_items(self):
+        item_ids = self.item_ids()
+        response = self.remove([item_ids[1], item_ids[3]])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.field_ids(), [1, 3, 5])
+
+        # The remaining items close the gaps
+        response = self.client.get(self.path())
+        self.assertEqual(
+            [(x["field_id"], x["position"]) for x in response.json()["data"]],
+            [(1, 0), (3, 1), (5, 2)],
+        )
+
+    def test_remove_unknown_items(self):
+        other = self.machine.add_queue([6])
+        for item_ids in [
+            [self.item_ids()[0], "not-a-uuid"],
+            [self.item_ids()[0], self.item_ids(other)[0]],
+        ]:
+            response = self.remove(item_ids)
+            self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.field_ids(), [1, 2, 3, 4, 5])
+
+        self.assertEqual(self.remove([]).status_code, 400)
+
+    def test_reorder_items(self):
+        self.queue.next_item()
+        item_ids = self.item_ids()
+        new_order = [item_ids[x] for x in [4, 0, 2, 1, 3]]
+
+        response = self.reorder(new_order)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([x["id"] for x in data], new_order)
+        self.assertEqual([x["position"] for x in data], [0, 1, 2, 3, 4])
+        self.assertEqual(self.field_ids(), [5, 1, 3, 2, 4])
+
+        # The item being mowed keeps its status
+        self.assertEqual(data[1]["status"], "in_progress")
+
+    def test_invalid_orders(self):
+        item_ids = self.item_ids()
+        other = self.machine.add_queue([6])
+        for new_order in [
+            item_ids[:-1],
+            item_ids + item_ids[:1],
+            item_ids[:-1] + self.item_ids(other),
+        ]:
+            response = self.reorder(new_order)
+            self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.field_ids(), [1, 2, 3, 4, 5])
+
+        response = self.client.patch(
+            f"{self.path()}/order", {}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_statements_do_not_grow_with_the_queue(self):
+        large = self.machine.add_queue(list(range(1, 101)))
+        counts = []
+        for queue in [self.queue, large]:
+            item_ids = self.item_ids(queue)
+            with record_queries() as removal:
+                self.assertEqual(self.remove(item_ids[:2], queue).status_code, 200)
+            with record_queries() as reorder:
+                response = self.reorder(item_ids[2:][::-1], queue)
+                self.assertEqual(response.status_code, 200)
+            counts.append((removal.count, reorder.count))
+        self.assertEqual(counts[0], counts[1])
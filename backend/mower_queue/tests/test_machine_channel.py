@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+import uuid
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from ..machine_channel import websocket_application
+from ..models import Machine, MachineCommand
+
+
+# Swept often for the commands, whose notifications only follow a commit
+@override_settings(MACHINE_CHANNEL_TIMEOUT=0.3)
+@mock.patch("mower_queue.machine_channel.store_telemetry")
+class MachineChannelTests(TestCase):
+    """Machines exchange telemetry and commands over a WebSocket"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2])
+
+    async def connect(self, machine_id=None):
+        """Open the channel of the machine, returns the sent messages"""
+        self.received = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.application = asyncio.create_task(
+            websocket_application(
+                {
+                    "type": "websocket",
+                    "path": f"/api/v1/machines/{machine_id or self.machine.id}/channel",
+                },
+                self.received.get,
+                self.sent.put,
+            )
+        )
+        await self.received.put({"type": "websocket.connect"})
+        return await self.next_message()
+
+    async def disconnect(self):
+        await self.received.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.application, 5)
+
+    async def send(self, data):
+        await self.received.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def next_message(self):
+        return await asyncio.wait_for(self.sent.get(), 5)
+
+    async def next_json(self):
+        message = await self.next_message()
+        self.assertEqual(message["type"], "websocket.send")
+        return json.loads(message["text"])
+
+    async def channel_seen_at(self):
+        await self.machine.arefresh_from_db(fields=["channel_seen_at"])
+        return self.machine.channel_seen_at
+
+    async def test_pending_commands(self, store_telemetry):
+        command = await MachineCommand.objects.acreate(
+            machine=self.machine, command="pause", queue_id=str(self.queue.id)
+        )
+
+        self.assertEqual(await self.connect(), {"type": "websocket.accept"})
+        self.assertEqual(
+            await self.next_json(), {"type": "command", **command.payload()}
+        )
+        await command.arefresh_from_db()
+        self.assertEqual((command.status, command.attempts), ("delivered", 1))
+        # The dispatcher leaves the machine to its channel
+        self.assertIsNotNone(await self.channel_seen_at())
+
+        await self.disconnect()
+        self.assertIsNone(await self.channel_seen_at())
+
+    async def test_telemetry(self, store_telemetry):
+        await self.connect()
+        await self.send(
+            {
+                "type": "telemetry",
+                "state": "Idle",
+                "current_queue": str(self.queue.id),
+                "current_field": "",
+                "previous_field": "",
+                "timestamp": time.time(),
+            }
+        )
+
+        message = await self.next_json()
+        first = await self.queue.items.aget(field_id=1)
+        self.assertEqual(
+            (message["command"], message["field_id"]), ("start_mowing", str(first.id))
+        )
+        self.assertEqual(first.status, "in_progress")
+        self.assertEqual(store_telemetry.call_count, 1)
+        await self.disconnect()
+
+    async def test_invalid_messages(self, store_telemetry):
+        await self.connect()
+        await self.received.put({"type": "websocket.receive", "text": "not json"})
+        self.assertEqual(
+            await self.next_json(), {"type": "error", "message": "Malformed message"}
+        )
+
+        queue_id = str(uuid.uuid4())
+        await self.send(
+            {
+                "type": "telemetry",
+                "state": "Idle",
+                "current_queue": queue_id,
+                "current_field": "",
+            }
+        )
+        message = await self.next_json()
+        self.assertEqual(message["type"], "error")
+        self.assertIn(queue_id, message["message"])
+        await self.disconnect()
+
+    async def test_unknown_machine(self, store_telemetry):
+        for machine_id in [uuid.uuid4(), "not-a-uuid"]:
+            self.assertEqual(
+                await self.connect(machine_id),
+                {"type": "websocket.close", "code": 4404},
+            )
+            await asyncio.wait_for(self.application, 5)
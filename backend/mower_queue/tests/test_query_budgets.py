@@ -0,0 +1,112 @@
+import time
+import uuid
+from unittest import mock
+
+from django.test import TestCase
+
+from ..models import FieldQueue, Machine
+from ..query_stats import max_queries
+
+
+# The telemetry history is written by a background thread on a connection of
+# its own, it is kept out of the test transactions
+@mock.patch("mower_queue.views.store_telemetry")
+class QueryBudgetTests(TestCase):
+    """The number of queries of the hot paths does not grow with the data"""
+
+    def create_machines(self, count, fields=5):
+        machines = []
+        for i in range(count):
+            machine = Machine.objects.create(name=f"Machine {i}")
+            machine.queue = machine.add_queue(list(range(1, fields + 1)))
+            machines.append(machine)
+        return machines
+
+    def idle_telem(self, machine, **kwargs):
+        return {
+            "state": "Idle",
+            "current_queue": str(machine.queue.id),
+            "current_field": "",
+            "previous_field": "",
+            "timestamp": time.time(),
+            **kwargs,
+        }
+
+    def test_queue_listing(self, store_telemetry):
+        machine = Machine.objects.create(name="Machine")
+        for _ in range(5):
+            queue = machine.add_queue(list(range(1, 11)))
+            queue.update_status("completed")
+
+        with max_queries(4):
+            response = self.client.get(f"/api/v1/machines/{machine.id}/queues")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(x["items"]) for x in response.json()["data"]], [10] * 5)
+
+    def test_queue_items(self, store_telemetry):
+        (machine,) = self.create_machines(1, fields=10)
+        path = f"/api/v1/machines/{machine.id}/queues/{machine.queue.id}/items"
+
+        with max_queries(2):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        with max_queries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_machine_telemetry(self, store_telemetry):
+        (machine,) = self.create_machines(1)
+        path = f"/api/v1/machines/{machine.id}/incoming_machine_telem"
+        telem = self.idle_telem(machine)
+
+        with max_queries(16):
+            response = self.client.post(path, telem, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("can start mowing", response.json()["message"])
+
+        # Repeated and mowing heartbeats are answered without the database
+        with max_queries(0):
+            self.client.post(path, telem, content_type="application/json")
+            self.client.post(
+                path,
+                {**telem, "state": "Mowing", "current_field": str(uuid.uuid4())},
+                content_type="application/json",
+            )
+
+    def test_fleet_telemetry(self, store_telemetry):
+        machines = self.create_machines(10)
+        telemetry = [{"machine_id": str(x.id), **self.idle_telem(x)} for x in machines]
+
+        # The queues and their items are locked and read once and the commands
+        # written once, then each machine is moved on in a savepoint
+        with max_queries(6 + 8 * len(machines)):
+            response = self.client.post(
+                "/api/v1/telemetry/batch",
+                {"telemetry": telemetry},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [x["status"] for x in response.json()["data"]], [200] * len(machines)
+        )
+
+        with max_queries(0):
+            self.client.post(
+                "/api/v1/telemetry/batch",
+                {"telemetry": telemetry},
+                content_type="application/json",
+            )
+
+    def test_next_item(self, store_telemetry):
+        (machine,) = self.create_machines(1, fields=10)
+        queue = machine.queue
+
+        with max_queries(10):
+            item = queue.next_item()
+        self.assertEqual(item.position, 0)
+
+        with max_queries(8):
+            item = queue.next_item(previous_item_id=str(item.id))
+        self.assertEqual(item.position, 1)
+        self.assertEqual(FieldQueue.objects.get(id=queue.id).status, "active")
@@ -0,0 +1,89 @@
+from django.test import TestCase
+
+from ..models import FieldQueueItem, Machine
+
+GAP = FieldQueueItem.RANK_GAP
+
+
+class RankTests(TestCase):
+    """Items are ordered by sparse ranks, positions are derived from them"""
+
+    def setUp(self):
+        machine = Machine.objects.create(name="Machine")
+        self.queue = machine.add_queue([1, 2, 3])
+
+    def ranks(self):
+        return list(self.queue.items.order_by("rank").values_list("field_id", "rank"))
+
+    def test_ranks_are_spread(self):
+        self.assertEqual(self.ranks(), [(1, GAP), (2, 2 * GAP), (3, 3 * GAP)])
+
+    def test_add_item_takes_the_midpoint(self):
+        self.queue.add_item(4, position=0)
+        self.queue.add_item(5, position=2)
+        self.queue.add_item(6)
+
+        self.assertEqual(
+            self.ranks(),
+            [
+                (4, GAP // 2),
+                (1, GAP),
+                (5, GAP + GAP // 2),
+                (2, 2 * GAP),
+                (3, 3 * GAP),
+                (6, 4 * GAP),
+            ],
+        )
+
+    def test_move_item_only_updates_the_moved_item(self):
+        first = self.queue.items.get(field_id=1)
+        item = self.queue.move_item(first.id, 1)
+
+        self.assertEqual(item.position, 1)
+        self.assertEqual(
+            self.ranks(), [(2, 2 * GAP), (1, 2 * GAP + GAP // 2), (3, 3 * GAP)]
+        )
+
+        last = self.queue.items.get(field_id=3)
+        self.queue.move_item(last.id, 0)
+        self.assertEqual(
+            self.ranks(), [(3, GAP), (2, 2 * GAP), (1, 2 * GAP + GAP // 2)]
+        )
+
+    def test_crowded_ranks_are_spread_again(self):
+        for rank, field_id in enumerate([1, 2, 3], start=1):
+            self.queue.items.filter(field_id=field_id).update(rank=rank)
+
+        self.queue.add_item(4, position=1)
+
+        self.assertEqual(
+            self.ranks(),
+            [(1, GAP), (4, GAP + GAP // 2), (2, 2 * GAP), (3, 3 * GAP)],
+        )
+
+    def test_crowded_ranks_are_spread_again_on_move(self):
+        for rank, field_id in enumerate([1, 2, 3], start=1):
+            self.queue.items.filter(field_id=field_id).update(rank=rank)
+
+        last = self.queue.items.get(field_id=3)
+        self.queue.move_item(last.id, 1)
+
+        self.assertEqual(self.ranks(), [(1, GAP), (3, GAP + GAP // 2), (2, 2 * GAP)])
+
+    def test_positions(self):
+        self.queue.add_item(4, position=1)
+        self.queue.remove_items([str(self.queue.items.get(field_id=2).id)])
+
+        expected = [(1, 0), (4, 1), (3, 2)]
+        self.assertEqual(
+            [(x["field_id"], x["position"]) for x in self.queue.serialize_items()],
+            expected,
+        )
+        self.assertEqual(
+            list(
+                self.queue.items.with_position()
+                .order_by("rank")
+                .values_list("field_id", "position")
+            ),
+            expected,
+        )
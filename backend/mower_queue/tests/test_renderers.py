@@ -0,0 +1,116 @@
+import datetime
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from ..models import Machine
+from ..renderers import FastJSONRenderer, render_json
+
+UTC = datetime.timezone.utc
+CET = datetime.timezone(datetime.timedelta(hours=1))
+
+PAYLOADS = [
+    None,
+    True,
+    0,
+    -1,
+    2**63 - 1,
+    2**64,
+    "",
+    [],
+    {},
+    {"nested": [{"empty": {}}, [], [[None]]]},
+    # Strings
+    "plain ascii",
+    'quotes " and \\ backslashes / slashes',
+    "control \x00 \x01 \x1f \t \n \r \x7f characters",
+    "non-ascii é ü ß 日本 🚜",
+    "separators \u2028 and \u2029",
+    "\u2028",
+    ":1.5,",
+    "[1e16]",
+    # Floats, the standard library and orjson format some of them differently
+    0.0,
+    -0.0,
+    1.0,
+    0.1,
+    2.5,
+    100.0,
+    1e15,
+    1e16,
+    1e21,
+    1e22,
+    1e300,
+    5e-324,
+    0.0001,
+    0.00001,
+    1.5e-7,
+    1770491747.05,
+    [1e16, 0.00001, 1.0],
+    {"timestamp": 1e16, "value": 0.00001},
+    # Types orjson encodes itself or hands to the encoder of DRF
+    uuid.UUID("051da667-809c-4694-b9cb-ac48002f3b72"),
+    datetime.datetime(2026, 6, 1, 8, 0, tzinfo=UTC),
+    datetime.datetime(2026, 6, 1, 8, 0, 1, 123456, tzinfo=UTC),
+    datetime.datetime(2026, 6, 1, 8, 0, 1, 123456, tzinfo=CET),
+    datetime.date(2026, 6, 1),
+    datetime.time(8, 0, 1),
+    datetime.timedelta(minutes=42, seconds=1.5),
+    Decimal("12.50"),
+    {1: "integer key", "list": (1, 2)},
+]
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class RendererParityTests(TestCase):
+    """The orjson renderer writes the same bytes as the JSON renderer of DRF"""
+
+    def assertSameBytes(self, data):
+        if data is not None:
+            # DRF renders None as an empty body, left to it by the renderer
+            self.assertEqual(render_json(data), JSONRenderer().render(data), data)
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data), data
+        )
+
+    def test_payloads(self, store_telemetry):
+        for data in PAYLOADS:
+            with self.subTest(data=data):
+                self.assertSameBytes(data)
+        self.assertSameBytes(PAYLOADS)
+
+    def test_responses(self, store_telemetry):
+        machine = Machine.objects.create(name="Machine \u2028 é")
+        queue = machine.add_queue([1, 2, 3])
+        queue.next_item()
+        queue.add_item(4)
+        path = f"/api/v1/machines/{machine.id}/queues"
+
+        for response in [
+            self.client.get(path),
+            self.client.get(f"{path}/{queue.id}/items"),
+            self.client.get(f"{path}/active"),
+            self.client.get("/api/v1/history"),
+            self.client.get("/api/v1/stats/daily"),
+            self.client.post(
+                "/api/v1/telemetry/batch",
+                {
+                    "telemetry": [
+                        {"machine_id": 1e16, "state": "Idle"},
+                        {"machine_id": "x\u2028", "state": "Idle"},
+                        {
+                            "machine_id": str(machine.id),
+                            "state": "Idle",
+                            "current_queue": "x\u2029",
+                        },
+                    ]
+                },
+                content_type="application/json",
+            ),
+        ]:
+            with self.subTest(path=response.request["PATH_INFO"]):
+                self.assertLess(response.status_code, 500)
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
@@ -0,0 +1,123 @@
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.test import TestCase
+
+from ..models import Machine
+from ..query_stats import record_queries
+
+ALL_FIELDS = {"id", "machine_id", "status", "version", "created_at", "updated_at"}
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class SparseFieldTests(TestCase):
+    """Clients choose the queue fields and whether the items are embedded"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3])
+        self.path = f"/api/v1/machines/{self.machine.id}/queues"
+
+    def get(self, path, params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_listing(self, store_telemetry):
+        with record_queries() as full:
+            response = self.get(self.path, {})
+        (queue,) = response.json()["data"]
+        self.assertEqual(set(queue), ALL_FIELDS | {"items"})
+
+        # The id is always included, the items are not read at all
+        with record_queries() as sparse:
+            response = self.get(self.path, {"fields": "status"})
+        self.assertEqual(
+            response.json()["data"], [{"id": str(self.queue.id), "status": "active"}]
+        )
+        self.assertLess(sparse.count, full.count)
+
+        response = self.get(self.path, {"fields": "status", "include": "items"})
+        (queue,) = response.json()["data"]
+        self.assertEqual(set(queue), {"id", "status", "items"})
+        self.assertEqual([x["field_id"] for x in queue["items"]], [1, 2, 3])
+
+    def test_listing_etags(self, store_telemetry):
+        etags = {
+            self.get(self.path, params)["ETag"]
+            for params in [{}, {"fields": "status"}, {"fields": "status,version"}]
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_active_queue(self, store_telemetry):
+        response = self.get(f"{self.path}/active", {"fields": "version"})
+        self.assertEqual(set(response.json()["data"]), {"id", "version"})
+
+        response = self.get(f"{self.path}/active", {"include": "items"})
+        self.assertEqual(set(response.json()["data"]), ALL_FIELDS | {"items"})
+
+    def test_invalid_fields(self, store_telemetry):
+        for params in [
+            {"fields": "status,name"},
+            {"fields": "status", "include": "machine"},
+        ]:
+            for response in [
+                self.client.get(self.path, params),
+                self.client.get(f"{self.path}/active", params),
+                self.client.post(
+                    f"{self.path}/{self.queue.id}/pause?{urlencode(params)}"
+                ),
+            ]:
+                self.assertEqual(response.status_code, 400, params)
+                self.assertIn("Invalid", response.json()["message"])
+        # Refused before the queue was changed
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.status, "active")
+
+    def test_return_minimal(self, store_telemetry):
+        response = self.client.post(
+            f"{self.path}/{self.queue.id}/pause", HTTP_PREFER="return=minimal"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Preference-Applied"], "return=minimal")
+        self.assertEqual(
+            response.json()["data"],
+            {"id": str(self.queue.id), "status": "paused", "version": 2},
+        )
+
+        # Among other preferences, with parameters
+        response = self.client.post(
+            f"{self.path}/{self.queue.id}/resume",
+            HTTP_PREFER="respond-async, return=minimal; strict",
+        )
+        self.assertEqual(response["Preference-Applied"], "return=minimal")
+        self.assertEqual(set(response.json()["data"]), {"id", "status", "version"})
+
+    def test_fields_override_return_minimal(self, store_telemetry):
+        response = self.client.post(
+            f"{self.path}/{self.queue.id}/pause?fields=updated_at",
+            HTTP_PREFER="return=minimal",
+        )
+        self.assertNotIn("Preference-Applied", response)
+        self.assertEqual(set(response.json()["data"]), {"id", "updated_at"})
+
+        response = self.client.post(f"{self.path}/{self.queue.id}/resume")
+        self.assertNotIn("Preference-Applied", response)
+        self.assertEqual(set(response.json()["data"]), ALL_FIELDS | {"items"})
+
+    def test_telemetry_return_minimal(self, store_telemetry):
+        response = self.client.post(
+            f"/api/v1/machines/{self.machine.id}/incoming_machine_telem",
+            {
+                "state": "Idle",
+                "current_queue": str(self.queue.id),
+                "current_field": "",
+                "previous_field": "",
+                "timestamp": time.time(),
+            },
+            content_type="application/json",
+            HTTP_PREFER="return=minimal",
+        )
+        self.assertEqual(response["Preference-Applied"], "return=minimal")
+        self.assertEqual(set(response.json()["data"]), {"id", "status", "version"})
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Machine, MachineDailyStats
+
+# Simulated time, far from the time of the server
+STARTED_AT = datetime(2026, 6, 1, 8, 0, tzinfo=dt_timezone.utc)
+COMPLETED_AT = STARTED_AT + timedelta(minutes=42)
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class TelemetryTimestampTests(TestCase):
+    """Items moved on by telemetry are stamped with the time of the machine"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2])
+        self.first, self.second = self.queue.items.order_by("rank")
+
+    def telem(self, timestamp, previous_field=""):
+        return {
+            "state": "Idle",
+            "current_queue": str(self.queue.id),
+            "current_field": "",
+            "previous_field": previous_field,
+            "timestamp": timestamp.timestamp(),
+        }
+
+    def check_timestamps(self):
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.status, "completed")
+        self.assertEqual(self.first.started_at, STARTED_AT)
+        self.assertEqual(self.first.completed_at, COMPLETED_AT)
+        self.assertEqual(self.second.started_at, COMPLETED_AT)
+
+        stats = MachineDailyStats.objects.get(
+            machine=self.machine, day=timezone.localdate(COMPLETED_AT)
+        )
+        self.assertEqual(stats.fields_completed, 1)
+        self.assertEqual(stats.mowing_time, COMPLETED_AT - STARTED_AT)
+
+    def test_machine_telemetry(self, store_telemetry):
+        path = f"/api/v1/machines/{self.machine.id}/incoming_machine_telem"
+        for telem in [
+            self.telem(STARTED_AT),
+            self.telem(COMPLETED_AT, str(self.first.id)),
+        ]:
+            response = self.client.post(path, telem, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+        self.check_timestamps()
+
+    def test_fleet_telemetry(self, store_telemetry):
+        for telem in [
+            self.telem(STARTED_AT),
+            self.telem(COMPLETED_AT, str(self.first.id)),
+        ]:
+            response = self.client.post(
+                "/api/v1/telemetry/batch",
+                {"telemetry": [{"machine_id": str(self.machine.id), **telem}]},
+                content_type="application/json",
+            )
+            self.assertEqual(response.json()["data"][0]["status"], 200)
+        self.check_timestamps()
+
+    def test_server_time_without_timestamp(self, store_telemetry):
+        before = timezone.now()
+        item = self.queue.next_item()
+        self.assertGreaterEqual(item.started_at, before)
+
+    def test_completion_before_api_start(self, store_telemetry):
+        # Started through the API at the time of the server, then completed on
+        # a simulated clock behind it
+        self.queue.next_item()
+        self.queue.next_item(
+            timestamp=STARTED_AT.timestamp(), previous_item_id=str(self.first.id)
+        )
+
+        stats = MachineDailyStats.objects.get(
+            machine=self.machine, day=timezone.localdate(STARTED_AT)
+        )
+        self.assertEqual(stats.fields_completed, 1)
+        self.assertEqual(stats.mowing_time, timedelta())
@@ -0,0 +1,141 @@
+import time
+from unittest import mock
+
+from django.test import TestCase
+
+from ..models import FieldQueue, Machine
+
+
+@mock.patch("mower_queue.views.store_telemetry")
+class QueueVersionTests(TestCase):
+    """Every change of a queue bumps its version, the ETag of its items"""
+
+    def setUp(self):
+        self.machine = Machine.objects.create(name="Machine")
+        self.queue = self.machine.add_queue([1, 2, 3])
+        self.path = f"/api/v1/machines/{self.machine.id}/queues/{self.queue.id}"
+
+    def version(self):
+        return FieldQueue.objects.values_list("version", flat=True).get(
+            id=self.queue.id
+        )
+
+    def etag(self):
+        return f'"{self.queue.id}-{self.version()}"'
+
+    def item_id(self, field_id):
+        return str(self.queue.items.get(field_id=field_id).id)
+
+    def assertBumps(self, request):
+        """Check that request bumps the version and returns the new ETag"""
+        version = self.version()
+        response = request()
+        self.assertLess(response.status_code, 300, response.content)
+        self.assertGreater(self.version(), version)
+        if "ETag" in response:
+            self.assertEqual(response["ETag"], self.etag())
+        return response
+
+    def post(self, path, data=None):
+        return self.client.post(path, data, content_type="application/json")
+
+    def test_item_edits(self, store_telemetry):
+        self.assertBumps(lambda: self.post(f"{self.path}/items", {"field_id": 4}))
+        self.assertBumps(
+            lambda: self.client.patch(
+                f"{self.path}/items/{self.item_id(4)}",
+                {"position": 0},
+                content_type="application/json",
+            )
+        )
+        self.assertBumps(
+            lambda: self.client.patch(
+                f"{self.path}/items/order",
+                {"field_ids": [self.item_id(x) for x in [3, 2, 1, 4]]},
+                content_type="application/json",
+            )
+        )
+        self.assertBumps(
+            lambda: self.client.delete(
+                f"{self.path}/items",
+                {"field_ids": [self.item_id(2)]},
+                content_type="application/json",
+            )
+        )
+
+    def test_status_changes(self, store_telemetry):
+        self.assertBumps(lambda: self.post(f"{self.path}/start"))
+        self.assertBumps(lambda: self.post(f"{self.path}/skip"))
+        self.assertBumps(lambda: self.post(f"{self.path}/pause"))
+        self.assertBumps(lambda: self.post(f"{self.path}/resume"))
+        self.assertBumps(lambda: self.post(f"{self.path}/terminate"))
+
+    def test_progression(self, store_telemetry):
+        telem = {
+            "state": "Idle",
+            "current_queue": str(self.queue.id),
+            "current_field": "",
+            "previous_field": "",
+            "timestamp": time.time(),
+        }
+        path = f"/api/v1/machines/{self.machine.id}/incoming_machine_telem"
+        self.assertBumps(lambda: self.post(path, telem))
+
+        telem["previous_field"] = self.item_id(1)
+        self.assertBumps(lambda: self.post(path, telem))
+        self.assertBumps(
+            lambda: self.post(
+                "/api/v1/telemetry/batch",
+                {
+                    "telemetry": [
+                        {
+                            "machine_id": str(self.machine.id),
+                            **telem,
+                            "previous_field": self.item_id(2),
+                        }
+                    ]
+                },
+            )
+        )
+
+    @mock.patch("mower_queue.views.deliver_now", new_callable=mock.AsyncMock)
+    def test_bulk_control(self, deliver_now, store_telemetry):
+        for action in ["pause", "resume", "terminate"]:
+            self.assertBumps(
+                lambda: self.post(
+                    "/api/v1/queues/control",
+                    {"action": action, "queue_ids": [str(self.queue.id)]},
+                )
+            )
+
+    def test_not_modified(self, store_telemetry):
+        response = self.client.get(f"{self.path}/items")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], self.etag())
+
+        response = self.client.get(
+            f"{self.path}/items", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag())
+
+        etag = response["ETag"]
+        self.queue.add_item(4)
+        response = self.client.get(f"{self.path}/items", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual([x["field_id"] for x in response.json()["data"]], [1, 2, 3, 4])
+
+    def test_listing_not_modified(self, store_telemetry):
+        path = f"/api/v1/machines/{self.machine.id}/queues"
+        etag = self.client.get(path)["ETag"]
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        self.queue.move_item(self.item_id(3), 0)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [x["field_id"] for x in response.json()["data"][0]["items"]], [3, 1, 2]
+        )
@@ -0,0 +1,51 @@
+import httpx
+
+from .metrics import command_connections
+
+
+class CommandTransport:
+    """Non-blocking HTTP client keeping keep-alive connections to machine endpoints
+
+    Each endpoint (scheme, host and port) gets its own pooled `httpx.AsyncClient`
+    keeping up to `pool_size` idle connections open, reused by the next request
+    to the same endpoint. A transport must only be used from the event loop it
+    was first used in. Connections opened and reused are counted in
+    `mower_command_connections_total`.
+    """
+
+    def __init__(self, connect_timeout, read_timeout, pool_size):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_keepalive_connections=pool_size)
+        # Shared by the clients, loading the certificates is slow
+        self.ssl_context = httpx.create_ssl_context()
+        self._clients = {}
+
+    async def post_json(self, url, payload):
+        """POST payload to url and return the response status and body"""
+        opened = False
+
+        async def trace(event, info):
+            nonlocal opened
+            if event == "connection.connect_tcp.complete":
+                opened = True
+
+        url = httpx.URL(url)
+        response = await self._client(url).post(
+            url, json=payload, extensions={"trace": trace}
+        )
+        command_connections.labels("opened" if opened else "reused").inc()
+        return response.status_code, response.content
+
+    async def close(self):
+        """Close every client along with its connections"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def _client(self, url):
+        endpoint = (url.scheme, url.host, url.port)
+        if endpoint not in self._clients:
+            self._clients[endpoint] = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits, verify=self.ssl_context
+            )
+        return self._clients[endpoint]
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path(
@@ -7,6 +7,11 @@ urlpatterns = [
         views.queue_view,
         name="queue",
     ),
+    path(
+        "machines/<uuid:machine_id>/queues/active",
+        views.active_queue_view,
+        name="active-queue",
+    ),
     path(
         "machines/<uuid:machine_id>/queues/<uuid:queue_id>/start",
         views.queue_start,
@@ -37,9 +42,44 @@ urlpatterns = [
         views.queue_items,
         name="queue-items",
     ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/items/order",
+        views.queue_items_order,
+        name="queue-items-order",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/items/<uuid:item_id>",
+        views.queue_item_move,
+        name="queue-item-move",
+    ),
+    path(
+        "machines/<uuid:machine_id>/queues/<uuid:queue_id>/events",
+        async_views.queue_events,
+        name="queue-events",
+    ),
     path(
         "machines/<uuid:machine_id>/incoming_machine_telem",
         views.incoming_machine_telem,
         name="incoming-machine-state",
     ),
+    path(
+        "history",
+        views.history_view,
+        name="history",
+    ),
+    path(
+        "stats/daily",
+        views.daily_stats_view,
+        name="daily-stats",
+    ),
+    path(
+        "telemetry/batch",
+        views.incoming_fleet_telem,
+        name="incoming-fleet-state",
+    ),
+    path(
+        "queues/control",
+        views.queues_control,
+        name="queues-control",
+    ),
 ]
@@ -1,12 +1,79 @@
-import json
-from urllib import request, error
+import hashlib
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import (
+    Count,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    prefetch_related_objects,
+)
+from django.db.models.functions import NullIf
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 
-from .models import Machine, FieldQueue
+from .models import (
+    Machine,
+    FieldQueue,
+    FieldQueueItem,
+    MachineCommand,
+    MachineDailyStats,
+    VersionConflict,
+    is_uuid,
+)
+from .dispatcher import deliver_now
+from .events import machine_topic, publish_on_commit
+from .metrics import (
+    command_queue_duration,
+    commands_queued,
+    export_metrics,
+    next_item_duration,
+    telemetry_received,
+)
+from .pagination import (
+    decode_cursor,
+    encode_cursor,
+    parse_day,
+    parse_fields,
+    parse_limit,
+    parse_timestamp,
+)
+from .serialization import (
+    HISTORY_FIELDS,
+    history_rows,
+    serialize_items,
+    serialize_queues,
+)
+from .telemetry_cache import (
+    forget_telem,
+    forget_telems,
+    remember_telem,
+    seen_telem,
+)
+from .telemetry_store import store_telemetry
+
+MAX_TELEMETRY_BATCH_SIZE = 5000
+MAX_BULK_CONTROL_SIZE = 5000
+
+BULK_CONTROL_ACTIONS = {
+    # Statuses of the queues the action applies to, their new status and the
+    # command sent to their machine
+    "pause": (["active"], "paused", "pause"),
+    "resume": (["paused"], "active", "resume"),
+    "terminate": (["active", "paused"], "terminated", "stop"),
+}
 
 
 @api_view(["GET", "POST"])
@@ -24,7 +91,66 @@ def queue_view(request, machine_id):
 
     if request.method == "GET":
         queues = FieldQueue.objects.filter(machine_id=machine_id)
-        return Response({"data": [queue.serialize() for queue in queues]})
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+            fields = requested_fields(request)
+            if queue_status := request.query_params.get("status"):
+                queues = queues.filter(status__in=queue_status.split(","))
+            if created_after := parse_timestamp(
+                request.query_params.get("created_after"), "created_after"
+            ):
+                queues = queues.filter(created_at__gte=created_after)
+            if created_before := parse_timestamp(
+                request.query_params.get("created_before"), "created_before"
+            ):
+                queues = queues.filter(created_at__lt=created_before)
+            if cursor := request.query_params.get("cursor"):
+                created_at, queue_id = decode_cursor(cursor, 2)
+                created_at = parse_timestamp(created_at, "cursor")
+                queues = queues.filter(
+                    Q(created_at__lt=created_at)
+                    | Q(created_at=created_at, id__lt=queue_id)
+                )
+        except ValidationError as e:
+            return Response(
+                {"message": e.message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Newest first, the page is identified by the versions of its queues so
+        # unchanged pages are answered without loading any item
+        page = list(
+            queues.order_by("-created_at", "-id").values_list(
+                "id", "version", "created_at"
+            )[: limit + 1]
+        )
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1][2], page[-1][0])
+
+        representation = ",".join(f"{x[0]}-{x[1]}" for x in page)
+        if fields != FieldQueue.SERIALIZED_FIELDS:
+            representation += f";{','.join(sorted(fields))}"
+        etag = quote_etag(hashlib.sha1(representation.encode("utf-8")).hexdigest())
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        # The items of the whole page are fetched in one query, from the
+        # partitions created since the oldest queue of the page
+        queues = FieldQueue.objects.filter(id__in=[x[0] for x in page])
+        items = FieldQueueItem.objects.filter(
+            created_at__gte=min([x[2] for x in page], default=timezone.now())
+        )
+        return Response(
+            {
+                "data": serialize_queues(
+                    queues.order_by("-created_at", "-id"), items, fields
+                ),
+                "next_cursor": next_cursor,
+            },
+            headers={"ETag": etag},
+        )
 
     elif request.method == "POST":
         field_ids = request.data.get("field_ids", [])
@@ -37,15 +163,139 @@ def queue_view(request, machine_id):
                 status=status.HTTP_422_UNPROCESSABLE_ENTITY,
             )
 
+        try:
+            fields = requested_fields(request, mutation=True)
+        except ValidationError as e:
+            return Response(
+                {"message": e.message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         queue = machine.add_queue(field_ids=field_ids)
         return Response(
             {
-                "data": queue.serialize(),
+                "data": queue.serialize(fields),
                 "message": f"Queue {queue.id} created successfully",
             },
             status=status.HTTP_201_CREATED,
+            headers=applied_preferences(request),
+        )
+
+
+@api_view(["GET"])
+def active_queue_view(request, machine_id):
+    """Queue the machine is working on, read through the pointer of the machine"""
+    try:
+        machine = Machine.objects.select_related("active_queue").get(id=machine_id)
+    except Machine.DoesNotExist:
+        return Response(
+            {
+                "message": f"Machine {machine_id} does not exist.",
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    if not (queue := machine.active_queue):
+        return Response(
+            {
+                "message": f"Machine {machine_id} has no active queue.",
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    try:
+        fields = requested_fields(request)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    etag = quote_etag(queue.etag)
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    # Items last, like in the serialized queue
+    data = queue.serialize([x for x in fields if x != "items"])
+    if "items" in fields:
+        data["items"] = serialize_items(queue.items_since_creation)
+    return Response({"data": data}, headers={"ETag": etag})
+
+
+def requested_fields(request, mutation=False):
+    """Fields of the queues to respond with
+
+    Every field, items included, unless ?fields= lists some of them, the items
+    are then only embedded with ?include=items. Without ?fields=, mutations
+    requested with `Prefer: return=minimal` only get the id, status and
+    version. The id is always included.
+    """
+    fields = parse_fields(
+        request.GET.get("fields"), FieldQueue.SERIALIZED_FIELDS, "fields"
+    )
+    include = parse_fields(request.GET.get("include"), ["items"], "include") or []
+    if fields is None:
+        if not (mutation and prefers_minimal(request)):
+            return FieldQueue.SERIALIZED_FIELDS
+        fields = FieldQueue.MINIMAL_FIELDS
+    return {"id", *fields, *include}
+
+
+def prefers_minimal(request):
+    """Whether the client asked for a minimal response, RFC 7240"""
+    return any(
+        x.split(";")[0].replace(" ", "").lower() == "return=minimal"
+        for x in request.headers.get("Prefer", "").split(",")
+    )
+
+
+def applied_preferences(request):
+    """Headers acknowledging the preferences honoured by a mutation"""
+    if prefers_minimal(request) and "fields" not in request.GET:
+        return {"Preference-Applied": "return=minimal"}
+    return {}
+
+
+def expected_version(request, queue):
+    """Version of the queue an edit is based on, None when the client sent none
+
+    Read from the If-Match header, holding the ETag of the queue items, or
+    from the version of the payload.
+    """
+    if if_match := request.headers.get("If-Match"):
+        etags = parse_etags(if_match)
+        if "*" in etags:
+            return None
+        for etag in etags:
+            queue_id, _, version = etag.removeprefix("W/").strip('"').rpartition("-")
+            if queue_id == str(queue.id) and version.isdigit():
+                return int(version)
+        raise ValidationError(
+            f"Invalid If-Match {if_match}. Expected an ETag of queue {queue.id}."
         )
 
+    version = request.data.get("version")
+    if version is not None and (
+        not isinstance(version, int) or isinstance(version, bool) or version < 1
+    ):
+        raise ValidationError(f"Invalid version {version}.")
+    return version
+
+
+def version_conflict(e):
+    """Response to an edit based on an outdated version of the queue"""
+    return Response(
+        {"message": str(e), "version": e.version},
+        status=status.HTTP_409_CONFLICT,
+        headers={"ETag": quote_etag(f"{e.queue_id}-{e.version}")},
+    )
+
+
+def etag_matches(request, etag):
+    """Check whether the copy the client already has is still current"""
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return etag in etags or "*" in etags
+
 
 @api_view(["POST"])
 def incoming_machine_telem(request, machine_id):
@@ -53,56 +303,312 @@ def incoming_machine_telem(request, machine_id):
     state = request.data.get("state").lower()
     current_queue_id = request.data.get("current_queue")
     current_field_id = request.data.get("current_field")
-    previous_field_id = request.data.get("previous_field")
     timestamp = request.data.get("timestamp")
     print(
         f"Incoming machine telem update State: {state}, Field: {current_field_id},"
         f" Timestamp: {timestamp}"
     )
+    store_telemetry(machine_id, request.data)
 
-    if state in ["paused", "mowing"]:
+    if not telem_requires_progression(request.data):
         # No action required
+        telemetry_received.labels("http", "ignored").inc()
         return Response({"message": "No action required"})
 
-    elif state == "idle" and not current_field_id and current_queue_id:
-        # The machine has finished the previous task and might need further instructions
-        try:
-            queue = FieldQueue.objects.get(
-                id=current_queue_id,
-                machine_id=machine_id,
+    try:
+        validate_progression(request.data)
+    except ValidationError as e:
+        telemetry_received.labels("http", "invalid").inc()
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if seen_telem({machine_id: request.data}):
+        # Nothing changed since the previous heartbeat was handled
+        telemetry_received.labels("http", "duplicate").inc()
+        return Response({"message": "No action required"})
+
+    # The machine has finished the previous task and might need further instructions
+    try:
+        queue = FieldQueue.objects.get(
+            id=current_queue_id,
+            machine_id=machine_id,
+        )
+    except FieldQueue.DoesNotExist:
+        telemetry_received.labels("http", "not_found").inc()
+        return Response(
+            {
+                "message": (
+                    f"Queue {current_queue_id} does not exist on machine"
+                    f" {machine_id}."
+                ),
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    telemetry_received.labels("http", "progressed").inc()
+    data = progress_machine_queue(machine_id, queue, request.data, fields)
+    remember_telem({machine_id: request.data})
+    return Response(data, headers=applied_preferences(request))
+
+
+@api_view(["POST"])
+def incoming_fleet_telem(request):
+    """Handle state updates from many machines in a single request"""
+    if not isinstance(telemetry := request.data.get("telemetry"), list):
+        return Response(
+            {"message": "Missing telemetry list"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if len(telemetry) > MAX_TELEMETRY_BATCH_SIZE:
+        return Response(
+            {
+                "message": (
+                    "A telemetry batch may only contain"
+                    f" {MAX_TELEMETRY_BATCH_SIZE} updates."
+                ),
+            },
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    print(f"Incoming fleet telem update, {len(telemetry)} machines")
+
+    # Every entry is validated before any machine is moved on
+    machine_counts = Counter(
+        str(telem.get("machine_id"))
+        for telem in telemetry
+        if isinstance(telem, dict) and is_uuid(telem.get("machine_id"))
+    )
+    errors = [batch_telem_error(telem, machine_counts) for telem in telemetry]
+    valid = [x for x, error in zip(telemetry, errors) if not error]
+
+    # Skip heartbeats identical to the previous one and move the other machines
+    # on with their queues read in bulk
+    waiting = {
+        telem["machine_id"]: telem
+        for telem in valid
+        if telem_requires_progression(telem)
+    }
+    seen = seen_telem(waiting)
+    outcomes = progress_machine_queues(
+        {x: telem for x, telem in waiting.items() if x not in seen}, fields
+    )
+
+    results = []
+    progressed = {}
+    for telem, error in zip(telemetry, errors):
+        machine_id = telem.get("machine_id") if isinstance(telem, dict) else None
+        if error:
+            telemetry_received.labels("batch", "invalid").inc()
+            results.append(
+                {
+                    "machine_id": machine_id,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "message": error,
+                }
             )
-        except FieldQueue.DoesNotExist:
-            return Response(
+            continue
+        store_telemetry(machine_id, telem)
+
+        if machine_id not in outcomes:
+            telemetry_received.labels(
+                "batch", "duplicate" if machine_id in seen else "ignored"
+            ).inc()
+            results.append(
                 {
+                    "machine_id": machine_id,
+                    "status": status.HTTP_200_OK,
+                    "message": "No action required",
+                }
+            )
+            continue
+
+        outcome, result = outcomes[machine_id]
+        telemetry_received.labels("batch", outcome).inc()
+        results.append({"machine_id": machine_id, **result})
+        if outcome == "progressed":
+            progressed[machine_id] = telem
+
+    remember_telem(progressed)
+    return Response({"data": results}, headers=applied_preferences(request))
+
+
+def batch_telem_error(telem, machine_counts):
+    """Reason to reject an entry of a telemetry batch, None when it is valid
+
+    A machine appearing more than once is rejected, the order in which its
+    updates should be handled is unknown.
+    """
+    machine_id = telem.get("machine_id") if isinstance(telem, dict) else None
+    if not is_uuid(machine_id) or not telem.get("state"):
+        return "Missing or invalid machine id or state"
+    if machine_counts[str(machine_id)] > 1:
+        return f"Machine {machine_id} appears more than once in the batch."
+    if telem_requires_progression(telem):
+        try:
+            validate_progression(telem)
+        except ValidationError as e:
+            return e.message
+    return None
+
+
+def validate_progression(telem):
+    """Check the telemetry fields used to move a machine on to its next field"""
+    if not is_uuid(current_queue := telem.get("current_queue")):
+        raise ValidationError(f"Invalid current_queue {current_queue}.")
+    if (previous_field := telem.get("previous_field")) and not is_uuid(previous_field):
+        raise ValidationError(f"Invalid previous_field {previous_field}.")
+    if timestamp := telem.get("timestamp"):
+        try:
+            if isinstance(timestamp, bool):
+                raise TypeError
+            datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise ValidationError(
+                f"Invalid timestamp {timestamp}. Expected seconds since the epoch."
+            )
+
+
+def telem_requires_progression(telem):
+    """Check whether the machine is idle on a queue and waiting for its next field"""
+    return (
+        str(telem.get("state", "")).lower() == "idle"
+        and not telem.get("current_field")
+        and bool(telem.get("current_queue"))
+    )
+
+
+def progress_machine_queues(telems, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Move many machines on to the next field of their queues
+
+    `telems` maps machine ids to telemetry payloads. The queues and their items
+    are locked and read with a query each for the whole batch, then each
+    machine is moved on in a savepoint of its own so that a failure only
+    concerns that machine. Returns the outcome and the result of each machine.
+    """
+    outcomes = {}
+    moved_on = {}
+    if not telems:
+        return outcomes
+    with transaction.atomic():
+        # Locked in a consistent order, concurrent batches cannot deadlock
+        queues = {
+            str(x.id): x
+            for x in FieldQueue.objects.select_for_update()
+            .filter(id__in=[x["current_queue"] for x in telems.values()])
+            .order_by("id")
+        }
+        items = defaultdict(list)
+        if queues:
+            for item in (
+                FieldQueueItem.objects.select_for_update()
+                .filter(
+                    queue__in=queues.values(),
+                    created_at__gte=min(x.created_at for x in queues.values()),
+                )
+                .order_by("rank")
+            ):
+                items[item.queue_id].append(item)
+
+        commands = []
+        for machine_id, telem in telems.items():
+            current_queue_id = telem["current_queue"]
+            queue = queues.get(str(current_queue_id))
+            if not queue or str(queue.machine_id) != str(machine_id):
+                outcomes[machine_id] = "not_found", {
+                    "status": status.HTTP_404_NOT_FOUND,
                     "message": (
                         f"Queue {current_queue_id} does not exist on machine"
                         f" {machine_id}."
                     ),
-                },
-                status=status.HTTP_404_NOT_FOUND,
-            )
+                }
+                continue
+
+            try:
+                with next_item_duration.time(), transaction.atomic():
+                    next_item = queue.move_on(
+                        items[queue.id],
+                        timestamp=telem.get("timestamp"),
+                        previous_item_id=telem.get("previous_field"),
+                    )
+            except (DatabaseError, ValidationError) as e:
+                print(f"[Fleet telem] Failed to move machine {machine_id} on: {e}")
+                outcomes[machine_id] = "failed", {
+                    "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "message": f"Failed to move machine {machine_id} on",
+                }
+                continue
+
+            if next_item and queue.status == "active":
+                commands.append(
+                    MachineCommand(
+                        machine_id=machine_id,
+                        command="start_mowing",
+                        field_id=str(next_item.id),
+                        queue_id=str(queue.id),
+                    )
+                )
+                moved_on[machine_id] = queue, next_item
+            else:
+                outcomes[machine_id] = "progressed", {
+                    "status": status.HTTP_200_OK,
+                    "message": "No action required",
+                }
+        send_machine_commands(commands)
+
+        # The items of the queues are serialized from a single query
+        if "items" in fields:
+            prefetch_related_objects([queue for queue, _ in moved_on.values()], "items")
+    for machine_id, (queue, next_item) in moved_on.items():
+        outcomes[machine_id] = "progressed", {
+            "status": status.HTTP_200_OK,
+            "data": queue.serialize(fields),
+            "message": f"Machine {machine_id} can start mowing field {next_item.id}",
+        }
+    return outcomes
+
 
+def progress_machine_queue(
+    machine_id, queue, telem, fields=FieldQueue.SERIALIZED_FIELDS
+):
+    """Move the machine on to the next field of its queue"""
+    with transaction.atomic():
         next_item = queue.next_item(
-            timestamp=timestamp,
-            previous_item_id=previous_field_id,
+            timestamp=telem.get("timestamp"),
+            previous_item_id=telem.get("previous_field"),
         )
         queue.refresh_from_db()
 
         if next_item and queue.status == "active":
             send_machine_command(
+                machine_id,
                 command="start_mowing",
                 field_id=next_item.id,
-                queue_id=current_queue_id,
-            )
-            return Response(
-                {
-                    "data": queue.serialize(),
-                    "message": (
-                        f"Machine {machine_id} can start mowing field {next_item.id}"
-                    ),
-                }
+                queue_id=queue.id,
             )
-    return Response({"message": "No action required"})
+
+    if next_item and queue.status == "active":
+        return {
+            "data": queue.serialize(fields),
+            "message": f"Machine {machine_id} can start mowing field {next_item.id}",
+        }
+    return {"message": "No action required"}
 
 
 @api_view(["POST"])
@@ -120,31 +626,53 @@ def queue_start(request, machine_id, queue_id):
             },
             status=status.HTTP_404_NOT_FOUND,
         )
-    return start_queue(field_queue)
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
+    data, status_code = start_queue(field_queue, fields)
+    return Response(data, status=status_code, headers=applied_preferences(request))
 
-def start_queue(queue):
-    queue.update_status("active")
-    if item := queue.next_item():
-        queue.refresh_from_db()
-        send_machine_command(
-            command="start_mowing",
-            field_id=item.id,
-            queue_id=queue.id,
-        )
 
-        return Response(
-            {
-                "data": queue.serialize(),
-                "message": "Queue started",
-            }
-        )
-    return Response(
-        {
-            "message": f"No items left in queue {queue.id}",
-        },
-        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
-    )
+def active_queue_conflict(machine_id=None):
+    """Response to an activation losing to a concurrent one on the same machine"""
+    machines = f"machine {machine_id}" if machine_id else "the same machines"
+    return {
+        "message": f"Another queue was activated concurrently on {machines}.",
+    }, status.HTTP_409_CONFLICT
+
+
+def start_queue(queue, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Activate queue and dispatch the machine to its next field
+
+    The queue the machine was working on is paused.
+    """
+    try:
+        with transaction.atomic():
+            queue.update_status("active")
+            if item := queue.next_item():
+                queue.refresh_from_db()
+                send_machine_command(
+                    queue.machine_id,
+                    command="start_mowing",
+                    field_id=item.id,
+                    queue_id=queue.id,
+                )
+    except IntegrityError:
+        return active_queue_conflict(queue.machine_id)
+
+    if item:
+        return {
+            "data": queue.serialize(fields),
+            "message": "Queue started",
+        }, status.HTTP_200_OK
+    return {
+        "message": f"No items left in queue {queue.id}",
+    }, status.HTTP_422_UNPROCESSABLE_ENTITY
 
 
 @api_view(["POST"])
@@ -163,19 +691,32 @@ def queue_pause(request, machine_id, queue_id):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    queue.update_status("paused")
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    data, status_code = pause_queue(queue, fields)
+    return Response(data, status=status_code, headers=applied_preferences(request))
 
-    send_machine_command(
-        command="pause",
-        queue_id=queue_id,
-    )
 
-    return Response(
-        {
-            "data": queue.serialize(),
-            "message": "Queue paused",
-        }
-    )
+def pause_queue(queue, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Pause queue and the machine working on it"""
+    with transaction.atomic():
+        queue.update_status("paused")
+        send_machine_command(
+            queue.machine_id,
+            command="pause",
+            queue_id=queue.id,
+        )
+
+    return {
+        "data": queue.serialize(fields),
+        "message": "Queue paused",
+    }, status.HTTP_200_OK
 
 
 @api_view(["POST"])
@@ -194,22 +735,38 @@ def queue_resume(request, machine_id, queue_id):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    if queue.status == "terminated":
-        return start_queue(queue)
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    queue.update_status("active")
+    data, status_code = resume_queue(queue, fields)
+    return Response(data, status=status_code, headers=applied_preferences(request))
 
-    send_machine_command(
-        command="resume",
-        queue_id=queue_id,
-    )
 
-    return Response(
-        {
-            "data": queue.serialize(),
-            "message": "Queue resumed",
-        }
-    )
+def resume_queue(queue, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Resume paused queue, terminated queues are started again"""
+    if queue.status == "terminated":
+        return start_queue(queue, fields)
+
+    try:
+        with transaction.atomic():
+            queue.update_status("active")
+            send_machine_command(
+                queue.machine_id,
+                command="resume",
+                queue_id=queue.id,
+            )
+    except IntegrityError:
+        return active_queue_conflict(queue.machine_id)
+
+    return {
+        "data": queue.serialize(fields),
+        "message": "Queue resumed",
+    }, status.HTTP_200_OK
 
 
 @api_view(["POST"])
@@ -228,19 +785,32 @@ def queue_terminate(request, machine_id, queue_id):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    queue.update_status("terminated")
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    send_machine_command(
-        command="stop",
-        queue_id=queue_id,
-    )
+    data, status_code = terminate_queue(queue, fields)
+    return Response(data, status=status_code, headers=applied_preferences(request))
 
-    return Response(
-        {
-            "data": queue.serialize(),
-            "message": "Queue terminated",
-        }
-    )
+
+def terminate_queue(queue, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Terminate queue and stop the machine working on it"""
+    with transaction.atomic():
+        queue.update_status("terminated")
+        send_machine_command(
+            queue.machine_id,
+            command="stop",
+            queue_id=queue.id,
+        )
+
+    return {
+        "data": queue.serialize(fields),
+        "message": "Queue terminated",
+    }, status.HTTP_200_OK
 
 
 @api_view(["POST"])
@@ -262,29 +832,263 @@ def queue_skip(request, machine_id, queue_id):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    item = queue.items.filter(status="in_progress").order_by("position").first()
-    if not item:
+    try:
+        fields = requested_fields(request, mutation=True)
+    except ValidationError as e:
         return Response(
-            {"message": f"No fields can be skipped on queue {queue_id}"},
-            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    item.status = "skipped"
-    item.save()
 
-    if queue.status in ["active", "paused"]:
-        next_item = queue.next_item()
-        queue.refresh_from_db()
-        send_machine_command(
-            "update_current_field",
-            field_id=next_item.id if next_item else "",
-            queue_id=queue_id,
+    data, status_code = skip_queue_field(queue, fields)
+    return Response(data, status=status_code, headers=applied_preferences(request))
+
+
+def skip_queue_field(queue, fields=FieldQueue.SERIALIZED_FIELDS):
+    """Skip the field currently being mowed and move on to the next one"""
+    with transaction.atomic():
+        # Read under the lock taken by next_item(), the item cannot be
+        # completed, moved or skipped by another request until it is saved
+        queue = FieldQueue.objects.select_for_update().get(id=queue.id)
+        item = (
+            queue.items_since_creation.with_position()
+            .filter(status="in_progress")
+            .order_by("rank")
+            .first()
         )
-    return Response(
-        {
-            "data": queue.serialize(),
-            "message": f"Skipped field {item.id}",
-        }
-    )
+        if not item:
+            return {
+                "message": f"No fields can be skipped on queue {queue.id}",
+            }, status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        item.status = "skipped"
+        item.save(update_fields=["status"])
+        queue.bump_version()
+        publish_on_commit(queue.id, "item", item.serialize)
+        MachineDailyStats.record(
+            queue.machine_id,
+            timezone.localdate(item.started_at or timezone.now()),
+            fields_skipped=1,
+        )
+        forget_telem(queue.machine_id)
+
+        if queue.status in ["active", "paused"]:
+            next_item = queue.next_item()
+            queue.refresh_from_db()
+            send_machine_command(
+                queue.machine_id,
+                "update_current_field",
+                field_id=next_item.id if next_item else "",
+                queue_id=queue.id,
+            )
+
+    return {
+        "data": queue.serialize(fields),
+        "message": f"Skipped field {item.id}",
+    }, status.HTTP_200_OK
+
+
+@api_view(["POST"])
+def queues_control(request):
+    """Pause, resume or terminate many queues at once"""
+    try:
+        action, queues = parse_bulk_control(request.data)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        changed, commands, direct = control_queues(action, queues)
+    except IntegrityError:
+        data, status_code = active_queue_conflict()
+        return Response(data, status=status_code)
+    async_to_sync(deliver_now)(direct)
+    return Response(bulk_control_result(action, changed, commands))
+
+
+def parse_bulk_control(data):
+    """Validate a bulk control request, return its action and the queues it targets
+
+    The queues are given by id, by machine or all at once.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Expected a JSON object.")
+    if (action := data.get("action")) not in BULK_CONTROL_ACTIONS:
+        raise ValidationError(
+            f"Invalid action {action}. Expected any of"
+            f" {', '.join(BULK_CONTROL_ACTIONS)}."
+        )
+
+    selectors = [x for x in ["queue_ids", "machine_ids", "all"] if x in data]
+    if len(selectors) != 1:
+        raise ValidationError("Expected exactly one of queue_ids, machine_ids or all.")
+    if (selector := selectors[0]) == "all":
+        if data["all"] is not True:
+            raise ValidationError("Expected all to be true.")
+        return action, FieldQueue.objects.all()
+
+    ids = data[selector]
+    if not isinstance(ids, list) or len(ids) > MAX_BULK_CONTROL_SIZE:
+        raise ValidationError(
+            f"Expected {selector} to be a list of at most {MAX_BULK_CONTROL_SIZE}"
+            " ids."
+        )
+    if err_ids := [x for x in ids if not is_uuid(x)]:
+        raise ValidationError(f"Invalid {selector}: {err_ids}")
+    if selector == "queue_ids":
+        return action, FieldQueue.objects.filter(id__in=ids)
+    return action, FieldQueue.objects.filter(machine_id__in=ids)
+
+
+def control_queues(action, queues):
+    """Apply action to the queues it applies to with a single UPDATE
+
+    The machine commands are queued in bulk. Commands of machines with nothing
+    else pending and no channel open are held back from the dispatcher, to be
+    delivered right away by the caller. Returns the changed queues as
+    (id, machine id, version) and the queued commands, all of them and the
+    ones to deliver.
+
+    A machine works on one queue at a time, only the newest queue of a machine
+    is resumed and only when no other queue of the machine is active. Queues
+    activated concurrently on the same machines raise an IntegrityError.
+    """
+    statuses, new_status, command = BULK_CONTROL_ACTIONS[action]
+    queues = queues.filter(status__in=statuses)
+    if new_status == "active":
+        queues = queues.exclude(
+            machine_id__in=FieldQueue.objects.filter(status="active").values(
+                "machine_id"
+            )
+        )
+    with transaction.atomic():
+        rows = list(
+            queues.select_for_update()
+            .order_by("id")
+            .values_list("id", "machine_id", "version", "created_at")
+        )
+        if new_status == "active":
+            newest = {}
+            for row in rows:
+                if row[1] not in newest or row[3] > newest[row[1]][3]:
+                    newest[row[1]] = row
+            rows = [x for x in rows if newest[x[1]] is x]
+        changed = [
+            (queue_id, machine_id, version + 1)
+            for queue_id, machine_id, version, _ in rows
+        ]
+        if not changed:
+            return [], [], []
+
+        FieldQueue.objects.filter(id__in=[x[0] for x in changed]).update(
+            status=new_status,
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+        )
+        machine_ids = {x[1] for x in changed}
+        Machine.update_active_queues(machine_ids)
+        # Commands must reach a machine in order, older ones go first
+        busy = set(
+            MachineCommand.objects.filter(
+                machine_id__in=machine_ids, status="pending"
+            ).values_list("machine_id", flat=True)
+        )
+        connected = set(
+            Machine.objects.filter(
+                id__in=machine_ids,
+                channel_seen_at__gte=timezone.now()
+                - timedelta(seconds=settings.MACHINE_CHANNEL_TIMEOUT),
+            ).values_list("id", flat=True)
+        )
+        deferred = busy | connected
+        held_until = timezone.now() + timedelta(
+            seconds=settings.BULK_CONTROL_DELIVERY_TIMEOUT
+            + settings.MACHINE_COMMAND_CONNECT_TIMEOUT
+            + settings.MACHINE_COMMAND_READ_TIMEOUT
+        )
+        commands = send_machine_commands(
+            [
+                MachineCommand(
+                    machine_id=machine_id,
+                    command=command,
+                    queue_id=str(queue_id),
+                    next_attempt_at=(
+                        timezone.now() if machine_id in deferred else held_until
+                    ),
+                )
+                for queue_id, machine_id, _ in changed
+            ]
+        )
+        for queue_id, _, version in changed:
+            publish_on_commit(
+                queue_id,
+                "queue",
+                {"id": queue_id, "status": new_status, "version": version},
+            )
+        forget_telems(machine_ids)
+
+    machines = Machine.objects.in_bulk(machine_ids - deferred)
+    direct = []
+    for command in commands:
+        if machine := machines.get(command.machine_id):
+            command.machine = machine
+            direct.append(command)
+    direct.sort(key=lambda x: (str(x.machine_id), x.id))
+    return changed, commands, direct
+
+
+def bulk_control_result(action, changed, commands):
+    """Changed queues and the delivery of the commands to each machine
+
+    A machine is `delivered` once all its commands were, `failed` when the
+    machine rejected one or every attempt failed, `retrying` when the
+    dispatcher will try again and `queued` when the commands were left to the
+    dispatcher or to the channel of the machine.
+    """
+    _, new_status, _ = BULK_CONTROL_ACTIONS[action]
+    machines = {}
+    for command in commands:
+        machines.setdefault(command.machine_id, []).append(command)
+
+    deliveries = []
+    for machine_id, machine_commands in machines.items():
+        statuses = {x.status for x in machine_commands}
+        if "failed" in statuses:
+            delivery = "failed"
+        elif statuses == {"delivered"}:
+            delivery = "delivered"
+        elif any(x.last_error for x in machine_commands):
+            delivery = "retrying"
+        else:
+            delivery = "queued"
+        deliveries.append(
+            {
+                "machine_id": machine_id,
+                "queue_ids": [x.queue_id for x in machine_commands],
+                "delivery": delivery,
+                "error": next(
+                    (x.last_error for x in machine_commands if x.last_error), None
+                ),
+            }
+        )
+
+    return {
+        "data": {
+            "queues": [
+                {
+                    "id": queue_id,
+                    "machine_id": machine_id,
+                    "status": new_status,
+                    "version": version,
+                }
+                for queue_id, machine_id, version in changed
+            ],
+            "machines": deliveries,
+        },
+        "message": f"{new_status.capitalize()} {len(changed)} queues",
+    }
 
 
 @api_view(["GET", "POST", "DELETE"])
@@ -307,10 +1111,15 @@ def queue_items(request, machine_id, queue_id):
         )
 
     if request.method == "GET":
+        etag = quote_etag(queue.etag)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
         return Response(
             {
-                "data": [x.serialize() for x in queue.items.all()],
-            }
+                "data": serialize_items(queue.items_since_creation),
+            },
+            headers={"ETag": etag},
         )
 
     elif request.method == "POST":
@@ -323,12 +1132,24 @@ def queue_items(request, machine_id, queue_id):
             )
 
         try:
-            new_item = queue.add_item(field_id=field_id, position=position)
+            version = expected_version(request, queue)
+        except ValidationError as e:
+            return Response(
+                {"message": e.message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            new_item = queue.add_item(
+                field_id=field_id, position=position, expected_version=version
+            )
         except ValidationError as e:
             return Response(
                 {"message": str(e)},
                 status=status.HTTP_422_UNPROCESSABLE_ENTITY,
             )
+        except VersionConflict as e:
+            return version_conflict(e)
 
         return Response(
             {
@@ -336,6 +1157,7 @@ def queue_items(request, machine_id, queue_id):
                 "message": f"Field {new_item.id} added to queue",
             },
             status=status.HTTP_201_CREATED,
+            headers={"ETag": quote_etag(queue.etag)},
         )
 
     elif request.method == "DELETE":
@@ -346,45 +1168,293 @@ def queue_items(request, machine_id, queue_id):
             )
 
         try:
-            queue.remove_items(fields)
+            version = expected_version(request, queue)
+        except ValidationError as e:
+            return Response(
+                {"message": e.message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            queue.remove_items(fields, expected_version=version)
         except ValidationError as e:
             return Response(
                 {"message": str(e)},
                 status=status.HTTP_422_UNPROCESSABLE_ENTITY,
             )
+        except VersionConflict as e:
+            return version_conflict(e)
         return Response(
             {
                 "message": f"Fields deleted: {fields}",
-            }
+            },
+            headers={"ETag": quote_etag(queue.etag)},
+        )
+
+
+@api_view(["PATCH"])
+def queue_items_order(request, machine_id, queue_id):
+    """Reorder all the items of a queue at once"""
+    try:
+        queue = FieldQueue.objects.get(
+            id=queue_id,
+            machine_id=machine_id,
+        )
+    except FieldQueue.DoesNotExist:
+        return Response(
+            {
+                "message": (
+                    f"Failed to reorder fields. Queue {queue_id} does not exist on"
+                    f" machine {machine_id}."
+                )
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    if not isinstance(item_ids := request.data.get("field_ids"), list):
+        return Response(
+            {"message": "Missing fields"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        version = expected_version(request, queue)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        queue.reorder_items([str(x) for x in item_ids], expected_version=version)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    except VersionConflict as e:
+        return version_conflict(e)
+
+    return Response(
+        {
+            "data": queue.serialize_items(),
+            "message": f"Queue {queue.id} reordered",
+        },
+        headers={"ETag": quote_etag(queue.etag)},
+    )
+
+
+@api_view(["PATCH"])
+def queue_item_move(request, machine_id, queue_id, item_id):
+    """Move a field to another position of the queue"""
+    try:
+        queue = FieldQueue.objects.get(
+            id=queue_id,
+            machine_id=machine_id,
+        )
+    except FieldQueue.DoesNotExist:
+        return Response(
+            {
+                "message": (
+                    f"Failed to move field. Queue {queue_id} does not exist on"
+                    f" machine {machine_id}."
+                )
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    if not isinstance(position := request.data.get("position"), int):
+        return Response(
+            {"message": "Missing position"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
+    try:
+        version = expected_version(request, queue)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-def send_machine_command(command, field_id="", queue_id=""):
-    """Send command to machine"""
     try:
-        payload = {
-            "command": command,
-            "field_id": str(field_id),
-            "queue_id": str(queue_id),
+        item = queue.move_item(item_id, position, expected_version=version)
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    except VersionConflict as e:
+        return version_conflict(e)
+
+    return Response(
+        {
+            "data": item.serialize(),
+            "message": f"Field {item.id} moved to position {position}",
+        },
+        headers={"ETag": quote_etag(queue.etag)},
+    )
+
+
+@api_view(["GET"])
+def history_view(request):
+    """List queue items matching the filters along with the progress of their queues
+
+    The summary reports, for every queue with an item on the page, how many
+    of its items were completed, skipped or are still pending and the last
+    position the machine reached.
+    """
+    items = FieldQueueItem.objects.all()
+    params = request.query_params
+    try:
+        limit = parse_limit(params.get("limit"))
+        if machine_ids := params.get("machine_id"):
+            machine_ids = machine_ids.split(",")
+            if err_ids := [x for x in machine_ids if not is_uuid(x)]:
+                raise ValidationError(f"Invalid machine ids: {err_ids}")
+            items = items.filter(queue__machine_id__in=machine_ids)
+        if item_status := params.get("status"):
+            items = items.filter(status__in=item_status.split(","))
+        for lookup in [
+            "started_after",
+            "started_before",
+            "completed_after",
+            "completed_before",
+        ]:
+            if timestamp := parse_timestamp(params.get(lookup), lookup):
+                column, bound = lookup.split("_")
+                items = items.filter(
+                    **{f"{column}_at__{'gte' if bound == 'after' else 'lt'}": timestamp}
+                )
+        page = items
+        if cursor := params.get("cursor"):
+            created_at, item_id = decode_cursor(cursor, 2)
+            created_at = parse_timestamp(created_at, "cursor")
+            page = page.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=item_id)
+            )
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    page = list(
+        page.with_position()
+        .order_by("-created_at", "-id")
+        .values_list(*HISTORY_FIELDS)[: limit + 1]
+    )
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1][-1], page[-1][3])
+
+    # Aggregated in SQL over every item of the queues on the page, the cost of
+    # the summary is bounded by the page size
+    summary = (
+        FieldQueueItem.objects.filter(queue_id__in={x[0] for x in page})
+        .values("queue_id", "queue__machine_id", "queue__status")
+        .annotate(
+            completed=Count("id", filter=Q(status="completed")),
+            skipped=Count("id", filter=Q(status="skipped")),
+            in_progress=Count("id", filter=Q(status="in_progress")),
+            pending=Count("id", filter=Q(status="pending")),
+            # Position of the furthest item the machine got to
+            last_position=NullIf(
+                Count(
+                    "id",
+                    filter=Q(
+                        rank__lte=Subquery(
+                            FieldQueueItem.objects.filter(queue=OuterRef("queue"))
+                            .exclude(status="pending")
+                            .order_by("-rank")
+                            .values("rank")[:1]
+                        )
+                    ),
+                ),
+                0,
+            )
+            - 1,
+        )
+        .order_by("queue__machine_id", "queue_id")
+    )
+
+    return Response(
+        {
+            "data": history_rows(page),
+            "summary": [
+                {
+                    "machine_id": row["queue__machine_id"],
+                    "queue_id": row["queue_id"],
+                    "queue_status": row["queue__status"],
+                    "completed": row["completed"],
+                    "skipped": row["skipped"],
+                    "in_progress": row["in_progress"],
+                    "pending": row["pending"],
+                    "last_position": row["last_position"],
+                }
+                for row in summary
+            ],
+            "next_cursor": next_cursor,
         }
-        # Convert payload to JSON bytes
-        json_data = json.dumps(payload).encode("utf-8")
-
-        # Create request
-        url = "http://machine-simulator:5001/command"
-        req = request.Request(
-            url,
-            data=json_data,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-
-        # Send request
-        with request.urlopen(req, timeout=5) as response:
-            print(f"Sending command to machine, payload: {json_data}")
-            response_data = response.read().decode("utf-8")
-
-    except error.HTTPError as e:
-        print(f"[Unable to send machine command] HTTP Error {e.code}: {e.reason}")
-    except error.URLError as e:
-        print(f"[Unable to send machine command] URL Error: {e.reason}")
+    )
+
+
+@api_view(["GET"])
+def daily_stats_view(request):
+    """List the daily stats of the machines, for today unless a date range is given"""
+    stats = MachineDailyStats.objects.all()
+    params = request.query_params
+    try:
+        if machine_ids := params.get("machine_id"):
+            machine_ids = machine_ids.split(",")
+            if err_ids := [x for x in machine_ids if not is_uuid(x)]:
+                raise ValidationError(f"Invalid machine ids: {err_ids}")
+            stats = stats.filter(machine_id__in=machine_ids)
+        since = parse_day(params.get("from"), "from") or timezone.localdate()
+        until = parse_day(params.get("to"), "to") or since
+    except ValidationError as e:
+        return Response(
+            {"message": e.message},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    stats = stats.filter(day__gte=since, day__lte=until).order_by("day", "machine_id")
+    return Response({"data": [x.serialize() for x in stats]})
+
+
+def send_machine_command(machine_id, command, field_id="", queue_id=""):
+    """Queue command for delivery to machine
+
+    The command is written to the outbox within the current transaction and
+    delivered by the `dispatch_commands` management command, so a slow or
+    unreachable machine never holds up the request.
+    """
+    with command_queue_duration.time():
+        machine_command = MachineCommand.objects.create(
+            machine_id=machine_id,
+            command=command,
+            field_id=str(field_id),
+            queue_id=str(queue_id),
+        )
+    commands_queued.labels(command).inc()
+    if queue_id:
+        publish_on_commit(queue_id, "command", machine_command.payload())
+    publish_on_commit(machine_topic(machine_id), "command", machine_command.id)
+
+
+def send_machine_commands(commands):
+    """Queue unsaved commands for delivery in bulk, like `send_machine_command`"""
+    commands = MachineCommand.objects.bulk_create(commands)
+    for command in commands:
+        commands_queued.labels(command.command).inc()
+        if command.queue_id:
+            publish_on_commit(command.queue_id, "command", command.payload())
+        publish_on_commit(machine_topic(command.machine_id), "command", command.id)
+    return commands
+
+
+@require_GET
+def metrics_view(request):
+    """Export the metrics in the Prometheus text format"""
+    return HttpResponse(export_metrics(), content_type=CONTENT_TYPE_LATEST)
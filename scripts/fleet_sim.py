@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+
+# Simulates a whole fleet of machines in a single asyncio event loop to load
+# test the backend. Every machine reports its telemetry through the batch
+# telemetry endpoint and receives its commands on a listener shared by the
+# whole fleet, commands are routed with their `machine_id`.
+
+# Machines are created with `python manage.py seed_fleet --output fleet.txt`,
+# the backend dispatcher has to deliver to this listener
+# (MACHINE_COMMAND_URL=http://fleet-simulator:5001/command).
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import heapq
+import itertools
+import json
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def percentiles(values):
+    """p50, p95 and p99 of values in milliseconds"""
+    if len(values) < 2:
+        return [round(sum(values) * 1000, 1)] * 3
+    quantiles = statistics.quantiles(values, n=100)
+    return [round(quantiles[x - 1] * 1000, 1) for x in (50, 95, 99)]
+
+
+class Clock:
+    """Simulated time, running `scale` times faster than real time
+
+    The telemetry timestamps come from the clock, so the backend records
+    the simulated start and completion times of the fields.
+    """
+
+    # Whether the commands announced in the telemetry responses are awaited
+    awaits_commands = False
+
+    def __init__(self, scale=1, start=None):
+        self.scale = scale
+        self.start = time.time() if start is None else start
+        self._started_at = time.monotonic()
+
+    def time(self):
+        return self.start + (time.monotonic() - self._started_at) * self.scale
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds / self.scale)
+
+    def call_later(self, seconds, callback):
+        return asyncio.get_running_loop().call_later(seconds / self.scale, callback)
+
+    def expect_command(self, field_id):
+        pass
+
+    def command_received(self, field_id):
+        pass
+
+
+class VirtualTimer:
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock(Clock):
+    """Deterministic simulated time
+
+    Time moves forward by `tick` seconds once every machine sleeps, every
+    telemetry batch was answered and the commands announced by the backend
+    arrived. Runs therefore never depend on the speed of the host, and a
+    whole day of work is simulated as fast as the backend answers.
+    """
+
+    awaits_commands = True
+
+    def __init__(self, start=None, tick=1, command_timeout=5):
+        self.now = time.time() if start is None else start
+        self.tick = tick
+        self.command_timeout = command_timeout
+        self.sleeping = 0
+        self._timers = []
+        self._order = itertools.count()
+        self._expected = set()
+        self._arrived = set()
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+
+        def wake_up():
+            self.sleeping -= 1
+            future.set_result(None)
+
+        self.sleeping += 1
+        self.call_later(seconds, wake_up)
+        await future
+
+    def call_later(self, seconds, callback):
+        timer = VirtualTimer(callback)
+        heapq.heappush(self._timers, (self.now + seconds, next(self._order), timer))
+        return timer
+
+    def expect_command(self, field_id):
+        if field_id in self._arrived:
+            self._arrived.discard(field_id)
+        else:
+            self._expected.add(field_id)
+
+    def command_received(self, field_id):
+        if field_id in self._expected:
+            self._expected.discard(field_id)
+        else:
+            # The command was faster than the telemetry response
+            self._arrived.add(field_id)
+
+    async def run(self, settled, until=None):
+        """Move time forward whenever settled() is true, until `until`"""
+        waiting_since = time.monotonic()
+        while until is None or self.now < until:
+            if (
+                self._expected
+                and time.monotonic() - waiting_since > self.command_timeout
+            ):
+                print(
+                    f"[Fleet] Commands for {len(self._expected)} fields never arrived"
+                )
+                self._expected.clear()
+            if not self._timers or self._expected or not settled():
+                await asyncio.sleep(0.001)
+                continue
+
+            end = max(self._timers[0][0], self.now + self.tick)
+            while self._timers and self._timers[0][0] <= end:
+                when, _, timer = heapq.heappop(self._timers)
+                self.now = max(self.now, when)
+                if not timer.cancelled:
+                    timer.callback()
+            self.now = end
+            waiting_since = time.monotonic()
+            await asyncio.sleep(0)
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.since = time.monotonic()
+        self.telemetry_sent = 0
+        self.telemetry_failed = 0
+        self.batch_latencies = []
+        self.commands = 0
+        self.command_latencies = []
+
+    def report(self, fleet, clock):
+        elapsed = time.monotonic() - self.since
+        states = {}
+        for machine in fleet.values():
+            states[machine.state] = states.get(machine.state, 0) + 1
+        batch_p50, batch_p95, batch_p99 = percentiles(self.batch_latencies)
+        command_p50, command_p95, command_p99 = percentiles(self.command_latencies)
+        print(
+            f"[Fleet] {self.telemetry_sent / elapsed:.0f} telemetry/s"
+            f" ({self.telemetry_failed} failed), batch latency p50 {batch_p50}ms"
+            f" p95 {batch_p95}ms p99 {batch_p99}ms |"
+            f" {self.commands} commands, round-trip p50 {command_p50}ms"
+            f" p95 {command_p95}ms p99 {command_p99}ms | {states} | simulated"
+            f" time {datetime.fromtimestamp(clock.time(), timezone.utc):%Y-%m-%d %H:%M:%S}"
+        )
+        self.reset()
+
+
+class SimulatedMachine:
+    def __init__(self, fleet_sim, machine_id, queue_id):
+        self.fleet_sim = fleet_sim
+        self.machine_id = machine_id
+        self.state = "Idle"
+        self.current_queue = queue_id
+        self.current_field = None
+        self.previous_field = None
+        self.remaining = 0  # seconds of mowing left on the current field
+        self.mowing_since = None
+        self.done = None
+        # Time of the first idle report since the last field was finished
+        self.waiting_since = None
+
+    def telemetry(self):
+        if self.state == "Idle" and self.waiting_since is None:
+            self.waiting_since = time.monotonic()
+        return {
+            "machine_id": self.machine_id,
+            "state": self.state,
+            "current_queue": self.current_queue or "",
+            "current_field": self.current_field or "",
+            "previous_field": self.previous_field or "",
+            "timestamp": self.fleet_sim.clock.time(),
+        }
+
+    def handle_command(self, data):
+        """Apply a command received from the backend, False when unknown"""
+        command = data.get("command")
+
+        if command == "start_mowing":
+            self.fleet_sim.clock.command_received(data.get("field_id"))
+            if self.waiting_since is not None:
+                self.fleet_sim.stats.command_latencies.append(
+                    time.monotonic() - self.waiting_since
+                )
+            self.current_queue = data.get("queue_id")
+            self.current_field = data.get("field_id")
+            self.remaining = self.fleet_sim.job_duration()
+            self.state = "Mowing"
+            self._schedule()
+        elif command == "stop":
+            self._cancel()
+            self.state = "Idle"
+        elif command == "pause":
+            self._cancel()
+            if self.state == "Mowing":
+                self.state = "Paused"
+        elif command == "resume":
+            self.state = "Mowing" if self.current_field else "Idle"
+            if self.state == "Mowing":
+                self._schedule()
+        elif command == "update_current_field":
+            self._cancel()
+            self.current_queue = data.get("queue_id")
+            self.current_field = data.get("field_id")
+            if self.current_field and self.state in ["Mowing", "Paused"]:
+                self.remaining = self.fleet_sim.job_duration()
+                if self.state == "Mowing":
+                    self._schedule()
+            else:
+                self.state = "Idle"
+        else:
+            return False
+        return True
+
+    def _schedule(self):
+        self._cancel()
+        self.mowing_since = self.fleet_sim.clock.time()
+        self.done = self.fleet_sim.clock.call_later(self.remaining, self._finish)
+
+    def _cancel(self):
+        if self.done:
+            self.done.cancel()
+            self.done = None
+            self.remaining = max(
+                self.remaining - (self.fleet_sim.clock.time() - self.mowing_since), 0
+            )
+
+    def _finish(self):
+        self.done = None
+        self.state = "Idle"
+        self.previous_field = self.current_field
+        self.current_field = None
+        self.waiting_since = None
+
+
+class FleetSimulator:
+    def __init__(self, args, machines, clock):
+        self.args = args
+        self.clock = clock
+        self.stats = Stats()
+        self.fleet = {
+            machine_id: SimulatedMachine(self, machine_id, queue_id)
+            for machine_id, queue_id in machines
+        }
+        self.telemetry = asyncio.Queue()
+        self.in_flight = 0
+        backend = urlsplit(args.backend)
+        self.backend = (backend.hostname, backend.port or 80)
+
+    def job_duration(self):
+        """Seconds needed to mow a field"""
+        mean, jitter = self.args.job_duration, self.args.job_jitter
+        if self.args.job_distribution == "uniform":
+            return random.uniform(mean * (1 - jitter), mean * (1 + jitter))
+        if self.args.job_distribution == "normal":
+            return max(random.gauss(mean, mean * jitter), 0)
+        if self.args.job_distribution == "exponential":
+            return random.expovariate(1 / mean)
+        return mean
+
+    async def run(self):
+        server = await asyncio.start_server(
+            self.handle_connection, port=self.args.listen_port
+        )
+        print(
+            f"Fleet of {len(self.fleet)} machines, commands received on port"
+            f" {self.args.listen_port}"
+        )
+        tasks = [
+            asyncio.create_task(x)
+            for x in [
+                *(self.report_machine(machine) for machine in self.fleet.values()),
+                *(self.send_telemetry() for _ in range(self.args.senders)),
+                self.report(),
+            ]
+        ]
+        # The duration is in simulated seconds
+        async with server:
+            try:
+                if isinstance(self.clock, VirtualClock):
+                    await self.clock.run(
+                        self.settled,
+                        until=(
+                            self.clock.time() + self.args.duration
+                            if self.args.duration
+                            else None
+                        ),
+                    )
+                else:
+                    await asyncio.wait(
+                        tasks, timeout=self.args.duration / self.clock.scale or None
+                    )
+            finally:
+                for task in tasks:
+                    task.cancel()
+        self.stats.report(self.fleet, self.clock)
+
+    def settled(self):
+        """Whether every machine sleeps and all their telemetry was answered"""
+        return (
+            self.clock.sleeping == len(self.fleet)
+            and self.telemetry.empty()
+            and not self.in_flight
+        )
+
+    async def report_machine(self, machine):
+        interval, jitter = self.args.telemetry_interval, self.args.telemetry_jitter
+        # Spread the machines over the first interval
+        await self.clock.sleep(random.uniform(0, interval))
+        while True:
+            self.telemetry.put_nowait(machine.telemetry())
+            await self.clock.sleep(
+                random.uniform(interval * (1 - jitter), interval * (1 + jitter))
+            )
+
+    async def send_telemetry(self):
+        """Post the queued telemetry in batches over a keep-alive connection"""
+        conn = None
+        while True:
+            batch = [await self.telemetry.get()]
+            self.in_flight += 1
+            try:
+                conn = await self.send_batch(conn, batch)
+            finally:
+                self.in_flight -= 1
+
+    async def send_batch(self, conn, batch):
+        """Fill batch up and post it, returns the connection to use next"""
+        deadline = time.monotonic() + self.args.flush_interval
+        while len(batch) < self.args.batch_size:
+            if not self.telemetry.empty():
+                batch.append(self.telemetry.get_nowait())
+                continue
+            if (timeout := deadline - time.monotonic()) <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.telemetry.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        started_at = time.monotonic()
+        try:
+            conn = conn or await asyncio.open_connection(*self.backend)
+            status, body = await self.post(conn, {"telemetry": batch})
+        except (OSError, EOFError, ValueError) as e:
+            print(f"[Fleet] Failed to contact backend: {e}")
+            if conn:
+                conn[1].close()
+            conn, status = None, None
+            await asyncio.sleep(1)
+
+        if status == 200:
+            self.stats.telemetry_sent += len(batch)
+            self.stats.batch_latencies.append(time.monotonic() - started_at)
+            if self.clock.awaits_commands:
+                for result in json.loads(body)["data"]:
+                    if field_id := started_field(result):
+                        self.clock.expect_command(field_id)
+        else:
+            self.stats.telemetry_failed += len(batch)
+        return conn
+
+    async def post(self, conn, payload):
+        reader, writer = conn
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            (
+                "POST /api/v1/telemetry/batch HTTP/1.1\r\n"
+                f"Host: {self.backend[0]}:{self.backend[1]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "\r\n"
+            ).encode("latin-1")
+            + body
+        )
+        await writer.drain()
+
+        status = int((await reader.readuntil(b"\r\n")).split()[1])
+        headers = await self.read_headers(reader)
+        return status, await reader.readexactly(int(headers.get("content-length", 0)))
+
+    async def read_headers(self, reader):
+        headers = {}
+        while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    async def handle_connection(self, reader, writer):
+        """Commands of the whole fleet, the connection is kept alive"""
+        try:
+            while request_line := await reader.readuntil(b"\r\n"):
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = await self.read_headers(reader)
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, data = 404, {"error": "Not found"}
+                if method == "POST" and path == "/command":
+                    command = json.loads(body or b"{}")
+                    if machine := self.fleet.get(command.get("machine_id")):
+                        self.stats.commands += 1
+                        if machine.handle_command(command):
+                            status, data = 200, {
+                                "status": "success",
+                                "state": machine.state,
+                            }
+                        else:
+                            status, data = 400, {"error": "Unknown command"}
+                    else:
+                        data = {"error": "Unknown machine"}
+
+                response = json.dumps(data).encode()
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(response)}\r\n"
+                        "\r\n"
+                    ).encode("latin-1")
+                    + response
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # The fleet is shutting down with the connection still open
+            pass
+        finally:
+            writer.close()
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.args.report_interval)
+            self.stats.report(self.fleet, self.clock)
+
+
+def started_field(result):
+    """Field the backend started in a telemetry result, if any"""
+    for item in (result.get("data") or {}).get("items", []):
+        if item.get("status") == "in_progress":
+            return item.get("id")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "machines_file",
+        help="File with one `<machine_id> <queue_id>` line per machine",
+    )
+    parser.add_argument("--backend", default="http://mower-queue:8000")
+    parser.add_argument("--listen-port", type=int, default=5001)
+    parser.add_argument(
+        "--telemetry-interval",
+        type=float,
+        default=2,
+        help="Seconds between two reports of a machine",
+    )
+    parser.add_argument(
+        "--telemetry-jitter",
+        type=float,
+        default=0.1,
+        help="Relative jitter applied to the telemetry interval",
+    )
+    parser.add_argument(
+        "--job-duration",
+        type=float,
+        default=30,
+        help="Mean number of seconds needed to mow a field",
+    )
+    parser.add_argument(
+        "--job-distribution",
+        choices=["fixed", "uniform", "normal", "exponential"],
+        default="uniform",
+    )
+    parser.add_argument(
+        "--job-jitter",
+        type=float,
+        default=0.2,
+        help="Relative spread of the uniform and normal job durations",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Maximum number of reports per telemetry batch",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=0.2,
+        help="Seconds a report may wait for its batch to fill up",
+    )
+    parser.add_argument(
+        "--senders",
+        type=int,
+        default=4,
+        help="Number of concurrent telemetry connections",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=0,
+        help="Simulated seconds to run for, runs until interrupted by default",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10,
+        help="Real seconds between two reports",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1,
+        help="Run the simulated time this many times faster than real time",
+    )
+    parser.add_argument(
+        "--virtual-clock",
+        action="store_true",
+        help=(
+            "Move the simulated time forward as soon as the backend has answered"
+            " instead of waiting, runs are deterministic"
+        ),
+    )
+    parser.add_argument(
+        "--tick",
+        type=float,
+        default=1,
+        help="Simulated seconds the virtual clock moves forward at once",
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        help="Simulated time at startup (ISO 8601), defaults to now",
+    )
+    parser.add_argument("--seed", type=int, help="Seed of the random generator")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    start = args.start.timestamp() if args.start else None
+    if args.virtual_clock:
+        clock = VirtualClock(start, tick=args.tick)
+        # Batches are flushed as soon as the simulated time stops
+        args.flush_interval = 0
+    else:
+        clock = Clock(args.time_scale, start)
+
+    with open(args.machines_file) as f:
+        machines = [line.split() for line in f if line.strip()]
+    asyncio.run(FleetSimulator(args, machines, clock).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,16 @@
 # structure on incoming commands.
 
 from http.server import BaseHTTPRequestHandler, HTTPServer
+import argparse
+import base64
+from datetime import datetime
+import hashlib
+import heapq
 import logging
 import json
+import os
+import socket
+import struct
 import threading
 import time
 from urllib import request, error
@@ -19,24 +27,274 @@ logging.basicConfig(level=logging.INFO)
 # Feel free to change MACHINE_ID as needed
 # MACHINE_ID = "f2e5e2cd-7e76-4dbd-92eb-057986bff93e"
 MACHINE_ID = "051da667-809c-4694-b9cb-ac48002f3b72"
+BACKEND_HOST = "mower-queue"
+BACKEND_PORT = 8000
+JOB_DURATION = 30  # seconds needed to mow a field
+TELEMETRY_INTERVAL = 2  # seconds between two telemetry updates
+
+
+class Clock:
+    """Simulated time, running `scale` times faster than real time
+
+    The telemetry timestamps come from the clock, so the backend records
+    the simulated start and completion times of the fields.
+    """
+
+    def __init__(self, scale=1, start=None):
+        self.scale = scale
+        self.start = time.time() if start is None else start
+        self._started_at = time.monotonic()
+
+    def time(self):
+        return self.start + (time.monotonic() - self._started_at) * self.scale
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.scale)
+
+    # Only the virtual clock needs to know who takes part in the simulation
+    def join(self):
+        pass
+
+    def leave(self):
+        pass
+
+    def expect_command(self, field_id):
+        pass
+
+    def command_received(self, field_id):
+        pass
+
+
+class VirtualClock(Clock):
+    """Deterministic simulated time
+
+    Time only moves forward, straight to the next wake up, once every thread
+    taking part in the simulation sleeps and the commands announced by the
+    backend have arrived. Runs therefore never depend on the speed of the
+    host, and a whole day of work is simulated as fast as the backend
+    answers.
+    """
+
+    def __init__(self, start=None, command_timeout=5):
+        self.now = time.time() if start is None else start
+        self.command_timeout = command_timeout
+        self._cond = threading.Condition()
+        self._participants = 0
+        self._wake_ups = []
+        self._expected = set()
+        self._arrived = set()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._cond:
+            wake_at = self.now + seconds
+            heapq.heappush(self._wake_ups, wake_at)
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self.now >= wake_at)
+
+    def join(self):
+        with self._cond:
+            self._participants += 1
+
+    def leave(self):
+        with self._cond:
+            self._participants -= 1
+            self._cond.notify_all()
+
+    def expect_command(self, field_id):
+        with self._cond:
+            if field_id in self._arrived:
+                self._arrived.discard(field_id)
+            else:
+                self._expected.add(field_id)
+
+    def command_received(self, field_id):
+        with self._cond:
+            if field_id in self._expected:
+                self._expected.discard(field_id)
+                self._cond.notify_all()
+            else:
+                # The command was faster than the telemetry response
+                self._arrived.add(field_id)
+
+    def _settled(self):
+        return (
+            self._wake_ups
+            and len(self._wake_ups) >= self._participants
+            and not self._expected
+        )
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if not self._cond.wait_for(self._settled, self.command_timeout):
+                    if self._expected:
+                        print(f"Commands for fields {self._expected} never arrived")
+                        self._expected.clear()
+                    continue
+
+                self.now = heapq.heappop(self._wake_ups)
+                while self._wake_ups and self._wake_ups[0] <= self.now:
+                    heapq.heappop(self._wake_ups)
+                self._cond.notify_all()
+
+
+def started_field(response):
+    """Field the backend started in a telemetry response, if any"""
+    for item in (response.get("data") or {}).get("items", []):
+        if item.get("status") == "in_progress":
+            return item.get("id")
+
+
+class ChannelClosed(OSError):
+    pass
+
+
+class MachineChannel:
+    """Minimal WebSocket client for the machine channel of the backend
+
+    Telemetry is sent up and commands are received down the same connection,
+    so the machine does not need to listen on a port.
+    """
+
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, host, port, path):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.sock = None
+        self._send_lock = threading.Lock()
+
+    def connect(self):
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.sendall(
+            (
+                f"GET {self.path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n"
+                "\r\n"
+            ).encode()
+        )
+        response = b""
+        while b"\r\n\r\n" not in response:
+            if not (chunk := sock.recv(1024)):
+                raise ChannelClosed("Connection closed during handshake")
+            response += chunk
+        head, self._buffer = response.split(b"\r\n\r\n", 1)
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {
+            name.strip().lower(): value.strip()
+            for name, _, value in (x.partition(":") for x in header_lines)
+        }
+        accept = base64.b64encode(
+            hashlib.sha1((key + self.GUID).encode()).digest()
+        ).decode()
+        if (
+            " 101 " not in f"{status_line} "
+            or headers.get("sec-websocket-accept") != accept
+        ):
+            sock.close()
+            raise ChannelClosed(f"Handshake refused: {status_line}")
+
+        sock.settimeout(None)
+        self.sock = sock
+
+    def close(self):
+        if self.sock:
+            try:
+                self._send_frame(0x8, struct.pack("!H", 1000))
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def send_json(self, data):
+        self._send_frame(0x1, json.dumps(data).encode("utf-8"))
+
+    def recv_json(self):
+        """Wait for the next message, control frames are handled on the way"""
+        while True:
+            opcode, payload = self._recv_frame()
+            if opcode == 0x1:
+                return json.loads(payload.decode("utf-8"))
+            if opcode == 0x8:
+                self.close()
+                raise ChannelClosed("Channel closed by the backend")
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+
+    def _send_frame(self, opcode, payload):
+        # Frames sent by a client are always masked
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        masked = bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
+        with self._send_lock:
+            if not self.sock:
+                raise ChannelClosed("Channel is not connected")
+            self.sock.sendall(header + mask + masked)
+
+    def _recv_exactly(self, size):
+        while len(self._buffer) < size:
+            if not (chunk := self.sock.recv(65536)):
+                raise ChannelClosed("Connection closed by the backend")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _recv_frame(self):
+        message = b""
+        while True:
+            first, second = self._recv_exactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", self._recv_exactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", self._recv_exactly(8))
+            payload = self._recv_exactly(length)
+            if opcode >= 0x8:
+                # Control frames may come in between the fragments of a message
+                return opcode, payload
+            message += payload
+            if first & 0x80:
+                return opcode or 0x1, message
 
 
 class MachineSimulator:
-    def __init__(self, machine_id):
+    def __init__(self, machine_id, channel=None, clock=None):
         self.machine_id = machine_id
+        self.channel = channel
+        self.clock = clock or Clock()
         self.state = "Idle"
         self.current_queue = None
         self.current_field = None
         self.previous_field = None
         self.current_eta = 0  # time in seconds until complete
         # start update thread
+        self.clock.join()
         threading.Thread(target=self._post_update).start()
+        if channel:
+            threading.Thread(target=self._read_commands).start()
 
     def start_mowing(self, field_id, queue_id):
         self.state = "Mowing"
         self.current_queue = queue_id
         self.current_field = field_id
-        self.current_eta = 30  # seconds job will take
+        self.current_eta = JOB_DURATION  # seconds job will take
+        self.clock.join()
         threading.Thread(
             target=self._simulate_mowing,
             args=(
@@ -50,13 +308,19 @@ class MachineSimulator:
         self.current_eta = 0  # time in seconds until complete
 
     def _simulate_mowing(self, field_id, queue_id):
+        try:
+            self._mow(field_id, queue_id)
+        finally:
+            self.clock.leave()
+
+    def _mow(self, field_id, queue_id):
         while True:
             if self.state == "Paused":
                 print(
                     f"Machine {self.machine_id} paused mowing field {field_id} on queue"
                     f" {queue_id}, ETA: {self.current_eta}"
                 )
-                time.sleep(1)
+                self.clock.sleep(1)
                 continue
             elif self.state == "Idle":
                 print("Machine moving to Idle")
@@ -79,7 +343,7 @@ class MachineSimulator:
                     self.current_field = None
                     break
                 else:
-                    time.sleep(1)
+                    self.clock.sleep(1)
                     continue
 
     def pause(self):
@@ -92,10 +356,29 @@ class MachineSimulator:
         self.current_queue = queue_id
         self.current_field = field_id
         if field_id and self.state in ["Mowing", "Paused"]:
-            self.current_eta = 30
+            self.current_eta = JOB_DURATION
         else:
             self.current_eta = 0
 
+    def handle_command(self, data):
+        """Apply a command received from the backend, False when unknown"""
+        command = data.get("command")
+
+        if command == "start_mowing":
+            self.start_mowing(data.get("field_id"), data.get("queue_id"))
+            self.clock.command_received(data.get("field_id"))
+        elif command == "stop":
+            self.stop_mowing()
+        elif command == "pause":
+            self.pause()
+        elif command == "resume":
+            self.resume()
+        elif command == "update_current_field":
+            self.update_current_field(data.get("field_id"), data.get("queue_id"))
+        else:
+            return False
+        return True
+
     def get_status(self):
         return {
             "machine_id": self.machine_id,
@@ -107,7 +390,7 @@ class MachineSimulator:
 
     def _post_update(self):
         while True:
-            time.sleep(2)
+            self.clock.sleep(TELEMETRY_INTERVAL)
 
             try:
                 payload = {
@@ -115,16 +398,20 @@ class MachineSimulator:
                     "current_queue": self.current_queue or "",
                     "current_field": self.current_field or "",
                     "previous_field": self.previous_field or "",
-                    "timestamp": time.time(),
+                    "timestamp": self.clock.time(),
                 }
 
+                if self.channel:
+                    self._send_channel_update(payload)
+                    continue
+
                 # Convert payload to JSON bytes
                 json_data = json.dumps(payload).encode("utf-8")
 
                 # Create request
                 url = (
-                    f"http://mower-queue:8000/api/v1/machines/{self.machine_id}/"
-                    "incoming_machine_telem"
+                    f"http://{BACKEND_HOST}:{BACKEND_PORT}/api/v1/machines/"
+                    f"{self.machine_id}/incoming_machine_telem"
                 )
                 req = request.Request(
                     url,
@@ -136,8 +423,9 @@ class MachineSimulator:
                 # Send request
                 with request.urlopen(req, timeout=5) as response:
                     print(f"Update telem to backend, payload: {json_data}")
-                    response_data = response.read().decode("utf-8")
-                    # self.current_field = response_data.get("field_id")
+                    response_data = json.loads(response.read().decode("utf-8"))
+                    if field_id := started_field(response_data):
+                        self.clock.expect_command(field_id)
 
             except error.HTTPError as e:
                 print(f"[Machine {self.machine_id}] HTTP Error {e.code}: {e.reason}")
@@ -146,19 +434,52 @@ class MachineSimulator:
             except Exception as e:
                 print(f"[Machine {self.machine_id}] Failed to contact backend: {e}")
 
+    def _send_channel_update(self, payload):
+        try:
+            self.channel.send_json({"type": "telemetry", **payload})
+            print(f"Update telem to backend over channel, payload: {payload}")
+        except OSError as e:
+            # The reading thread reconnects
+            print(f"[Machine {self.machine_id}] Channel unavailable: {e}")
 
-machine = MachineSimulator(machine_id=MACHINE_ID)
+    def _read_commands(self):
+        while True:
+            try:
+                if not self.channel.sock:
+                    self.channel.connect()
+                    print(f"[Machine {self.machine_id}] Channel connected")
+                message = self.channel.recv_json()
+            except (OSError, ValueError) as e:
+                print(f"[Machine {self.machine_id}] Channel error: {e}")
+                self.channel.close()
+                time.sleep(2)
+                continue
+
+            if message.get("type") == "command":
+                print(f"[Machine {self.machine_id}] Command received: {message}")
+                if not self.handle_command(message):
+                    print(f"[Machine {self.machine_id}] Unknown command: {message}")
+            elif message.get("type") == "error":
+                print(f"[Machine {self.machine_id}] Backend error: {message}")
+
+
+machine = None
 
 
 class MachineRequestHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200):
+    # Keep connections open so the backend can reuse them for further commands
+    protocol_version = "HTTP/1.1"
+
+    def _set_headers(self, status=200, content_length=0):
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(content_length))
         self.end_headers()
 
     def _send_json(self, data, status=200):
-        self._set_headers(status)
-        self.wfile.write(json.dumps(data).encode())
+        body = json.dumps(data).encode()
+        self._set_headers(status, content_length=len(body))
+        self.wfile.write(body)
 
     def do_GET(self):
         if self.path == "/status":
@@ -172,32 +493,8 @@ class MachineRequestHandler(BaseHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode())
 
-            command = data.get("command")
-
-            if command == "start_mowing":
-                field_id = data.get("field_id")
-                queue_id = data.get("queue_id")
-                machine.start_mowing(field_id, queue_id)
-                self._send_json({"status": "success", "state": machine.state})
-
-            elif command == "stop":
-                machine.stop_mowing()
+            if machine.handle_command(data):
                 self._send_json({"status": "success", "state": machine.state})
-
-            elif command == "pause":
-                machine.pause()
-                self._send_json({"status": "success", "state": machine.state})
-
-            elif command == "resume":
-                machine.resume()
-                self._send_json({"status": "success", "state": machine.state})
-
-            elif command == "update_current_field":
-                field_id = data.get("field_id")
-                queue_id = data.get("queue_id")
-                machine.update_current_field(field_id, queue_id)
-                self._send_json({"status": "success", "state": machine.state})
-
             else:
                 self._send_json({"error": "Unknown command"}, 400)
         else:
@@ -215,4 +512,51 @@ def run_server(port=5001):
 
 
 if __name__ == "__main__":
-    run_server(port=5001)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--channel",
+        action="store_true",
+        help=(
+            "Exchange telemetry and commands with the backend over a WebSocket"
+            " channel instead of listening for commands on port 5001"
+        ),
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1,
+        help="Run the simulated time this many times faster than real time",
+    )
+    parser.add_argument(
+        "--virtual-clock",
+        action="store_true",
+        help=(
+            "Move the simulated time forward as soon as the backend has answered"
+            " instead of waiting, runs are deterministic"
+        ),
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        help="Simulated time at startup (ISO 8601), defaults to now",
+    )
+    args = parser.parse_args()
+    if args.virtual_clock and args.channel:
+        # Commands sent over the channel are not announced to the machine
+        parser.error("--virtual-clock cannot be used with --channel")
+
+    start = args.start.timestamp() if args.start else None
+    clock = VirtualClock(start) if args.virtual_clock else Clock(args.time_scale, start)
+    if args.channel:
+        machine = MachineSimulator(
+            machine_id=MACHINE_ID,
+            channel=MachineChannel(
+                BACKEND_HOST,
+                BACKEND_PORT,
+                f"/api/v1/machines/{MACHINE_ID}/channel",
+            ),
+            clock=clock,
+        )
+    else:
+        machine = MachineSimulator(machine_id=MACHINE_ID, clock=clock)
+        run_server(port=5001)